@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+"""
+Allocations done while reading a response body with read(),
+readinto() and iter_into(). Requests are dispatched in-process to a
+WSGI application so no socket is involved.
+
+Requires the tracemalloc module (pytracemalloc on Python 2.7).
+"""
+
+import sys
+
+try:
+    import tracemalloc
+except ImportError:
+    sys.exit("tracemalloc is required to run this benchmark")
+
+from restkit import Client
+from restkit.contrib.wsgi_transport import WSGITransport
+
+BODY_SIZE = 64 * 1024 * 1024
+BLOCK = "x" * (1024 * 1024)
+
+
+def app(environ, start_response):
+    start_response('200 OK', [('Content-Length', str(BODY_SIZE))])
+    return (BLOCK for i in range(BODY_SIZE // len(BLOCK)))
+
+client = Client(transport=WSGITransport(app))
+
+
+def read(body):
+    while body.read(16384):
+        pass
+
+def readinto(body):
+    buf = bytearray(16384)
+    while body.readinto(buf):
+        pass
+
+def iter_into(body):
+    for chunk in body.iter_into():
+        pass
+
+
+def measure(consume):
+    r = client.request("http://localhost/")
+    body = r.body_stream()
+    tracemalloc.start()
+    try:
+        consume(body)
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    stats = snapshot.statistics('filename')
+    restkit_stats = [s for s in stats if 'restkit' in \
+            s.traceback[0].filename]
+    print("%-10s peak: %8d bytes, restkit blocks alive: %d" % (
+        consume.__name__, peak, sum(s.count for s in restkit_stats)))
+
+if __name__ == "__main__":
+    for consume in (read, readinto, iter_into):
+        measure(consume)
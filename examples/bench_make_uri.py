@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+"""
+Time spent building urls with restkit.util, compared with the previous
+implementation using urllib.quote for each segment and parameter.
+"""
+
+import timeit
+import urllib
+
+from restkit import util
+
+BASE = "http://127.0.0.1:5984/db"
+PARAMS = {"startkey": '"abc"', "limit": 10, "include_docs": "true",
+        "stale": "ok"}
+IDS = ["doc-%06d" % i for i in range(10000)]
+
+
+# previous implementation
+def old_url_quote(s, charset='utf-8', safe='/:'):
+    if isinstance(s, unicode):
+        s = s.encode(charset)
+    elif not isinstance(s, str):
+        s = str(s)
+    return urllib.quote(s, safe=safe)
+
+def old_url_encode(obj, charset="utf8", encode_keys=False):
+    tmp = []
+    for k, v in obj.items():
+        if encode_keys:
+            k = util.encode(k, charset)
+        if not isinstance(v, (tuple, list)):
+            v = [v]
+        for v1 in v:
+            if v1 is None:
+                v1 = ''
+            elif callable(v1):
+                v1 = util.encode(v1(), charset)
+            else:
+                v1 = util.encode(v1, charset)
+            tmp.append('%s=%s' % (urllib.quote(k), urllib.quote_plus(v1)))
+    return '&'.join(tmp)
+
+def old_make_uri(base, *args, **kwargs):
+    charset = kwargs.pop("charset", "utf-8")
+    safe = kwargs.pop("safe", "/:")
+    encode_keys = kwargs.pop("encode_keys", True)
+    base_trailing_slash = False
+    if base and base.endswith("/"):
+        base_trailing_slash = True
+        base = base[:-1]
+    retval = [base]
+    _path = []
+    trailing_slash = False
+    for s in args:
+        if s is not None and isinstance(s, basestring):
+            trailing_slash = len(s) > 1 and s.endswith('/')
+            _path.append(old_url_quote(s.strip('/'), charset, safe))
+    path_str = ""
+    if _path:
+        path_str = "/".join([''] + _path)
+        if trailing_slash:
+            path_str = path_str + "/"
+    elif base_trailing_slash:
+        path_str = path_str + "/"
+    if path_str:
+        retval.append(path_str)
+    params_str = old_url_encode(kwargs, charset, encode_keys)
+    if params_str:
+        retval.extend(['?', params_str])
+    return ''.join(retval)
+
+
+def bench(name, old, new, number):
+    t_old = min(timeit.repeat(old, number=number, repeat=3))
+    t_new = min(timeit.repeat(new, number=number, repeat=3))
+    print("%-24s old: %7.2f us  new: %7.2f us  (x%.1f)" % (name,
+        t_old / number * 1e6, t_new / number * 1e6, t_old / t_new))
+
+if __name__ == "__main__":
+    assert old_make_uri(BASE, "_design/app", "_view", "by_date",
+            **PARAMS) == util.make_uri(BASE, "_design/app", "_view",
+                    "by_date", **PARAMS)
+    assert [old_make_uri(BASE, i) for i in IDS] == util.make_uris(BASE, IDS)
+
+    bench("url_quote", lambda: old_url_quote(u"by date", "utf-8", "/:"),
+            lambda: util.url_quote(u"by date", "utf-8", "/:"), 100000)
+    bench("url_encode", lambda: old_url_encode(PARAMS, "utf-8", True),
+            lambda: util.url_encode(PARAMS, "utf-8", True), 100000)
+    bench("make_uri", lambda: old_make_uri(BASE, "_design/app", "_view",
+                "by_date", **PARAMS),
+            lambda: util.make_uri(BASE, "_design/app", "_view", "by_date",
+                **PARAMS), 50000)
+    bench("make_uris (10000 ids)", lambda: [old_make_uri(BASE, i) for i in IDS],
+            lambda: util.make_uris(BASE, IDS), 20)
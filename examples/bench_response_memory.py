@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+"""
+Memory used per response while many streaming responses are kept open.
+Requests are dispatched in-process to a WSGI application so no socket
+is involved. The memory reported includes the parser of each response.
+
+Requires the tracemalloc module (pytracemalloc on Python 2.7).
+"""
+
+import sys
+
+try:
+    import tracemalloc
+except ImportError:
+    sys.exit("tracemalloc is required to run this benchmark")
+
+from restkit import Client
+from restkit.contrib.wsgi_transport import WSGITransport
+
+RESPONSES = 5000
+
+
+def app(environ, start_response):
+    start_response('200 OK', [
+        ('Content-Type', 'application/json'),
+        ('Content-Length', '2'),
+        ('Set-Cookie', 'session=abc; Path=/'),
+        ('ETag', '"1-abc"')])
+    return ["{}"]
+
+client = Client(transport=WSGITransport(app))
+
+
+def measure(touch=False):
+    responses = []
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        for i in range(RESPONSES):
+            r = client.request("http://localhost/", "POST", body="x" * 1024)
+            if touch:
+                r.headerslist
+                r.cookies
+            responses.append(r)
+        current = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    print("%-30s %6d bytes per response" % (
+        touch and "headerslist and cookies used" or "headers only",
+        (current - start) // RESPONSES))
+    for r in responses:
+        r.skip_body()
+
+if __name__ == "__main__":
+    measure()
+    measure(touch=True)
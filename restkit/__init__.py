@@ -14,6 +14,7 @@ ResourceError, ResourceGone
     from restkit.wrappers import Request, Response, ClientResponse
     from restkit.resource import Resource
     from restkit.filters import BasicAuth, OAuthFilter
+    from restkit.datastructures import LRUCache
 except ImportError:
     import traceback
     traceback.print_exc()
@@ -47,6 +48,37 @@ def set_logging(level, handler=None):
     logger.addHandler(handler)
 
 
+# clients used by `request`, by options
+_clients = LRUCache(32)
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted([(k, _freeze(v)) for k, v in value.items()]))
+    elif isinstance(value, (list, tuple)):
+        return tuple([_freeze(v) for v in value])
+    return value
+
+def _get_client(credentials, options):
+    """ return the client for `options`, created on first use. The client
+    of a request with credentials has a BasicAuth filter appended. """
+    try:
+        key = (credentials, _freeze(options))
+        hash(key)
+    except TypeError:
+        # an option can't be hashed, don't cache the client
+        key = None
+
+    client = key is not None and _clients.get(key) or None
+    if client is None:
+        if credentials is not None:
+            options = options.copy()
+            options['filters'] = list(options.get('filters') or []) + \
+                    [BasicAuth(*credentials)]
+        client = Client(**options)
+        if key is not None:
+            _clients.set(key, client)
+    return client
+
 def request(url, method='GET', body=None, headers=None, **kwargs):
     """Quick shortcut method to pass a request
 
@@ -82,19 +114,19 @@ def request(url, method='GET', body=None, headers=None, **kwargs):
     - **wait_tries**: number of time we wait between each tries.
     - **ssl_args**: ssl named arguments, See
       http://docs.python.org/library/ssl.html informations
+
+    Clients are reused by the calls with the same parameters, so they
+    share their filters and their pool.
     """
 
     # detect credentials from url
     u = urlparse.urlparse(url)
+    credentials = None
     if u.username is not None:
-        password = u.password or ""
-        filters = kwargs.get('filters') or []
+        credentials = (u.username, u.password or "")
         url = urlparse.urlunparse((u.scheme, u.netloc.split("@")[-1],
             u.path, u.params, u.query, u.fragment))
-        filters.append(BasicAuth(u.username, password))
-
-        kwargs['filters'] = filters
 
-    http_client = Client(**kwargs)
+    http_client = _get_client(credentials, kwargs)
     return http_client.request(url, method=method, body=body,
             headers=headers)
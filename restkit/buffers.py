@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+"""
+restkit.buffers
+~~~~~~~~~~~~~~~
+
+Pool of recycled bytearrays used to read response bodies without
+allocating a new string for each chunk.
+"""
+
+from restkit.conn import CHUNK_SIZE
+
+# maximum size of the blocks read by readall
+MAX_BLOCK_SIZE = 1024 * 1024
+
+
+class BufferPool(object):
+    """ a pool of bytearrays of `size` bytes. At most `max_buffers`
+    released buffers are kept for reuse. """
+
+    def __init__(self, size=CHUNK_SIZE, max_buffers=64):
+        self.size = size
+        self.max_buffers = max_buffers
+        self._buffers = []
+
+    def get(self):
+        """ return a buffer from the pool or a new one """
+        try:
+            return self._buffers.pop()
+        except IndexError:
+            return bytearray(self.size)
+
+    def put(self, buf):
+        """ give back a buffer obtained with `get` """
+        if len(buf) == self.size and len(self._buffers) < self.max_buffers:
+            self._buffers.append(buf)
+
+    def __len__(self):
+        return len(self._buffers)
+
+# buffers shared by all connections
+buffer_pool = BufferPool()
+
+
+def iter_into(readinto, buf=None):
+    """ iterate over data read with the `readinto` function into `buf`
+    and yield memoryviews of the data read. A buffer from `buffer_pool`
+    is used when `buf` is None. """
+    pooled = buf is None
+    if pooled:
+        buf = buffer_pool.get()
+    view = memoryview(buf)
+    try:
+        while True:
+            n = readinto(view)
+            if not n:
+                break
+            yield view[:n]
+    finally:
+        if pooled:
+            buffer_pool.put(buf)
+
+
+def readall(f, length=None, size_hint=None):
+    """ read the file-like object `f` until EOF.
+
+    If `length`, the exact size of the data, is known, the data is read
+    in a single string allocated once by the reader, without
+    accumulating chunks. Otherwise data is read by blocks of `size_hint`
+    bytes, at most `MAX_BLOCK_SIZE`, joined once at the end. """
+    if length is not None:
+        data = f.read(length)
+        if len(data) == length:
+            # reach EOF, the stream may be longer than announced
+            rest = f.read()
+            if rest:
+                data += rest
+        return data
+
+    size = min(max(size_hint or 0, CHUNK_SIZE), MAX_BLOCK_SIZE)
+    chunks = []
+    while True:
+        data = f.read(size)
+        if not data:
+            break
+        chunks.append(data)
+    if len(chunks) == 1:
+        return chunks[0]
+    return "".join(chunks)
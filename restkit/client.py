@@ -4,6 +4,7 @@
 # See the NOTICE for more information.
 import base64
 import errno
+import io
 import logging
 import os
 import time
@@ -17,7 +18,7 @@ try:
     from http_parser.http import (
             HttpStream, BadStatusLine, NoMoreData
     )
-    from http_parser.reader import SocketReader
+    from http_parser.reader import HttpBodyReader, SocketReader
 except ImportError:
     raise ImportError("""http-parser isn't installed or out of data.
 
@@ -25,11 +26,16 @@ except ImportError:
 
 from restkit import __version__
 
+from restkit.compression import ACCEPT_ENCODING, decode_body
 from restkit.conn import Connection
+from restkit import download
 from restkit.errors import RequestError, RequestTimeout, RedirectLimit, \
 ProxyError
+from restkit.forms import MultipartForm
 from restkit.session import get_session
-from restkit.util import parse_netloc, rewrite_location, to_bytestring
+from restkit.timings import RequestTimings, now
+from restkit.util import BUFFER_TYPES, buffer_length, parse_netloc, \
+rewrite_location, to_bytestring
 from restkit.wrappers import Request, Response
 
 MAX_CLIENT_TIMEOUT=300
@@ -37,6 +43,10 @@ MAX_CLIENT_CONNECTIONS = 5
 MAX_CLIENT_TRIES =3
 CLIENT_WAIT_TRIES = 0.3
 MAX_FOLLOW_REDIRECTS = 5
+EVENTS = ('connection', 'headers_sent', 'body_sent', 'first_byte',
+        'released', 'retry', 'redirect',)
+# events needing the request to be sent and read phase by phase
+PHASE_EVENTS = ('headers_sent', 'body_sent', 'first_byte',)
 USER_AGENT = "restkit/%s" % __version__
 
 log = logging.getLogger(__name__)
@@ -79,6 +89,12 @@ class Client(object):
             wait_tries=0.3,
             pool_size=10,
             backend="thread",
+            record_timings=False,
+            unix_socket=None,
+            transport=None,
+            compress=False,
+            compress_level=6,
+            compress_min_size=1024,
             **ssl_args):
         """
         Client parameters
@@ -87,7 +103,12 @@ class Client(object):
         - follow_redirect: follow redirection, by default False
         - max_ollow_redirect: number of redirections available
         - filters: http filters to pass
-        - decompress: allows the client to decompress the response body
+        - decompress: allows the client to decompress the response body.
+          When true, compressions supported (gzip, deflate and br or zstd
+          if their modules are installed) are advertised in the
+          Accept-Encoding header unless it's set, and the body is
+          decoded while it's read. When false, the body is returned as
+          sent by the server.
         - max_status_line_garbage: defines the maximum number of ignorable
           lines before we expect a HTTP response's status line. With HTTP/1.1
           persistent connections, the problem arises that broken scripts could
@@ -107,6 +128,25 @@ class Client(object):
         - wait_tries: number of time we wait between each tries.
         - pool_size: int, default 10. Maximum number of connections we keep in
           the default pool.
+        - record_timings: boolean, default False. If True, the timestamps of
+          each phase of a request are recorded and available in the
+          `timings` attribute of the response.
+        - unix_socket: path of a unix socket. If set all requests are sent
+          to the server listening on it, whatever the host of the url.
+          Urls using the http+unix scheme, with the percent-encoded path
+          of the socket as host (http+unix://%2Fvar%2Frun%2Fapp.sock/path),
+          are always sent to their socket.
+        - transport: object performing the requests instead of sending them
+          over a socket. It must provide a `perform(client, request)`
+          method, see `restkit.contrib.wsgi_transport.WSGITransport`.
+        - compress: boolean, default False. If True, request bodies are
+          compressed with gzip while they are sent, see
+          `restkit.wrappers.Request.compress_body`. It can be changed per
+          request with the `compress` argument of `request`.
+        - compress_level: int, default 6. gzip compression level of
+          request bodies.
+        - compress_min_size: int, default 1024. Bodies smaller than this
+          size aren't compressed. Bodies of unknown size always are.
         - ssl_args: named argument, see ssl module for more informations
         """
         self.follow_redirect = follow_redirect
@@ -117,11 +157,20 @@ class Client(object):
         self.max_status_line_garbage = max_status_line_garbage
         self.max_header_count = max_header_count
         self.use_proxy = use_proxy
+        self.record_timings = record_timings
+        self.unix_socket = unix_socket
+        self.transport = transport
+        self.compress = compress
+        self.compress_level = compress_level
+        self.compress_min_size = compress_min_size
 
         self.request_filters = []
         self.response_filters = []
         self.load_filters()
 
+        # event listeners, see add_listener
+        self._listeners = {}
+
 
         # set manager
 
@@ -146,7 +195,6 @@ class Client(object):
         self.pool_size = pool_size
         self.timeout = timeout
 
-        self._nb_redirections = self.max_follow_redirect
         self._url = None
         self._initial_url = None
         self._write_cb = None
@@ -169,26 +217,99 @@ class Client(object):
             if hasattr(f, "on_response"):
                 self.response_filters.append(f)
 
-
+    def add_listener(self, event, listener):
+        """ register a listener for a request lifecycle event.
+
+        Events are:
+
+        - connection: a connection has been acquired from the pool or
+          created. Extra arguments: conn, reused
+        - headers_sent: the request headers have been sent. Extra
+          arguments: conn
+        - body_sent: the request body has been sent. Extra arguments: conn
+        - first_byte: the first byte of the response has been received
+        - released: the response body has been fully read and the
+          connection released. Extra arguments: response, redirected
+          (True for the responses dropped while following redirections)
+        - retry: the request is going to be retried. Extra arguments:
+          tries
+        - redirect: the request is going to be redirected. Extra
+          arguments: location
+
+        A listener is called with the event name, the request and the
+        extra arguments as keywords: ``listener(event, request, **extra)``.
+        Nothing is dispatched while no listener is registered.
+        """
+        if event not in EVENTS:
+            raise ValueError("unknown event: %r" % event)
+        self._listeners.setdefault(event, []).append(listener)
+
+    def remove_listener(self, event, listener):
+        """ unregister a listener added with add_listener """
+        listeners = self._listeners.get(event, [])
+        if listener in listeners:
+            listeners.remove(listener)
+        if not listeners:
+            self._listeners.pop(event, None)
+
+    def _emit(self, event, request, **extra):
+        for listener in self._listeners.get(event, ()):
+            listener(event, request, **extra)
+
+    def _traced(self, request):
+        """ return True if the phases of the request are recorded or
+        listened to """
+        if request.timings is not None:
+            return True
+        listeners = self._listeners
+        for event in PHASE_EVENTS:
+            if event in listeners:
+                return True
+        return False
+
+    def _phase(self, request, phase, conn):
+        """ record a phase in request timings and dispatch it """
+        if request.timings is not None:
+            setattr(request.timings, phase, now())
+        if phase in self._listeners:
+            self._emit(phase, request, conn=conn)
+
+    def _first_byte(self, request):
+        if request.timings is not None:
+            request.timings.mark_first_byte()
+        if 'first_byte' in self._listeners:
+            self._emit('first_byte', request)
 
     def get_connection(self, request):
         """ get a connection from the pool or create new one. """
 
-        addr = parse_netloc(request.parsed_url)
+        if self.unix_socket is not None:
+            addr = (self.unix_socket, None)
+        else:
+            addr = request.parsed_url.address
         is_ssl = request.is_ssl()
 
+        timings = request.timings
+        if timings is not None:
+            timings.checkout_start = now()
+
         extra_headers = []
         conn = None
-        if self.use_proxy:
+        if self.use_proxy and addr[1] is not None:
             conn = self.proxy_connection(request,
                     addr, is_ssl)
         if not conn:
             conn = self._pool.get(host=addr[0], port=addr[1],
                     pool=self._pool, is_ssl=is_ssl,
-                    timeout=self.timeout,
+                    timeout=self.timeout, timings=timings is not None,
                     extra_headers=extra_headers, **self.ssl_args)
 
-
+        if timings is not None:
+            timings.set_connection(conn)
+        if self._listeners:
+            self._emit('connection', request, conn=conn,
+                    reused=conn.nb_requests > 0)
+        conn.nb_requests += 1
         return conn
 
     def proxy_connection(self, request, req_addr, is_ssl):
@@ -217,6 +338,7 @@ class Client(object):
                 conn = self._pool.get(host=addr[0], port=addr[1],
                     pool=self._pool, is_ssl=is_ssl,
                     timeout=self.timeout,
+                    timings=request.timings is not None,
                     extra_headers=[], proxy_pieces=proxy_pieces, **self.ssl_args)
             else:
                 headers = []
@@ -226,11 +348,18 @@ class Client(object):
                 conn = self._pool.get(host=addr[0], port=addr[1],
                         pool=self._pool, is_ssl=False,
                         timeout=self.timeout,
+                        timings=request.timings is not None,
                         extra_headers=[], **self.ssl_args)
             return conn
 
         return
 
+    def default_accept_encoding(self):
+        """ value of the Accept-Encoding header when it isn't set """
+        if self.decompress:
+            return ACCEPT_ENCODING
+        return 'identity'
+
     def make_headers_string(self, request, extra_headers=None):
         """ create final header string """
         headers = request.headers.copy()
@@ -253,7 +382,7 @@ class Client(object):
 
         accept_encoding = headers.iget('accept-encoding')
         if not accept_encoding:
-            accept_encoding = 'identity'
+            accept_encoding = self.default_accept_encoding()
 
         if request.is_proxied:
             full_path = ("https://" if request.is_ssl() else "http://") + request.host + request.path
@@ -281,9 +410,14 @@ class Client(object):
         if log.isEnabledFor(logging.DEBUG):
             log.debug("Start to perform request: %s %s %s" %
                     (request.host, request.method, request.path))
+
+        if self.transport is not None:
+            return self.transport.perform(self, request)
+
         tries = 0
         while True:
             conn = None
+            traced = self._traced(request)
             try:
                 # get or create a connection to the remote host
                 conn = self.get_connection(request)
@@ -291,6 +425,7 @@ class Client(object):
                 # send headers
                 msg = self.make_headers_string(request,
                         conn.extra_headers)
+                body_start = conn.bytes_sent + len(msg)
 
                 # send body
                 if request.body is not None:
@@ -309,6 +444,8 @@ class Client(object):
                             hdr_expect.lower() == "100-continue":
                         conn.send(msg)
                         msg = None
+                        if traced:
+                            self._phase(request, 'headers_sent', conn)
                         p = HttpStream(SocketReader(conn.socket()), kind=1,
                                 decompress=True)
 
@@ -325,25 +462,47 @@ class Client(object):
 
 
                     if isinstance(request.body, types.StringTypes):
-                        if msg is not None:
-                            conn.send(msg + to_bytestring(request.body),
-                                    chunked)
+                        body = to_bytestring(request.body)
+                        if msg is not None and not (chunked or traced):
+                            # headers and body in a single write
+                            conn.send(msg + body)
                         else:
-                            conn.send(to_bytestring(request.body), chunked)
+                            if msg is not None:
+                                conn.send(msg)
+                                if traced:
+                                    self._phase(request, 'headers_sent',
+                                            conn)
+                            conn.send(body, chunked)
                     else:
                         if msg is not None:
                             conn.send(msg)
-
-                        if hasattr(request.body, 'read'):
+                            if traced:
+                                self._phase(request, 'headers_sent', conn)
+
+                        if isinstance(request.body, BUFFER_TYPES):
+                            # an empty chunk would end the body
+                            if buffer_length(request.body) or not chunked:
+                                conn.send(request.body, chunked)
+                        elif hasattr(request.body, 'read'):
                             if hasattr(request.body, 'seek'):
                                 request.body.seek(0)
                             conn.sendfile(request.body, chunked)
+                        elif isinstance(request.body, MultipartForm):
+                            request.body.send(conn, chunked)
                         else:
                             conn.sendlines(request.body, chunked)
                     if chunked:
                         conn.send_chunk("")
+                    if request.timings is not None:
+                        request.timings.bytes_sent = conn.bytes_sent - \
+                                body_start
+                    if traced:
+                        self._phase(request, 'body_sent', conn)
                 else:
                     conn.send(msg)
+                    if traced:
+                        self._phase(request, 'headers_sent', conn)
+                        self._phase(request, 'body_sent', conn)
 
                 return self.get_response(request, conn)
             except socket.gaierror, e:
@@ -394,13 +553,24 @@ class Client(object):
 
                 raise
             tries += 1
+            if request.timings is not None:
+                request.timings.retries += 1
+            if self._listeners:
+                self._emit('retry', request, tries=tries)
             self._pool.backend_mod.sleep(self.wait_tries)
 
-    def request(self, url, method='GET', body=None, headers=None):
-        """ perform immediatly a new request """
+    def request(self, url, method='GET', body=None, headers=None,
+            compress=None, route=None):
+        """ perform immediatly a new request. If `compress` is not None,
+        it overrides the `compress` option of the client. `route` is the
+        low cardinality label of the url (its template), set on the
+        request for the filters. """
 
         request = Request(url, method=method, body=body,
                 headers=headers)
+        request.route = route
+        if self.record_timings:
+            request.timings = RequestTimings()
 
         # apply request filters
         # They are applied only once time.
@@ -411,13 +581,38 @@ class Client(object):
                 # just return it. Useful for cache filters
                 return ret
 
+        if compress is None:
+            compress = self.compress
+        if compress:
+            request.compress_body(self.compress_level,
+                    self.compress_min_size)
+
         # no response has been provided, do the request
-        self._nb_redirections = self.max_follow_redirect
         return self.perform(request)
 
+    def download(self, url, path, parts=4, headers=None,
+            max_part_retries=3):
+        """ download `url` into the file `path` and return its size.
+
+        The resource is probed with a HEAD request. If the server accepts
+        byte ranges and returns its length, `parts` ranges are fetched
+        concurrently over pooled connections and each one is written
+        directly in its region of the file, mapped in memory. A part
+        failing is requested again from the last byte received, up to
+        `max_part_retries` times. If the resource changes during the
+        download (checked with If-Range), `RequestFailed` is raised.
+        Otherwise, or if the HEAD request fails, the resource is
+        downloaded in a single stream. The file is removed when the
+        download fails. """
+        return download.download(self, url, path, parts=parts,
+                headers=headers, max_part_retries=max_part_retries)
+
     def redirect(self, location, request):
         """ reset request, set new url of request and perform it """
-        if self._nb_redirections <= 0:
+        # the counter is kept by the request so a client can be shared
+        if request.redirects_left is None:
+            request.redirects_left = self.max_follow_redirect
+        if request.redirects_left <= 0:
             raise RedirectLimit("Redirection limit is reached")
 
         if request.initial_url is None:
@@ -432,7 +627,11 @@ class Client(object):
         # change request url and method if needed
         request.url = location
 
-        self._nb_redirections -= 1
+        request.redirects_left -= 1
+        if request.timings is not None:
+            request.timings.redirects += 1
+        if self._listeners:
+            self._emit('redirect', request, location=location)
 
         #perform a new request
         return self.perform(request)
@@ -443,9 +642,18 @@ class Client(object):
         if log.isEnabledFor(logging.DEBUG):
             log.debug("Start to parse response")
 
-        p = HttpStream(SocketReader(connection.socket()), kind=1,
-                decompress=self.decompress)
-
+        if not self._traced(request):
+            reader = SocketReader(connection.socket())
+        else:
+            reader = FirstByteReader(connection.socket(),
+                    lambda: self._first_byte(request))
+        # the body is decoded by the response, see process_response
+        p = ResponseStream(reader, kind=1)
+        return self.process_response(request, connection, p)
+
+    def process_response(self, request, connection, p):
+        """ handle redirections and response filters for the parsed
+        response `p` and return the final response """
         if log.isEnabledFor(logging.DEBUG):
             log.debug("Got response: %s %s" % (p.version(), p.status()))
             log.debug("headers: [%s]" % p.headers())
@@ -453,12 +661,10 @@ class Client(object):
         location = p.headers().get('location')
 
         if self.follow_redirect:
-            should_close = not p.should_keep_alive()
             if p.status_code() in (301, 302, 307,):
 
                 # read full body and release the connection
-                p.body_file().read()
-                connection.release(should_close)
+                self._drop_response(request, connection, p)
 
                 if request.method in ('GET', 'HEAD',) or \
                         self.force_follow_redirect:
@@ -473,8 +679,7 @@ class Client(object):
 
             elif p.status_code() == 303 and self.method == "POST":
                 # read full body and release the connection
-                p.body_file().read()
-                connection.release(should_close)
+                self._drop_response(request, connection, p)
 
                 request.method = "GET"
                 request.body = None
@@ -482,17 +687,87 @@ class Client(object):
 
         # create response object
         resp = self.response_class(connection, request, p)
+        resp.client = self
+        if self.decompress and request.method != "HEAD":
+            raw = resp._body
+            resp._body = decode_body(raw,
+                    resp.headers.get('content-encoding'))
+            if resp._body is not raw:
+                resp._raw_body = raw
+        if request.method == "HEAD" and self._listeners:
+            # the connection has already been released by the response
+            self._emit('released', request, response=resp,
+                    redirected=False)
 
         # apply response filters
         for f in self.response_filters:
             f.on_response(resp, request)
 
+        # the body has been sent, don't keep it with the response
+        request.release_body()
+
         if log.isEnabledFor(logging.DEBUG):
             log.debug("return response class")
 
         # return final response
         return resp
 
+    def _drop_response(self, request, connection, p):
+        """ read the body of a response which isn't returned, like a
+        redirection, and release its connection """
+        resp = self.response_class(connection, request, p)
+        if request.method != "HEAD":
+            resp.skip_body()
+        if self._listeners:
+            self._emit('released', request, response=resp, redirected=True)
+
+
+class ResponseStream(HttpStream):
+    """ HttpStream returning the part of the body received with the
+    headers before reading the socket again. Streaming responses are
+    then readable before the server sends more data. """
+
+    # number of bytes of the body read, before decoding
+    received = 0
+
+    def body_file(self, buffering=None):
+        self._check_headers_complete()
+        return io.BufferedReader(BodyReader(self),
+                buffering or io.DEFAULT_BUFFER_SIZE)
+
+
+class BodyReader(HttpBodyReader):
+
+    def readinto(self, b):
+        stream = self.http_stream
+        if stream.parser.is_partial_body():
+            n = stream.parser.recv_body_into(b)
+        else:
+            n = super(BodyReader, self).readinto(b)
+        if n is None:
+            # the parser stopped, the connection was closed before the
+            # end of the body
+            raise NoMoreData("body truncated after %s bytes" %
+                    stream.received)
+        stream.received += n
+        return n
+
+
+class FirstByteReader(SocketReader):
+    """ socket reader calling `callback` once the first byte of the
+    response has been received """
+
+    def __init__(self, sock, callback):
+        super(FirstByteReader, self).__init__(sock)
+        self.callback = callback
+
+    def readinto(self, b):
+        n = super(FirstByteReader, self).readinto(b)
+        if n and self.callback is not None:
+            callback, self.callback = self.callback, None
+            callback()
+        return n
+
 
 def _get_proxy_auth(proxy_settings):
     proxy_username = os.environ.get('proxy-username')
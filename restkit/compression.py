@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+"""
+restkit.compression
+~~~~~~~~~~~~~~~~~~~
+
+Streaming decoding of compressed response bodies. The body is decoded
+while it is read: each read decompresses at most the size asked, the
+rest of the compressed input is kept for the next one, so memory used
+doesn't depend on the compression ratio.
+
+gzip and deflate are always supported, brotli (br) and zstd when the
+`brotli` and `zstandard` modules are installed.
+
+Request bodies can be compressed on the fly with gzip, see `GzipBody`.
+"""
+
+import io
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from restkit.conn import CHUNK_SIZE
+from restkit.errors import RequestError, ResponseError
+from restkit.util import BUFFER_TYPES, iter_buffer, to_bytestring
+
+
+class ZlibDecoder(object):
+    """ decoder of zlib streams """
+
+    wbits = zlib.MAX_WBITS
+
+    def __init__(self):
+        self._obj = zlib.decompressobj(self.wbits)
+
+    def decompress(self, data, max_length):
+        """ decompress `data` and return at most `max_length` bytes. The
+        input not consumed is kept and decompressed on the next call with
+        empty `data`. """
+        if not data:
+            data = self._obj.unconsumed_tail
+        return self._obj.decompress(data, max_length)
+
+    def pending(self):
+        """ return True if some input hasn't been decompressed yet """
+        return bool(self._obj.unconsumed_tail)
+
+    def flush(self):
+        return self._obj.flush()
+
+
+class GzipDecoder(ZlibDecoder):
+    wbits = 16 + zlib.MAX_WBITS
+
+
+class DeflateDecoder(ZlibDecoder):
+    """ decoder of deflate streams. Some servers send raw deflate
+    streams without the zlib header, they are detected on the first
+    chunk. """
+
+    def __init__(self):
+        super(DeflateDecoder, self).__init__()
+        self._first = True
+
+    def decompress(self, data, max_length):
+        if self._first and data:
+            self._first = False
+            try:
+                return self._obj.decompress(data, max_length)
+            except zlib.error:
+                self._obj = zlib.decompressobj(-zlib.MAX_WBITS)
+        return super(DeflateDecoder, self).decompress(data, max_length)
+
+
+class BufferedDecoder(object):
+    """ base class of decoders which can't limit the size of their
+    output. The input is kept and decompressed by slices sized from the
+    compression ratio seen so far, so a slice gives about `max_length`
+    bytes. The output of a slice is returned by pieces of at most
+    `max_length` bytes before the next slice is decompressed. """
+
+    # size of the first slice
+    min_input = 64
+
+    def __init__(self):
+        self._in = ""
+        self._in_pos = 0
+        self._out = ""
+        self._pos = 0
+        self._total_in = 0
+        self._total_out = 0
+
+    def _process(self, data):
+        raise NotImplementedError
+
+    def _feed(self, data):
+        self._in = self._in[self._in_pos:] + data
+        self._in_pos = 0
+
+    def decompress(self, data, max_length):
+        if data:
+            self._feed(data)
+
+        while self._pos >= len(self._out) and \
+                self._in_pos < len(self._in):
+            if self._total_out:
+                ratio = max(1, self._total_out // self._total_in)
+                size = max(self.min_input, max_length // ratio)
+            else:
+                # no output yet, double the input given
+                size = max(self.min_input, self._total_in)
+            start = self._in_pos
+            chunk = self._in[start:start + size]
+            self._in_pos = start + len(chunk)
+            self._out = self._process(chunk)
+            self._pos = 0
+            self._total_in += len(chunk)
+            self._total_out += len(self._out)
+
+        pos = self._pos
+        chunk = self._out[pos:pos + max_length]
+        self._pos = pos + len(chunk)
+        return chunk
+
+    def pending(self):
+        return self._pos < len(self._out) or self._in_pos < len(self._in)
+
+    def flush(self):
+        return self._out[self._pos:]
+
+
+class BrotliDecoder(BufferedDecoder):
+    """ brotli decoder. brotli >= 1.1 limits the size of its output
+    itself and keeps the input not decompressed yet. """
+
+    def __init__(self):
+        super(BrotliDecoder, self).__init__()
+        obj = brotli.Decompressor()
+        if hasattr(obj, 'can_accept_more_data'):
+            self._obj = obj
+        else:
+            self._obj = None
+        # brotli has `process`, brotlipy and brotlicffi `decompress`
+        self._process = getattr(obj, 'process', None) or obj.decompress
+
+    def decompress(self, data, max_length):
+        obj = self._obj
+        if obj is None:
+            return super(BrotliDecoder, self).decompress(data, max_length)
+
+        if data:
+            self._feed(data)
+        if obj.can_accept_more_data():
+            data = self._in[self._in_pos:]
+            self._in = ""
+            self._in_pos = 0
+        else:
+            data = ""
+        return obj.process(data, output_buffer_limit=max_length)
+
+    def pending(self):
+        if self._obj is None:
+            return super(BrotliDecoder, self).pending()
+        return bool(self._in) or not self._obj.can_accept_more_data()
+
+
+class ZstdDecoder(BufferedDecoder):
+
+    def __init__(self):
+        super(ZstdDecoder, self).__init__()
+        self._process = zstandard.ZstdDecompressor().decompressobj(
+                ).decompress
+
+
+DECODERS = {
+    'gzip': GzipDecoder,
+    'x-gzip': GzipDecoder,
+    'deflate': DeflateDecoder
+}
+if brotli is not None:
+    DECODERS['br'] = BrotliDecoder
+if zstandard is not None:
+    DECODERS['zstd'] = ZstdDecoder
+
+# value of the Accept-Encoding header sent when the client decompress
+# responses.
+ACCEPT_ENCODING = ", ".join([enc for enc in ('gzip', 'deflate', 'br',
+    'zstd') if enc in DECODERS])
+
+
+class DecodingReader(io.RawIOBase):
+    """ raw reader decoding the compressed stream `raw` with `decoder`.
+
+    Compressed data is read by chunks of `chunk_size` bytes and each
+    read returns at most the size of the buffer passed. """
+
+    def __init__(self, raw, decoder, chunk_size=CHUNK_SIZE):
+        self.raw = raw
+        self.decoder = decoder
+        self.chunk_size = chunk_size
+        self._leftover = ""
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        size = len(b)
+        if self._leftover:
+            data = self._leftover
+        else:
+            data = self._decode(size)
+        if len(data) > size:
+            data, self._leftover = data[:size], data[size:]
+        else:
+            self._leftover = ""
+        n = len(data)
+        b[:n] = data
+        return n
+
+    def _decode(self, size):
+        decoder = self.decoder
+        try:
+            while not self._eof:
+                if decoder.pending():
+                    data = decoder.decompress("", size)
+                else:
+                    chunk = self.raw.read(self.chunk_size)
+                    if not chunk:
+                        self._eof = True
+                        data = decoder.flush()
+                    else:
+                        data = decoder.decompress(chunk, size)
+                if data:
+                    return data
+        except Exception, e:
+            if isinstance(e, (IOError, ResponseError)):
+                raise
+            raise ResponseError("error while decoding the response "
+                    "body: %s" % str(e))
+        return ""
+
+
+def parse_encodings(content_encoding):
+    """ return the list of codings of a Content-Encoding header value, in
+    the order they have been applied, identity excepted. """
+    if not content_encoding:
+        return []
+    return [enc for enc in [e.strip().lower() for e in \
+            content_encoding.split(",")] if enc and enc != 'identity']
+
+
+def decode_body(body, content_encoding, chunk_size=CHUNK_SIZE):
+    """ return a buffered reader decoding `body` according to
+    `content_encoding`. `body` is returned unchanged when it isn't
+    encoded or when a coding isn't supported. """
+    encodings = parse_encodings(content_encoding)
+    if not encodings:
+        return body
+
+    for enc in encodings:
+        if enc not in DECODERS:
+            return body
+
+    # codings are listed in the order they were applied
+    for enc in reversed(encodings):
+        body = DecodingReader(body, DECODERS[enc](), chunk_size)
+    return io.BufferedReader(body, chunk_size)
+
+
+class GzipBody(object):
+    """ gzip compressed view of a request body. `body` can be a string,
+    a file-like object or an iterable (`MultipartForm`, generators, ...).
+    It's compressed while it is iterated, `chunk_size` bytes at a time,
+    so the whole compressed body is never kept in memory. The body is
+    sent chunked since its compressed size isn't known.
+
+    Strings, buffers and bodies with a `seek` method can be iterated
+    again, when a request is retried. `seek` raises IOError for other
+    bodies. """
+
+    def __init__(self, body, level=6, chunk_size=CHUNK_SIZE):
+        if isinstance(body, basestring):
+            body = to_bytestring(body)
+        self.body = body
+        self.level = level
+        self.chunk_size = chunk_size
+        self._started = False
+
+    def can_rewind(self):
+        return isinstance(self.body, (str,) + BUFFER_TYPES) or \
+                hasattr(self.body, 'seek')
+
+    def seek(self, offset, whence=0):
+        """ rewind the body, only seek(0) is supported """
+        if offset != 0 or whence != 0:
+            raise IOError("a compressed body can only be rewound")
+        if not self.can_rewind():
+            raise IOError("the source of the compressed body can't be "
+                    "rewound")
+        if hasattr(self.body, 'seek'):
+            self.body.seek(0)
+        self._started = False
+
+    def _iter_source(self):
+        body = self.body
+        size = self.chunk_size
+        if isinstance(body, str):
+            for i in xrange(0, len(body), size):
+                yield buffer(body, i, size)
+        elif isinstance(body, BUFFER_TYPES):
+            for data in iter_buffer(body, size):
+                yield data
+        elif hasattr(body, 'read'):
+            while True:
+                data = body.read(size)
+                if not data:
+                    break
+                yield data
+        else:
+            for data in body:
+                yield to_bytestring(data)
+
+    def __iter__(self):
+        if self._started:
+            if not self.can_rewind():
+                raise RequestError("compressed body can't be rewound")
+            self.seek(0)
+        self._started = True
+
+        obj = zlib.compressobj(self.level, zlib.DEFLATED,
+                16 + zlib.MAX_WBITS)
+        for data in self._iter_source():
+            data = obj.compress(data)
+            # empty chunks would end the chunked body
+            if data:
+                yield data
+        yield obj.flush()
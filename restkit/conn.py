@@ -3,42 +3,79 @@
 # This file is part of restkit released under the MIT license.
 # See the NOTICE for more information.
 
+import errno
 import logging
+import os
 import random
 import select
 import socket
 import ssl
+import stat
 import time
 import cStringIO
 
+try:
+    from os import sendfile
+except ImportError:
+    try:
+        # pysendfile
+        from sendfile import sendfile
+    except ImportError:
+        sendfile = None
+
 from socketpool import Connector
 from socketpool.util import is_connected
 
+from restkit.timings import now
+
 CHUNK_SIZE = 16 * 1024
 MAX_BODY = 1024 * 112
 DNS_TIMEOUT = 60
 
 
 class Connection(Connector):
+    """ A connection to an HTTP server. If port is None, host is the
+    path of the unix socket the server is listening on. When `timings`
+    is True, the address is resolved apart so DNS time can be measured.
+    """
 
     def __init__(self, host, port, backend_mod=None, pool=None,
             is_ssl=False, extra_headers=[], proxy_pieces=None, timeout=None,
-            **ssl_args):
+            timings=False, **ssl_args):
 
         # connect the socket, if we are using an SSL connection, we wrap
         # the socket.
-        self._s = backend_mod.Socket(socket.AF_INET, socket.SOCK_STREAM)
+        t_dns = now()
+        if port is None:
+            family = socket.AF_UNIX
+            addr = host
+        else:
+            family = socket.AF_INET
+            addr = (host, port)
+        self._s = backend_mod.Socket(family, socket.SOCK_STREAM)
         if timeout is not None:
             self._s.settimeout(timeout)
-        self._s.connect((host, port))
+        if timings and port is not None and \
+                backend_mod.Socket is socket.socket:
+            # resolve the address apart so DNS time can be measured. Green
+            # backends resolve it themselves while connecting.
+            addr = socket.getaddrinfo(host, port, socket.AF_INET,
+                    socket.SOCK_STREAM)[0][4]
+        t_resolved = now()
+        self._s.connect(addr)
         if proxy_pieces:
             self._s.sendall(proxy_pieces)
             response = cStringIO.StringIO()
             while response.getvalue()[-4:] != '\r\n\r\n':
                 response.write(self._s.recv(1))
             response.close()
+        t_connected = now()
+        t_tls = None
         if is_ssl:
             self._s = ssl.wrap_socket(self._s, **ssl_args)
+            t_tls = now()
+        self.connect_timings = (t_dns, t_resolved, t_connected, t_tls)
+        self.nb_requests = 0
 
         self.extra_headers = extra_headers
         self.is_ssl = is_ssl
@@ -50,6 +87,9 @@ class Connection(Connector):
         self._pool = pool
         self._released = False
 
+        # number of bytes sent, see Client.perform
+        self.bytes_sent = 0
+
     def matches(self, **match_options):
         target_host = match_options.get('host')
         target_port = match_options.get('port')
@@ -94,33 +134,94 @@ class Connection(Connector):
         return self._s
 
     def send_chunk(self, data):
-        chunk = "".join(("%X\r\n" % len(data), data, "\r\n"))
-        self._s.sendall(chunk)
+        if isinstance(data, str):
+            chunk = "".join(("%X\r\n" % len(data), data, "\r\n"))
+            self._s.sendall(chunk)
+            self.bytes_sent += len(chunk)
+            return
+
+        # don't copy buffers (bytearray, mmap...)
+        size = len(data) * getattr(data, 'itemsize', 1)
+        head = "%X\r\n" % size
+        self._s.sendall(head)
+        self._s.sendall(data)
+        self._s.sendall("\r\n")
+        self.bytes_sent += len(head) + size + 2
 
     def send(self, data, chunked=False):
         if chunked:
             return self.send_chunk(data)
 
-        return self._s.sendall(data)
+        self._s.sendall(data)
+        self.bytes_sent += len(data) * getattr(data, 'itemsize', 1)
 
     def sendlines(self, lines, chunked=False):
-        for line in list(lines):
+        for line in lines:
             self.send(line, chunked=chunked)
 
 
-    # TODO: add support for sendfile api
-    def sendfile(self, data, chunked=False):
-        """ send a data from a FileObject """
+    def can_sendfile(self, data, chunked=False):
+        """ return True if the file object `data` can be sent with the
+        sendfile system call: it must be a regular file, sent unchunked
+        over a plain socket of the thread backend. The `sendfile` module
+        (pysendfile) is needed on Python 2. """
+        if sendfile is None or chunked or self.is_ssl or \
+                type(self._s) is not socket.socket or \
+                not hasattr(data, 'fileno'):
+            return False
+        try:
+            return stat.S_ISREG(os.fstat(data.fileno()).st_mode)
+        except (AttributeError, IOError, OSError, ValueError):
+            return False
 
-        if hasattr(data, 'seek'):
+    def sendfile(self, data, chunked=False, size=None):
+        """ send a data from a FileObject. If `size` is None the file is
+        sent from its start, else `size` bytes are sent from the current
+        position. Regular files are sent without being read when
+        possible, see `can_sendfile`. """
+
+        if size is None and hasattr(data, 'seek'):
             data.seek(0)
 
-        while True:
-            binarydata = data.read(CHUNK_SIZE)
+        if self.can_sendfile(data, chunked):
+            return self._sendfile(data, size)
+
+        while size is None or size > 0:
+            if size is None:
+                binarydata = data.read(CHUNK_SIZE)
+            else:
+                binarydata = data.read(min(CHUNK_SIZE, size))
+                size -= len(binarydata)
             if binarydata == '':
                 break
             self.send(binarydata, chunked=chunked)
 
+    def _sendfile(self, data, size=None):
+        offset = data.tell()
+        if size is None:
+            size = os.fstat(data.fileno()).st_size - offset
+        end = offset + size
+        sock_fd = self._s.fileno()
+        timeout = self._s.gettimeout()
+        while offset < end:
+            try:
+                sent = sendfile(sock_fd, data.fileno(), offset, end - offset)
+            except OSError, e:
+                if e.errno == errno.EINTR:
+                    continue
+                elif e.errno != errno.EAGAIN:
+                    raise socket.error(e.errno, e.strerror)
+                # the socket has a timeout so it's non blocking
+                if not select.select([], [sock_fd], [], timeout)[1]:
+                    raise socket.timeout("timed out")
+                continue
+            if not sent:
+                # the file has been truncated
+                break
+            offset += sent
+            self.bytes_sent += sent
+        data.seek(offset)
+
 
     def recv(self, size=1024):
         return self._s.recv(size)
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+"""
+Aggregated request metrics.
+
+`MetricsFilter` is a client filter recording, per (method, host, route),
+request counts by status class, bytes sent and received and a latency
+histogram. Histograms use a fixed set of log-linear buckets so memory
+stays bounded whatever the traffic, and the number of series is capped
+by `max_series`.
+
+Bytes are counted as they are sent and read: request bodies with their
+chunks framing, response bodies before decompression. Response bytes
+are recorded once the body has been read and the connection released.
+
+Metrics are rendered in the Prometheus/OpenMetrics text format with
+`MetricsFilter.render` or served by the `MetricsApp` WSGI application::
+
+    from restkit.contrib.metrics import MetricsFilter, MetricsApp
+    from restkit.contrib.wsgi_proxy import Proxy
+
+    metrics = MetricsFilter()
+    proxy = Proxy(filters=[metrics])
+    metrics_app = MetricsApp(metrics)
+
+The latency recorded is the time between the creation of the request and
+the reception of the response headers, retries and redirections included.
+"""
+
+from bisect import bisect_left
+import threading
+
+from restkit.timings import RequestTimings, now
+
+OTHER_ROUTE = "__other__"
+# route label of the requests without a route
+NO_ROUTE = "__none__"
+
+OPENMETRICS_CTYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PROMETHEUS_CTYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def log_linear_buckets(low_exp=-4, high_exp=2, steps=(1, 2, 3, 4, 5, 6, 7,
+        8, 9)):
+    """ return the upper bounds of log-linear buckets: for each power of
+    ten between 10^low_exp and 10^high_exp, linear steps. """
+    bounds = []
+    for exp in range(low_exp, high_exp):
+        for step in steps:
+            bounds.append(float("%se%s" % (step, exp)))
+    bounds.append(float("1e%s" % high_exp))
+    return tuple(bounds)
+
+# 100us to 100s
+DEFAULT_BUCKETS = log_linear_buckets()
+
+
+class Series(object):
+    """ metrics of a (method, host, route) tuple """
+
+    __slots__ = ('statuses', 'bytes_in', 'bytes_out', 'buckets', 'sum',
+            'count', 'overflow')
+
+    def __init__(self, nbuckets):
+        self.statuses = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        # last one is +Inf
+        self.buckets = [0] * (nbuckets + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.overflow = False
+
+
+class MetricsFilter(object):
+    """ filter recording aggregated metrics of requests
+
+    Response bytes are recorded by a 'released' listener registered on
+    the clients using the filter. `detach` removes it.
+
+    :param max_series: maximum number of (method, host, route) series
+    kept. Requests that would create a new series past this limit are
+    all recorded in a single series, with the method, host, route and
+    status labels set to `OTHER_ROUTE`.
+    :param route_for: callable returning the route label of a request.
+    By default the `route` attribute of the request is used, or
+    `NO_ROUTE` when it isn't set. The url path isn't used since each
+    document id would create its own series.
+    :param buckets: sorted upper bounds of the latency histogram buckets,
+    in seconds.
+    :param prefix: metrics names prefix.
+    """
+
+    def __init__(self, max_series=1000, route_for=None,
+            buckets=DEFAULT_BUCKETS, prefix="restkit"):
+        self.max_series = max_series
+        self.route_for = route_for or default_route
+        self.bounds = tuple(buckets)
+        self.prefix = prefix
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def on_request(self, request):
+        if request.timings is None:
+            request.timings = RequestTimings()
+
+    def on_response(self, response, request):
+        latency = now() - request.timings.start
+        status = "%dxx" % (response.status_int // 100)
+        idx = bisect_left(self.bounds, latency)
+
+        with self._lock:
+            series = self._get_series(request)
+            if series.overflow:
+                status = OTHER_ROUTE
+            series.statuses[status] = series.statuses.get(status, 0) + 1
+            series.bytes_out += request.timings.bytes_sent
+            series.buckets[idx] += 1
+            series.sum += latency
+            series.count += 1
+
+        # response bytes are known once the body has been read
+        client = response.client
+        if client is not None and self.on_released not in \
+                client._listeners.get('released', ()):
+            client.add_listener('released', self.on_released)
+
+    def detach(self, client):
+        """ stop recording the response bytes of `client` """
+        client.remove_listener('released', self.on_released)
+
+    def on_released(self, event, request, response=None, redirected=False):
+        if redirected or request.timings is None or \
+                request.method == "HEAD":
+            return
+        client = response.client
+        if client is None or self not in client.response_filters:
+            return
+        with self._lock:
+            self._get_series(request).bytes_in += \
+                    request.timings.bytes_received
+
+    def _get_series(self, request):
+        key = (request.method, request.parsed_url.netloc,
+                self.route_for(request))
+        series = self.series.get(key)
+        if series is None:
+            if len(self.series) >= self.max_series:
+                key = (OTHER_ROUTE, OTHER_ROUTE, OTHER_ROUTE)
+                series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = Series(len(self.bounds))
+                series.overflow = key[0] == OTHER_ROUTE
+        return series
+
+    def reset(self):
+        with self._lock:
+            self.series = {}
+
+    def render(self, openmetrics=True):
+        """ render metrics in the OpenMetrics text format or in the
+        Prometheus text format if openmetrics is False """
+        with self._lock:
+            items = sorted([(k, _copy_series(s)) for k, s in \
+                    self.series.items()])
+
+        name = self.prefix + "_requests"
+        bytes_in = self.prefix + "_response_bytes"
+        bytes_out = self.prefix + "_request_bytes"
+        duration = self.prefix + "_request_duration_seconds"
+        bounds = ["%r" % b for b in self.bounds] + ["+Inf"]
+
+        lines = []
+        lines.append(_type_line(name, "counter", openmetrics))
+        for key, series in items:
+            labels = _labels(key)
+            for status, count in sorted(series.statuses.items()):
+                lines.append('%s_total{%s,status="%s"} %d' % (name, labels,
+                    status, count))
+
+        for metric, attr in ((bytes_in, 'bytes_in'),
+                (bytes_out, 'bytes_out')):
+            lines.append(_type_line(metric, "counter", openmetrics))
+            for key, series in items:
+                lines.append("%s_total{%s} %d" % (metric, _labels(key),
+                    getattr(series, attr)))
+
+        lines.append("# TYPE %s histogram" % duration)
+        for key, series in items:
+            labels = _labels(key)
+            cumulative = 0
+            for bound, count in zip(bounds, series.buckets):
+                cumulative += count
+                lines.append('%s_bucket{%s,le="%s"} %d' % (duration, labels,
+                    bound, cumulative))
+            lines.append("%s_sum{%s} %r" % (duration, labels, series.sum))
+            lines.append("%s_count{%s} %d" % (duration, labels,
+                series.count))
+
+        if openmetrics:
+            lines.append("# EOF")
+        lines.append("")
+        return "\n".join(lines)
+
+
+class MetricsApp(object):
+    """ WSGI application serving the metrics of a `MetricsFilter`. The
+    OpenMetrics format is used when the client accepts it, the Prometheus
+    text format otherwise. """
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def __call__(self, environ, start_response):
+        if environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            start_response('405 Method Not Allowed', [('Allow', 'GET, HEAD')])
+            return ['']
+
+        accept = environ.get('HTTP_ACCEPT', '')
+        openmetrics = 'application/openmetrics-text' in accept
+        body = self.metrics.render(openmetrics=openmetrics)
+        if openmetrics:
+            ctype = OPENMETRICS_CTYPE
+        else:
+            ctype = PROMETHEUS_CTYPE
+
+        start_response('200 OK', [('Content-Type', ctype),
+            ('Content-Length', str(len(body)))])
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return ['']
+        return [body]
+
+
+def default_route(request):
+    route = request.route
+    if route is None:
+        return NO_ROUTE
+    return route
+
+def _copy_series(series):
+    s = Series(0)
+    s.statuses = series.statuses.copy()
+    s.bytes_in = series.bytes_in
+    s.bytes_out = series.bytes_out
+    s.buckets = series.buckets[:]
+    s.sum = series.sum
+    s.count = series.count
+    return s
+
+def _type_line(name, kind, openmetrics):
+    if openmetrics:
+        return "# TYPE %s %s" % (name, kind)
+    return "# TYPE %s_total %s" % (name, kind)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"',
+            '\\"').replace('\n', '\\n')
+
+def _labels(key):
+    return 'method="%s",host="%s",route="%s"' % tuple(map(_escape, key))
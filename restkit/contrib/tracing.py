@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+"""
+Request timelines in the Chrome trace event format.
+
+`TraceRecorder` keeps the timings of the last requests performed by a
+client in a ring buffer and dumps them on demand as a JSON file that can
+be loaded in Chrome ``about:tracing`` or Perfetto. Each request is a span
+on the thread (or greenlet) that consumed it, with nested phases: pool
+wait (including DNS, connect and TLS for new connections), send, wait and
+receive::
+
+    from restkit import Client
+    from restkit.contrib.tracing import TraceRecorder
+
+    client = Client()
+    recorder = TraceRecorder()
+    recorder.attach(client)
+
+    recorder.enable()
+    ... do some requests ...
+    recorder.flush("/tmp/restkit.trace.json")
+
+While the recorder is disabled it only costs a flag check per request.
+"""
+
+from collections import deque
+import os
+import sys
+import thread
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from restkit.timings import RequestTimings
+
+# phases nested in the request span: (name, category, start, end)
+PHASES = (
+    ("pool wait", "pool", "checkout_start", "checkout_end"),
+    ("dns", "connect", "dns_start", "dns_end"),
+    ("connect", "connect", "dns_end", "connect_end"),
+    ("tls", "connect", "connect_end", "tls_end"),
+    ("send", "send", "checkout_end", "body_sent"),
+    ("wait", "wait", "body_sent", "first_byte"),
+    ("receive", "receive", "first_byte", "body_done"),
+)
+
+
+def get_ident():
+    """ return the id of the current greenlet if any or the current
+    thread id """
+    greenlet = sys.modules.get('greenlet')
+    if greenlet is not None:
+        current = greenlet.getcurrent()
+        if current.parent is not None:
+            return id(current)
+    return thread.get_ident()
+
+
+class TraceRecorder(object):
+    """ record request timelines of clients
+
+    :param maxlen: number of requests kept in the ring buffer
+    :param enabled: start recording immediately
+    """
+
+    def __init__(self, maxlen=10000, enabled=False):
+        self.enabled = enabled
+        self.maxlen = maxlen
+        self.spans = deque(maxlen=maxlen)
+        self.pid = os.getpid()
+        self.clients = []
+
+    def attach(self, client):
+        """ record the requests of `client` """
+        client.request_filters.append(self)
+        self.clients.append(client)
+        if self.enabled:
+            client.add_listener('released', self.on_released)
+
+    def detach(self, client):
+        if self in client.request_filters:
+            client.request_filters.remove(self)
+        if client in self.clients:
+            self.clients.remove(client)
+        client.remove_listener('released', self.on_released)
+
+    def enable(self):
+        # the listener is only registered while recording so requests
+        # of a disabled recorder aren't traced by the clients
+        if not self.enabled:
+            for client in self.clients:
+                client.add_listener('released', self.on_released)
+        self.enabled = True
+
+    def disable(self):
+        if self.enabled:
+            for client in self.clients:
+                client.remove_listener('released', self.on_released)
+        self.enabled = False
+
+    def on_request(self, request):
+        if self.enabled and request.timings is None:
+            request.timings = RequestTimings()
+
+    def on_released(self, event, request, response=None, redirected=False):
+        # a redirected request is recorded once, with its final response
+        if not self.enabled or request.timings is None or redirected:
+            return
+        name = "%s %s" % (request.method, request.url)
+        self.spans.append((name, get_ident(), request.timings))
+
+    def trace_events(self, spans=None):
+        """ return the list of trace events of `spans`, the recorded
+        requests by default """
+        if spans is None:
+            spans = self.spans
+        events = []
+        for name, tid, timings in list(spans):
+            end = timings.body_done or timings.first_byte
+            if end is None:
+                continue
+            events.append(self._event(name, "request", tid, timings.start,
+                end, args={"retries": timings.retries,
+                    "redirects": timings.redirects,
+                    "reused": timings.reused}))
+            for phase, cat, t0, t1 in PHASES:
+                t0 = getattr(timings, t0)
+                t1 = getattr(timings, t1)
+                if t0 is not None and t1 is not None:
+                    events.append(self._event(phase, cat, tid, t0, t1))
+        return events
+
+    def flush(self, path):
+        """ write recorded requests to `path` and clear the buffer.
+        Return the number of requests written. """
+        # requests recorded while writing go in the new buffer
+        spans, self.spans = self.spans, deque(maxlen=self.maxlen)
+        events = self.trace_events(spans)
+        count = len(spans)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return count
+
+    def _event(self, name, cat, tid, t0, t1, args=None):
+        event = {"name": name, "cat": cat, "ph": "X", "pid": self.pid,
+                "tid": tid, "ts": t0 * 1e6, "dur": (t1 - t0) * 1e6}
+        if args:
+            event["args"] = args
+        return event
@@ -26,12 +26,17 @@ WEBOB_ERROR = ("Content-Length is set to -1. This usually mean that WebOb has "
 
 class Proxy(object):
     """A proxy wich redirect the request to SERVER_NAME:SERVER_PORT
-    and send HTTP_HOST header"""
+    and send HTTP_HOST header.
+
+    Responses are passed through: the Accept-Encoding header of the
+    client is forwarded and compressed bodies are returned as is, without
+    decoding them. Pass ``decompress=True`` to decode them."""
 
     def __init__(self, manager=None, allowed_methods=ALLOWED_METHODS,
             strip_script_name=True,  **kwargs):
         self.allowed_methods = allowed_methods
         self.strip_script_name = strip_script_name
+        kwargs.setdefault('decompress', False)
         self.client = Client(**kwargs)
 
     def extract_uri(self, environ):
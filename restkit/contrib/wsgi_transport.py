@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+"""
+In-process transport dispatching requests to a WSGI application.
+
+Requests are passed directly to the application and the response is
+built from the iterable it returns, without sockets nor HTTP parsing.
+Filters, redirections and errors handling of `Client` and `Resource` work
+as usual::
+
+    from restkit import Resource
+    from restkit.contrib.wsgi_transport import WSGITransport
+
+    res = Resource("http://localhost", transport=WSGITransport(app))
+    r = res.get("/db/doc")
+"""
+
+import io
+from itertools import chain
+import sys
+import types
+import urllib
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+from http_parser.util import IOrderedDict
+
+from restkit.util import BUFFER_TYPES, iter_buffer, to_bytestring
+
+
+class WSGITransport(object):
+    """ transport performing requests against a WSGI application
+
+    :param app: the WSGI application
+    :param script_name: SCRIPT_NAME of the application
+    :param extra_environ: dict added to the environ of each request
+    """
+
+    def __init__(self, app, script_name='', extra_environ=None):
+        self.app = app
+        self.script_name = script_name
+        self.extra_environ = extra_environ or {}
+
+    def perform(self, client, request):
+        traced = client._traced(request)
+        environ = self.make_environ(request)
+        if 'HTTP_ACCEPT_ENCODING' not in environ:
+            environ['HTTP_ACCEPT_ENCODING'] = client.default_accept_encoding()
+        clen = environ.get('CONTENT_LENGTH', '')
+        if request.timings is not None and clen.isdigit():
+            request.timings.bytes_sent = int(clen)
+        if traced:
+            client._phase(request, 'headers_sent', None)
+            client._phase(request, 'body_sent', None)
+
+        result = []
+        def start_response(status, headers, exc_info=None):
+            if exc_info is not None:
+                try:
+                    if result:
+                        raise exc_info[0], exc_info[1], exc_info[2]
+                finally:
+                    exc_info = None
+            elif result:
+                raise AssertionError("start_response called twice")
+            result[:] = [status, headers, []]
+            return result[2].append
+
+        app_iter = self.app(environ, start_response)
+        # called when the response is released, read or not
+        close = getattr(app_iter, 'close', None)
+        if not result:
+            # start_response is called on first iteration with generators
+            app_iter = iter(app_iter)
+            try:
+                try:
+                    first = [app_iter.next()]
+                except StopIteration:
+                    first = []
+                if not result:
+                    raise AssertionError("start_response wasn't called")
+            except:
+                if close is not None:
+                    close()
+                raise
+            app_iter = chain(first, app_iter)
+
+        if traced:
+            client._first_byte(request)
+
+        status, headers, written = result
+        if written:
+            app_iter = chain(written, app_iter)
+        p = WSGIResponseStream(status, headers, app_iter, close)
+        return client.process_response(request, WSGIConnection(p), p)
+
+    def make_environ(self, request):
+        parsed_url = request.parsed_url
+        host, port = parsed_url.address
+        if port is None:
+            host, port = "localhost", 80
+
+        environ = {
+            'REQUEST_METHOD': request.method,
+            'SCRIPT_NAME': self.script_name,
+            'PATH_INFO': urllib.unquote(parsed_url.path or '/'),
+            'QUERY_STRING': parsed_url.query,
+            'SERVER_NAME': host,
+            'SERVER_PORT': str(port),
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': request.host,
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': request.is_ssl() and 'https' or 'http',
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False
+        }
+
+        for k, v in request.headers.items():
+            key = k.upper().replace('-', '_')
+            if key in ('HOST', 'TRANSFER_ENCODING'):
+                continue
+            elif key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                key = 'HTTP_%s' % key
+
+            if key in environ:
+                environ[key] = "%s,%s" % (environ[key], v)
+            else:
+                environ[key] = str(v)
+
+        body = request.body
+        if body is None:
+            body = StringIO("")
+            environ['CONTENT_LENGTH'] = '0'
+        elif isinstance(body, types.StringTypes):
+            body = to_bytestring(body)
+            environ['CONTENT_LENGTH'] = str(len(body))
+            body = StringIO(body)
+        elif isinstance(body, BUFFER_TYPES):
+            data = StringIO()
+            for chunk in iter_buffer(body, 65536):
+                data.write(chunk)
+            environ['CONTENT_LENGTH'] = str(data.tell())
+            data.seek(0)
+            body = data
+        elif hasattr(body, 'read') and 'CONTENT_LENGTH' in environ:
+            if hasattr(body, 'seek'):
+                body.seek(0)
+        else:
+            # iterators and streams of unknown length
+            if hasattr(body, 'read'):
+                data = body.read()
+            else:
+                data = "".join(body)
+            environ['CONTENT_LENGTH'] = str(len(data))
+            body = StringIO(data)
+        environ['wsgi.input'] = body
+        environ.update(self.extra_environ)
+        return environ
+
+
+class WSGIResponseStream(object):
+    """ expose the response of a WSGI application like an
+    http_parser.http.HttpStream """
+
+    def __init__(self, status, headers, app_iter, close=None):
+        self._status = status
+        self._status_code = int(status.split(None, 1)[0])
+        self._headers = IOrderedDict()
+        for name, value in headers:
+            if name in self._headers:
+                value = "%s, %s" % (self._headers[name], value)
+            self._headers[name] = value
+        self.app_iter = app_iter
+        self._close = close
+        self._body = None
+        # number of bytes of the body read
+        self.received = 0
+
+    def version(self):
+        return (1, 1)
+
+    def status(self):
+        return self._status
+
+    def status_code(self):
+        return self._status_code
+
+    def headers(self):
+        return self._headers.copy()
+
+    def should_keep_alive(self):
+        return True
+
+    def body_file(self):
+        if self._body is None:
+            self._body = io.BufferedReader(IterBodyReader(self.app_iter,
+                self))
+        return self._body
+
+    def close(self):
+        """ call the close method of the application iterable """
+        close, self._close = self._close, None
+        if close is not None:
+            close()
+
+
+class IterBodyReader(io.RawIOBase):
+    """ raw reader over the iterable returned by a WSGI application """
+
+    def __init__(self, iterable, stream=None):
+        self.iter = iter(iterable)
+        self.stream = stream
+        self._buffer = ""
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self._pos >= len(self._buffer):
+            for chunk in self.iter:
+                if chunk:
+                    self._buffer = chunk
+                    self._pos = 0
+                    break
+            else:
+                return 0
+
+        pos = self._pos
+        n = min(len(b), len(self._buffer) - pos)
+        b[:n] = buffer(self._buffer, pos, n)
+        self._pos = pos + n
+        if self.stream is not None:
+            self.stream.received += n
+        return n
+
+
+class WSGIConnection(object):
+    """ connection released once the response has been read """
+
+    extra_headers = []
+    nb_requests = 0
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def socket(self):
+        return None
+
+    def release(self, should_close=False):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+    close = release
+
@@ -3,6 +3,9 @@
 # This file is part of restkit released under the MIT license. 
 # See the NOTICE for more information.
 
+from bisect import bisect_left
+import threading
+
 try:
     from UserDict import DictMixin
 except ImportError:    
@@ -239,3 +242,336 @@ class MultiDict(DictMixin):
             yield v
 
 
+
+
+class HeaderDict(object):
+    """
+        An ordered dictionary of HTTP headers, with the API of MultiDict.
+
+        Names are indexed by their lower-cased value, so lookups, case
+        sensitive or not, don't scan all the headers. The index is built
+        on the first lookup and kept up to date when headers are added,
+        replaced or removed. Setting a header which is already present
+        replaces it in place.
+    """
+
+    __slots__ = ('_items', '_index')
+
+    def __init__(self, *args, **kw):
+        if len(args) > 1:
+            raise TypeError("HeaderDict can only be called with one positional argument")
+        if args:
+            if isinstance(args[0], (HeaderDict, MultiDict)):
+                items = list(args[0]._items)
+            elif hasattr(args[0], 'iteritems'):
+                items = list(args[0].iteritems())
+            elif hasattr(args[0], 'items'):
+                items = list(args[0].items())
+            else:
+                items = list(args[0])
+            self._items = items
+        else:
+            self._items = []
+        if kw:
+            self._items.extend(kw.iteritems())
+        self._index = None
+
+    def _positions(self, key):
+        """ return the positions of the headers named `key`, whatever
+        their case """
+        index = self._index
+        if index is None:
+            index = self._index = {}
+            for i, (k, v) in enumerate(self._items):
+                index.setdefault(k.lower(), []).append(i)
+        return index.get(key.lower(), [])
+
+    def _exact(self, key):
+        items = self._items
+        return [i for i in self._positions(key) if items[i][0] == key]
+
+    def _delete(self, positions):
+        positions = sorted(positions)
+        items = self._items
+        for i in reversed(positions):
+            del items[i]
+
+        index = self._index
+        if index is None:
+            return
+        # shift the positions after the removed headers
+        removed = set(positions)
+        for name, pos in index.items():
+            pos = [i - bisect_left(positions, i) for i in pos
+                    if i not in removed]
+            if pos:
+                index[name] = pos
+            else:
+                del index[name]
+
+    def __getitem__(self, key):
+        positions = self._exact(key)
+        if not positions:
+            raise KeyError(key)
+        return self._items[positions[-1]][1]
+
+    def __setitem__(self, key, value):
+        positions = self._exact(key)
+        if len(positions) == 1:
+            self._items[positions[0]] = (key, value)
+            return
+        if positions:
+            self._delete(positions)
+        self.add(key, value)
+
+    def add(self, key, value):
+        """
+        Add the key and value, not overwriting any previous value.
+        """
+        if self._index is not None:
+            self._index.setdefault(key.lower(), []).append(len(self._items))
+        self._items.append((key, value))
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def getall(self, key):
+        """
+        Return a list of all values matching the key (may be an empty list)
+        """
+        items = self._items
+        return [items[i][1] for i in self._exact(key)]
+
+    def iget(self, key):
+        """like get but case insensitive """
+        positions = self._positions(key)
+        if positions:
+            return self._items[positions[0]][1]
+        return None
+
+    def igetall(self, key):
+        """like getall but case insensitive """
+        items = self._items
+        return [items[i][1] for i in self._positions(key)]
+
+    def getone(self, key):
+        """
+        Get one value matching the key, raising a KeyError if multiple
+        values were found.
+        """
+        v = self.getall(key)
+        if not v:
+            raise KeyError('Key not found: %r' % key)
+        if len(v) > 1:
+            raise KeyError('Multiple values match %r: %r' % (key, v))
+        return v[0]
+
+    def mixed(self):
+        return MultiDict(self._items).mixed()
+
+    def dict_of_lists(self):
+        return MultiDict(self._items).dict_of_lists()
+
+    def __delitem__(self, key):
+        positions = self._exact(key)
+        if not positions:
+            raise KeyError(key)
+        self._delete(positions)
+
+    def __contains__(self, key):
+        return len(self._exact(key)) > 0
+
+    has_key = __contains__
+
+    def clear(self):
+        self._items = []
+        self._index = None
+
+    def copy(self):
+        return self.__class__(self)
+
+    def setdefault(self, key, default=None):
+        positions = self._exact(key)
+        if positions:
+            return self._items[positions[0]][1]
+        self.add(key, default)
+        return default
+
+    def pop(self, key, *args):
+        if len(args) > 1:
+            raise TypeError, "pop expected at most 2 arguments, got "\
+                              + repr(1 + len(args))
+        positions = self._exact(key)
+        if positions:
+            v = self._items[positions[0]][1]
+            self._delete(positions[:1])
+            return v
+        if args:
+            return args[0]
+        else:
+            raise KeyError(key)
+
+    def ipop(self, key, *args):
+        """ like pop but case insensitive """
+        if len(args) > 1:
+            raise TypeError, "pop expected at most 2 arguments, got "\
+                              + repr(1 + len(args))
+        positions = self._positions(key)
+        if positions:
+            v = self._items[positions[0]][1]
+            self._delete(positions[:1])
+            return v
+        if args:
+            return args[0]
+        else:
+            raise KeyError(key)
+
+    def popitem(self):
+        k, v = self._items.pop()
+        if self._index is not None:
+            self._index[k.lower()].pop()
+        return k, v
+
+    def extend(self, other=None, **kwargs):
+        if other is None:
+            pass
+        elif hasattr(other, 'items'):
+            for k, v in other.items():
+                self.add(k, v)
+        elif hasattr(other, 'keys'):
+            for k in other.keys():
+                self.add(k, other[k])
+        else:
+            for k, v in other:
+                self.add(k, v)
+        if kwargs:
+            self.update(kwargs)
+
+    def update(self, other=None, **kwargs):
+        if other is None:
+            pass
+        elif hasattr(other, 'iteritems'):
+            for k, v in other.iteritems():
+                self[k] = v
+        elif hasattr(other, 'keys'):
+            for k in other.keys():
+                self[k] = other[k]
+        else:
+            for k, v in other:
+                self[k] = v
+        if kwargs:
+            self.update(kwargs)
+
+    def __eq__(self, other):
+        if not hasattr(other, 'items'):
+            return NotImplemented
+        return dict(self._items) == dict(other.items())
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        if eq is NotImplemented:
+            return eq
+        return not eq
+
+    def __repr__(self):
+        items = ', '.join(['(%r, %r)' % v for v in self.iteritems()])
+        return '%s([%s])' % (self.__class__.__name__, items)
+
+    def __len__(self):
+        return len(self._items)
+
+    ##
+    ## All the iteration:
+    ##
+
+    def keys(self):
+        return [k for k, v in self._items]
+
+    def iterkeys(self):
+        for k, v in self._items:
+            yield k
+
+    __iter__ = iterkeys
+
+    def items(self):
+        return self._items[:]
+
+    def iteritems(self):
+        return iter(self._items)
+
+    def values(self):
+        return [v for k, v in self._items]
+
+    def itervalues(self):
+        for k, v in self._items:
+            yield v
+
+
+class LRUCache(object):
+    """
+        A mapping keeping the `maxsize` most recently used values. It's
+        safe to share between threads.
+    """
+
+    # fields of the links of the recently used list
+    PREV, NEXT, KEY, VALUE = 0, 1, 2, 3
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self._map = {}
+        # circular list, the most recently used is at the end
+        root = self._root = []
+        root[:] = [root, root, None, None]
+
+    def get(self, key, default=None):
+        self._lock.acquire()
+        try:
+            link = self._map.get(key)
+            if link is None:
+                return default
+            # move the link at the end
+            prev, next_ = link[self.PREV], link[self.NEXT]
+            prev[self.NEXT] = next_
+            next_[self.PREV] = prev
+            root = self._root
+            last = root[self.PREV]
+            last[self.NEXT] = root[self.PREV] = link
+            link[self.PREV] = last
+            link[self.NEXT] = root
+            return link[self.VALUE]
+        finally:
+            self._lock.release()
+
+    def set(self, key, value):
+        self._lock.acquire()
+        try:
+            root = self._root
+            if key in self._map:
+                link = self._map[key]
+                link[self.VALUE] = value
+                return
+            if len(self._map) >= self.maxsize:
+                # reuse the least recently used link
+                oldest = root[self.NEXT]
+                del self._map[oldest[self.KEY]]
+                root[self.NEXT] = oldest[self.NEXT]
+                oldest[self.NEXT][self.PREV] = root
+            last = root[self.PREV]
+            link = [last, root, key, value]
+            last[self.NEXT] = root[self.PREV] = link
+            self._map[key] = link
+        finally:
+            self._lock.release()
+
+    def __contains__(self, key):
+        return key in self._map
+
+    def __len__(self):
+        return len(self._map)
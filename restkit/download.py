@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+"""
+restkit.download
+~~~~~~~~~~~~~~~~
+
+Download of large resources in parallel parts using byte ranges, see
+`restkit.client.Client.download`.
+"""
+
+import ctypes
+import logging
+import mmap
+import os
+import re
+import socket
+import threading
+
+from http_parser.http import BadStatusLine, NoMoreData, ParserError
+
+from restkit.conn import CHUNK_SIZE
+from restkit.errors import RequestError, RequestFailed, RequestTimeout, \
+ResponseError
+
+log = logging.getLogger(__name__)
+
+# errors after which a part is downloaded again
+PART_ERRORS = (socket.error, RequestError, RequestTimeout, ResponseError,
+        NoMoreData, BadStatusLine, ParserError)
+
+CONTENT_RANGE_RE = re.compile(r"^bytes (\d+)-(\d+)/(\d+|\*)$")
+
+
+def split_ranges(length, parts):
+    """ return the list of (start, end) inclusive ranges of `parts`
+    parts of `length` bytes """
+    parts = max(1, min(parts, length))
+    size, extra = divmod(length, parts)
+    ranges = []
+    start = 0
+    for i in range(parts):
+        end = start + size + (i < extra and 1 or 0)
+        ranges.append((start, end - 1))
+        start = end
+    return ranges
+
+
+def download(client, url, path, parts=4, headers=None, max_part_retries=3):
+    """ download `url` into the file `path` and return its size. See
+    `restkit.client.Client.download`. """
+    headers = _identity(headers)
+
+    resp = client.request(url, 'HEAD', headers=headers)
+    accept_ranges = resp.headers.get('accept-ranges', '').lower()
+    clen = resp.headers.get('content-length', '')
+    if parts > 1 and resp.status_int == 200 and \
+            'bytes' in accept_ranges and clen.isdigit() and int(clen) > 0:
+        validator = resp.headers.get('etag') or \
+                resp.headers.get('last-modified')
+        return download_parts(client, url, path, int(clen), parts,
+                headers, validator, max_part_retries)
+
+    # no ranges, a single stream
+    resp = client.request(url, headers=headers)
+    if resp.status_int != 200:
+        raise RequestFailed(resp.body_string(), http_code=resp.status_int,
+                response=resp)
+    size = 0
+    body = resp.body_stream()
+    try:
+        with open(path, 'wb') as f:
+            for chunk in body.iter_into():
+                f.write(chunk)
+                size += len(chunk)
+    except:
+        body.abort()
+        _remove(path)
+        raise
+    return size
+
+
+def download_parts(client, url, path, length, parts, headers, validator,
+        max_part_retries=3):
+    """ download the `length` bytes of `url` into `path` with `parts`
+    concurrent range requests. Each part is written directly in its
+    region of the file mapped in memory. The file is removed if a part
+    fails. """
+    try:
+        with open(path, 'w+b') as f:
+            f.truncate(length)
+            mm = mmap.mmap(f.fileno(), length)
+            try:
+                # mmap doesn't export a writable memoryview on python 2
+                buf = memoryview((ctypes.c_char * length).from_buffer(mm))
+                errors = []
+                threads = []
+                for start, end in split_ranges(length, parts):
+                    th = threading.Thread(target=_run_part, args=(errors,
+                        client, url, headers, validator, buf, start, end,
+                        max_part_retries))
+                    th.setDaemon(True)
+                    th.start()
+                    threads.append(th)
+
+                for th in threads:
+                    th.join()
+
+                if errors:
+                    raise errors[0]
+                mm.flush()
+            finally:
+                buf = None
+                mm.close()
+    except:
+        _remove(path)
+        raise
+    return length
+
+
+def _run_part(errors, *args):
+    try:
+        download_part(*args)
+    except Exception, e:
+        errors.append(e)
+
+
+def download_part(client, url, headers, validator, buf, start, end,
+        max_retries=3):
+    """ read the bytes `start` to `end` of `url` directly in `buf`, a
+    writable memoryview of the file. The part is requested again from
+    the last byte received after an error, up to `max_retries` times. """
+    offset = start
+    tries = 0
+    while offset <= end:
+        part_headers = headers.copy()
+        part_headers['Range'] = "bytes=%s-%s" % (offset, end)
+        if validator is not None:
+            part_headers['If-Range'] = validator
+
+        try:
+            resp = client.request(url, headers=part_headers)
+            _check_part(resp, offset, end)
+            body = resp.body_stream()
+            try:
+                while offset <= end:
+                    n = body.readinto(buf[offset:min(offset + CHUNK_SIZE,
+                        end + 1)])
+                    if not n:
+                        break
+                    offset += n
+                if offset <= end:
+                    raise NoMoreData("part %s-%s incomplete" % (start,
+                        end))
+            except:
+                # don't read the rest of a broken response
+                body.abort()
+                raise
+            body.close()
+        except PART_ERRORS, e:
+            tries += 1
+            if tries > max_retries:
+                raise
+            log.info("retry part %s-%s of %s from %s: %s" % (start, end,
+                url, offset, str(e)))
+
+
+def _check_part(resp, start, end):
+    if resp.status_int != 206:
+        # the resource changed or ranges aren't supported anymore
+        resp.skip_body()
+        raise RequestFailed("range %s-%s not returned: %s" % (start, end,
+            resp.status), http_code=resp.status_int, response=resp)
+
+    match = CONTENT_RANGE_RE.match(resp.headers.get('content-range', ''))
+    if match is None or int(match.group(1)) != start:
+        resp.skip_body()
+        raise ResponseError("invalid Content-Range for %s-%s: %r" % (
+            start, end, resp.headers.get('content-range')))
+
+
+def _remove(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def _identity(headers):
+    # byte ranges apply to the encoded body, ask for the content as is.
+    result = {}
+    if hasattr(headers, 'items'):
+        headers = headers.items()
+    for k, v in headers or []:
+        if k.lower() != 'accept-encoding':
+            result[k] = v
+    result['Accept-Encoding'] = 'identity'
+    return result
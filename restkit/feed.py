@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+"""
+restkit.feed
+~~~~~~~~~~~~
+
+Consumer of long-lived streaming responses: continuous or long-polling
+feeds sending one JSON value per line, like the CouchDB ``_changes``
+feed, and Server-Sent Events streams::
+
+    from restkit.feed import Feed
+
+    feed = Feed("http://127.0.0.1:5984/db/_changes",
+            params={"feed": "continuous"}, heartbeat=10)
+    for change in feed:
+        print change["id"]
+
+The feed reconnects when the stream is interrupted, stalls or ends, and
+resumes from the last sequence (or event id) received.
+"""
+
+from collections import namedtuple
+import logging
+import socket
+import urlparse
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from http_parser.http import BadStatusLine, NoMoreData, ParserError
+from socketpool import ConnectionPool
+
+from restkit.client import Client
+from restkit.conn import Connection
+from restkit.errors import RequestError, RequestFailed, RequestTimeout, \
+ResponseError
+from restkit.util import make_uri
+
+log = logging.getLogger(__name__)
+
+# errors after which the feed reconnects
+RECONNECT_ERRORS = (socket.error, RequestError, RequestTimeout,
+        ResponseError, NoMoreData, BadStatusLine, ParserError)
+
+# a Server-Sent Event
+Event = namedtuple('Event', 'id event data')
+
+
+class Feed(object):
+    """ iterator over the events of a streaming endpoint
+
+    :param url: url of the feed
+    :param format: "lines" for feeds sending a value per line, "sse" for
+        Server-Sent Events streams.
+    :param params: dict, query parameters of the requests
+    :param since: sequence to start from. It's sent in the `since_param`
+        query parameter for lines feeds and in the Last-Event-ID header for
+        SSE streams. It's updated with the `seq_key` member of each value
+        received (or the id of each event).
+    :param since_param: name of the query parameter giving the sequence
+    :param seq_key: key of the sequence in the values of lines feeds
+    :param heartbeat: interval in seconds of the heartbeats the server
+        is asked to send, in the `heartbeat` query parameter, in
+        milliseconds. Only for lines feeds.
+    :param timeout: read deadline in seconds. If nothing, not even a
+        heartbeat, is received during this time, the feed reconnects. By
+        default twice the heartbeat or 60s.
+    :param decode: function decoding the lines, `json.loads` by default
+    :param backoff: delay before the first reconnection, doubled after
+        each failure up to `max_backoff`.
+    :param max_retries: number of consecutive failures before giving up
+        and raising the error. None means retrying forever.
+    :param headers: extra headers of the requests
+    :param client_opts: options of the `restkit.client.Client`
+
+    The feed uses its own connection, which isn't shared with other
+    clients.
+    """
+
+    def __init__(self, url, format="lines", params=None, since=None,
+            since_param="since", seq_key="seq", heartbeat=None,
+            timeout=None, decode=json.loads, backoff=0.5, max_backoff=30,
+            max_retries=None, headers=None, **client_opts):
+        if format not in ("lines", "sse"):
+            raise ValueError("unknown feed format: %r" % format)
+
+        u = urlparse.urlparse(url)
+        self.url = urlparse.urlunparse((u.scheme, u.netloc, u.path,
+            u.params, '', ''))
+        self.params = dict(urlparse.parse_qsl(u.query))
+        self.params.update(params or {})
+
+        self.format = format
+        self.since = since
+        self.since_param = since_param
+        self.seq_key = seq_key
+        self.decode = decode
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_retries = max_retries
+        self.headers = headers or {}
+
+        if heartbeat is not None and format == "lines":
+            self.params['heartbeat'] = int(heartbeat * 1000)
+        if timeout is None:
+            timeout = heartbeat and heartbeat * 2 or 60
+        self.timeout = timeout
+
+        backend = client_opts.get('backend', 'thread')
+        if 'pool' not in client_opts:
+            client_opts['pool'] = ConnectionPool(factory=Connection,
+                    max_size=1, reap_connections=False, backend=backend)
+        client_opts['timeout'] = timeout
+        self.client = Client(**client_opts)
+
+        self.closed = False
+        self._response = None
+        self._body = None
+
+    def __iter__(self):
+        failures = 0
+        while not self.closed:
+            received = False
+            try:
+                for event in self._events(self._connect()):
+                    received = True
+                    failures = 0
+                    yield event
+                if not received:
+                    failures += 1
+            except RECONNECT_ERRORS, e:
+                failures += 1
+                if self.max_retries is not None and \
+                        failures > self.max_retries:
+                    raise
+                log.info("feed %s interrupted: %s" % (self.url, str(e)))
+            finally:
+                self._disconnect()
+
+            if not self.closed and failures:
+                self.client._pool.backend_mod.sleep(self.delay(failures))
+
+    def delay(self, failures):
+        """ return the delay before reconnecting after `failures`
+        consecutive failures """
+        return min(self.max_backoff, self.backoff * 2 ** (failures - 1))
+
+    def close(self):
+        """ stop the feed and close its connection """
+        self.closed = True
+        self._disconnect()
+
+    def _connect(self):
+        params = self.params.copy()
+        headers = self.headers.copy()
+        if self.format == "sse":
+            headers['Accept'] = 'text/event-stream'
+            if self.since is not None:
+                headers['Last-Event-ID'] = self.since
+        elif self.since is not None:
+            params[self.since_param] = self.since
+
+        url = make_uri(self.url, **params)
+        resp = self.client.request(url, headers=headers)
+        self._response = resp
+        if resp.status_int >= 500:
+            raise RequestError("feed error %s" % resp.status)
+        elif resp.status_int >= 400:
+            raise RequestFailed(resp.body_string(),
+                    http_code=resp.status_int, response=resp)
+
+        # read the body directly from the connection, without tee
+        self._body = resp.body_stream()
+        return self._body
+
+    def _disconnect(self):
+        body, self._body = self._body, None
+        resp, self._response = self._response, None
+        if body is not None:
+            body.abort()
+        elif resp is not None and resp.can_read():
+            resp.close()
+
+    def _events(self, body):
+        if self.format == "sse":
+            return self._sse_events(body)
+        return self._line_events(body)
+
+    def _line_events(self, body):
+        while True:
+            line = body.readline()
+            if not line:
+                return
+            line = line.strip()
+            if not line:
+                # heartbeat
+                continue
+
+            value = self.decode(line)
+            if isinstance(value, dict):
+                if self.seq_key in value:
+                    self.since = value[self.seq_key]
+                elif 'last_seq' in value:
+                    # end of a CouchDB feed
+                    self.since = value['last_seq']
+            yield value
+
+    def _sse_events(self, body):
+        data = []
+        event_type = ""
+        while True:
+            line = body.readline()
+            if not line:
+                return
+            line = line.rstrip("\r\n")
+
+            if not line:
+                # dispatch the event
+                if data:
+                    yield Event(self.since, event_type or "message",
+                            "\n".join(data))
+                data = []
+                event_type = ""
+                continue
+            elif line.startswith(":"):
+                # comment, used as heartbeat
+                continue
+
+            field, _, value = line.partition(":")
+            if value.startswith(" "):
+                value = value[1:]
+
+            if field == "data":
+                data.append(value)
+            elif field == "event":
+                event_type = value
+            elif field == "id":
+                if "\0" not in value:
+                    self.since = value
+            elif field == "retry":
+                if value.isdigit():
+                    self.backoff = int(value) / 1000.0
@@ -11,6 +11,7 @@ except ImportError:
     from cgi import parse_qsl
 from urlparse import urlunparse
 
+from restkit.forms import FormBody
 from restkit.oauth2 import Request, SignatureMethod_HMAC_SHA1
 
 class BasicAuth(object):
@@ -82,7 +83,10 @@ class OAuthFilter(object):
                     ctype.startswith('application/x-www-form-urlencoded'):
                 # we are in a form try to get oauth params from here
                 form = True
-                params = dict(parse_qsl(request.body))
+                body = request.body
+                if isinstance(body, FormBody):
+                    body = str(body)
+                params = dict(parse_qsl(body))
             
         # update params from quey parameters    
         params.update(parse_qsl(parsed_url.query))
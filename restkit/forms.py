@@ -6,11 +6,13 @@
 
 import mimetypes
 import os
-import re
+import stat
 import urllib
 
 
-from restkit.util import to_bytestring, url_quote, url_encode
+from restkit.conn import CHUNK_SIZE
+from restkit.util import cached_quote, encode, quote, quoted_length, \
+to_bytestring, url_quote, url_encode
 
 MIME_BOUNDARY = 'END_OF_PART'
 CRLF = '\r\n'
@@ -20,13 +22,139 @@ def form_encode(obj, charset="utf8"):
     return to_bytestring(encoded)
 
 
+class FormBody(object):
+    """ application/x-www-form-urlencoded request body encoded while it's
+    sent. `params` is a dict or a list of (name, value) tuples, values
+    can be lists or callables like with `form_encode`. The body is
+    yielded by blocks of about `block_size` bytes and its exact length
+    is computed without encoding it, so large forms are never kept in
+    memory::
+
+        resource.post(payload=FormBody(fields))
+
+    Callables are called once, when the size is computed or the body
+    first iterated, and their values are reused when the body is sent
+    again so they always match the Content-Length. """
+
+    content_type = "application/x-www-form-urlencoded; charset=utf-8"
+
+    def __init__(self, params, charset="utf8", block_size=CHUNK_SIZE):
+        if hasattr(params, 'items'):
+            params = params.items()
+        self.params = params
+        self.charset = charset
+        self.block_size = block_size
+        self._size = None
+        self._called = {}
+
+    def _iter_pairs(self):
+        # (quoted name, value) tuples
+        charset = self.charset
+        called = self._called
+        for i, (k, v) in enumerate(self.params):
+            k = cached_quote(encode(k, charset))
+            if not isinstance(v, (tuple, list)):
+                v = [v]
+            for j, v1 in enumerate(v):
+                if v1 is None:
+                    v1 = ''
+                elif callable(v1):
+                    if (i, j) not in called:
+                        called[(i, j)] = encode(v1(), charset)
+                    v1 = called[(i, j)]
+                elif v1.__class__ is not str:
+                    v1 = encode(v1, charset)
+                yield k, v1
+
+    def get_size(self):
+        """ return the length of the encoded body """
+        if self._size is None:
+            size = -1
+            for k, v in self._iter_pairs():
+                # name=value&
+                size += len(k) + quoted_length(v, '', True) + 2
+            self._size = max(size, 0)
+        return self._size
+
+    def seek(self, offset, whence=0):
+        """ rewind the body, only seek(0) is supported """
+        if offset != 0 or whence != 0:
+            raise IOError("a form body can only be rewound")
+
+    def __iter__(self):
+        block_size = self.block_size
+        parts = []
+        size = 0
+        for k, v in self._iter_pairs():
+            v = quote(v, '', True)
+            if parts:
+                parts.append('&')
+            parts.extend((k, '=', v))
+            size += len(k) + len(v) + 2
+            if size >= block_size:
+                yield "".join(parts)
+                # the next block starts with the separator
+                parts = ['']
+                size = 0
+        if len(parts) > 1:
+            yield "".join(parts)
+
+    def __str__(self):
+        return "".join(self)
+
+
+def file_range(f, size=None):
+    """ return the (offset, size) tuple of the data remaining in the
+    file-like object `f`, from its current position. The size is found
+    with fstat for regular files or by seeking to the end, the position
+    is restored. It's None if it can't be known without reading the
+    data. """
+    try:
+        offset = f.tell()
+    except (AttributeError, IOError, ValueError):
+        offset = None
+    if size is not None or offset is None:
+        return offset, size
+
+    if hasattr(f, 'fileno'):
+        try:
+            fst = os.fstat(f.fileno())
+            if stat.S_ISREG(fst.st_mode):
+                try:
+                    f.flush()
+                except (AttributeError, IOError):
+                    pass
+                return offset, os.fstat(f.fileno()).st_size - offset
+        except (AttributeError, IOError, OSError, ValueError):
+            pass
+
+    if hasattr(f, 'seek'):
+        try:
+            f.seek(0, 2)
+            end = f.tell()
+            f.seek(offset)
+            return offset, end - offset
+        except (IOError, ValueError):
+            pass
+    return offset, None
+
+
 class BoundaryItem(object):
     def __init__(self, name, value, fname=None, filetype=None, filesize=None,
                  quote=url_quote):
         self.quote = quote
         self.name = quote(name)
-        if value is not None and not hasattr(value, 'read'):
-            value = self.encode_unreadable_value(value)
+        self.offset = None
+        if hasattr(value, 'read'):
+            self.offset, self.size = file_range(value, filesize)
+            if self.size is None:
+                # size unknown (pipe, generated stream...), keep the value
+                # in memory
+                value = value.read()
+        if not hasattr(value, 'read'):
+            if value is None:
+                value = ""
+            value = to_bytestring(self.encode_unreadable_value(value))
             self.size = len(value)
         self.value = value
         if fname is not None:
@@ -39,13 +167,6 @@ class BoundaryItem(object):
             filetype = to_bytestring(filetype)
         self.filetype = filetype
 
-        if isinstance(value, file) and filesize is None:
-            try:
-                value.flush()
-            except IOError:
-                pass
-            self.size = int(os.fstat(value.fileno())[6])
-
         self._encoded_hdr = None
         self._encoded_bdr = None
 
@@ -74,23 +195,61 @@ class BoundaryItem(object):
 
     def encode(self, boundary):
         """Returns the string encoding of this parameter"""
+        return "".join(self.iter_encode(boundary))
+
+    def iter_value(self, blocksize=16384):
+        """ iterate over the value by blocks of at most `blocksize`
+        bytes. A file is read from its initial position, so the value can
+        be iterated again when a request is retried. """
         value = self.value
-        if re.search("^--%s$" % re.escape(boundary), value, re.M):
-            raise ValueError("boundary found in encoded string")
+        if not hasattr(value, 'read'):
+            yield value
+            return
 
-        return "%s%s%s" % (self.encode_hdr(boundary), value, CRLF)
+        if self.offset is not None:
+            value.seek(self.offset)
+        remaining = self.size
+        while remaining > 0:
+            block = value.read(min(blocksize, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
 
     def iter_encode(self, boundary, blocksize=16384):
-        if not hasattr(self.value, "read"):
-            yield self.encode(boundary)
+        """ iterate over the header, the value (by blocks for files) and
+        the final CRLF of the encoded parameter. A ValueError is raised if
+        a line of the value starts with the boundary. Only the end of the
+        previous block is kept to look for it across blocks. """
+        yield self.encode_hdr(boundary)
+
+        marker = "\n--" + boundary
+        keep = len(marker) - 1
+        # the start of the value is the start of a line
+        tail = "\n"
+        for block in self.iter_value(blocksize):
+            if marker in tail + block[:keep] or marker in block:
+                raise ValueError("boundary found in encoded string")
+            if len(block) >= keep:
+                tail = block[len(block) - keep:]
+            else:
+                tail = (tail + block)[-keep:]
+            yield block
+        yield CRLF
+
+    def send(self, conn, boundary, chunked=False):
+        """ send the encoded parameter on the connection `conn`. Regular
+        files are sent with `restkit.conn.Connection.sendfile`, without
+        being read when possible, and aren't checked for the boundary. """
+        value = self.value
+        if self.offset is not None and conn.can_sendfile(value, chunked):
+            conn.send(self.encode_hdr(boundary), chunked)
+            value.seek(self.offset)
+            conn.sendfile(value, chunked, self.size)
+            conn.send(CRLF, chunked)
         else:
-            yield self.encode_hdr(boundary)
-            while True:
-                block = self.value.read(blocksize)
-                if not block:
-                    yield CRLF
-                    return
-                yield block
+            for block in self.iter_encode(boundary):
+                conn.send(block, chunked)
 
     def encode_unreadable_value(self, value):
             return value
@@ -110,13 +269,11 @@ class MultipartForm(object):
         for param in params:
             name, value = param
             if hasattr(value, "read"):
-                fname = getattr(value, 'name')
+                fname = getattr(value, 'name', None)
                 if fname is not None:
                     filetype = ';'.join(filter(None, mimetypes.guess_type(fname)))
                 else:
                     filetype = None
-                if not isinstance(value, file) and self._clen is None:
-                    value = value.read()
 
                 boundary = bitem_cls(name, value, fname, filetype, quote=quote)
                 self.boundaries.append(boundary)
@@ -144,6 +301,12 @@ class MultipartForm(object):
                 yield block
         yield self.tboundary
 
+    def send(self, conn, chunked=False):
+        """ send the form on the connection `conn` """
+        for boundary in self.boundaries:
+            boundary.send(conn, self.boundary, chunked)
+        conn.send(self.tboundary, chunked)
+
 
 def multipart_form_encode(params, headers, boundary, quote=url_quote):
     """Creates a tuple with MultipartForm instance as body and dict as headers
@@ -18,6 +18,7 @@ RequestFailed, ResourceGone
 from restkit.client import Client
 from restkit.filters import BasicAuth
 from restkit import util
+from restkit.uritemplate import URITemplate
 from restkit.wrappers import Response
 
 class Resource(object):
@@ -71,6 +72,9 @@ class Resource(object):
         self.client_opts = client_opts
         self.client = Client(**self.client_opts)
 
+        # compiled uri templates, see template
+        self._templates = {}
+
     def __repr__(self):
         return '<%s %s>' % (self.__class__.__name__, self.uri)
 
@@ -81,10 +85,9 @@ class Resource(object):
 
             resr2 = res.clone()
 
+        The clone shares the client and the filters of the resource.
         """
-        obj = self.__class__(self.initial['uri'],
-                **self.initial['client_opts'])
-        return obj
+        return self._view(self.uri, self.initial['uri'])
 
     def __call__(self, path):
         """if you want to add a path to resource uri, you can do:
@@ -92,14 +95,62 @@ class Resource(object):
         .. code-block:: python
 
             Resource("/path").get()
+
+        The child resource shares the client and the filters of the
+        resource, only `path` is encoded.
         """
+        suffix = util.make_uri("", path, charset=self.charset,
+                        safe=self.safe, encode_keys=self.encode_keys)
+        return self._view(_join_path(self.uri, suffix),
+                _join_path(self.initial['uri'], suffix))
+
+    def template(self, path):
+        """ return the compiled `restkit.uritemplate.URITemplate` of the
+        path template `path`, relative to the resource uri. Templates are
+        compiled once per resource. The template can be passed as the
+        path of a request, its variables are taken from the parameters
+        and the others are sent in the query string::
+
+            doc = res.template("/{docid}/{attachment}")
+            res.get(doc, docid="a", attachment="b.txt", rev="1-abc")
+
+        The route label of these requests, used by
+        `restkit.contrib.metrics`, is the path of the resource followed
+        by the template: ``/db/{docid}/{attachment}``. """
+        template = self._templates.get(path)
+        if template is None:
+            template = URITemplate(path, self.charset)
+            route = urlparse.urlparse(self.uri).path.rstrip("/")
+            if path[:1] in ("/", "?", "#") or \
+                    path[:2] in ("{/", "{?", "{&", "{#"):
+                template.route = route + path
+            else:
+                template.route = route + "/" + path
+            self._templates[path] = template
+        return template
 
-        uri = self.initial['uri']
+    def make_uris(self, paths, params_dict=None, **params):
+        """ return the list of the uris of the children `paths` of the
+        resource, with the query parameters `params`::
 
-        new_uri = util.make_uri(uri, path, charset=self.charset,
-                        safe=self.safe, encode_keys=self.encode_keys)
+            uris = res.make_uris(["doc1", "doc2"], rev="1-abc")
 
-        obj = type(self)(new_uri, **self.initial['client_opts'])
+        It's faster than calling `make_uri` for each path. """
+        params = params or {}
+        params.update(params_dict or {})
+        return util.make_uris(self.uri, paths, charset=self.charset,
+                safe=self.safe, encode_keys=self.encode_keys,
+                **self.make_params(params))
+
+    def _view(self, uri, initial_uri):
+        # shallow copy, the constructor isn't called again
+        obj = copy(self)
+        obj.uri = uri
+        obj._templates = {}
+        obj.initial = dict(
+            uri = initial_uri,
+            client_opts = self.initial['client_opts']
+        )
         return obj
 
     def get(self, path=None, headers=None, params_dict=None, **params):
@@ -130,27 +181,31 @@ class Resource(object):
                 params_dict=params_dict, **params)
 
     def post(self, path=None, payload=None, headers=None,
-            params_dict=None, **params):
+            params_dict=None, compress=None, **params):
         """ HTTP POST
 
         - payload: string passed to the body of the request
         - path: string  additionnal path to the uri
         - headers: dict, optionnal headers that will
             be added to HTTP request.
+        - compress: boolean, compress the payload with gzip. By default
+            the `compress` option of the client is used.
         - params: Optionnal parameterss added to the request
         """
 
         return self.request("POST", path=path, payload=payload,
-                        headers=headers, params_dict=params_dict, **params)
+                        headers=headers, params_dict=params_dict,
+                        compress=compress, **params)
 
     def put(self, path=None, payload=None, headers=None,
-            params_dict=None, **params):
+            params_dict=None, compress=None, **params):
         """ HTTP PUT
 
         see POST for params description.
         """
         return self.request("PUT", path=path, payload=payload,
-                        headers=headers, params_dict=params_dict, **params)
+                        headers=headers, params_dict=params_dict,
+                        compress=compress, **params)
 
     def make_params(self, params):
         return params or {}
@@ -162,7 +217,7 @@ class Resource(object):
         return True
 
     def request(self, method, path=None, payload=None, headers=None,
-        params_dict=None, **params):
+        params_dict=None, compress=None, **params):
         """ HTTP request
 
         This method may be the only one you want to override when
@@ -173,21 +228,38 @@ class Resource(object):
         - headers: dict, optionnal headers that will
             be added to HTTP request.
         :params_dict: Options parameters added to the request as a dict
+        - compress: boolean, compress the payload with gzip
         - params: Optionnal parameterss added to the request
         """
 
         params = params or {}
         params.update(params_dict or {})
 
+        route = None
+        base = self.uri
+        if isinstance(path, URITemplate):
+            route = path.route
+            values = {}
+            for name in path.variables:
+                if name in params:
+                    values[name] = params.pop(name)
+            # the expanded path is already quoted
+            expanded = path.expand(values)
+            if expanded[:1] not in ("", "/", "?", "#"):
+                expanded = "/" + expanded
+            base = _join_path(base, expanded)
+            path = None
+
         while True:
-            uri = util.make_uri(self.uri, path, charset=self.charset,
+            uri = util.make_uri(base, path, charset=self.charset,
                         safe=self.safe, encode_keys=self.encode_keys,
                         **self.make_params(params))
 
             # make request
 
             resp = self.client.request(uri, method=method, body=payload,
-                        headers=self.make_headers(headers))
+                        headers=self.make_headers(headers),
+                        compress=compress, route=route)
 
             if resp is None:
                 # race condition
@@ -223,3 +295,12 @@ class Resource(object):
                                     charset=self.charset,
                                     safe=self.safe,
                                     encode_keys=self.encode_keys)
+
+
+def _join_path(base, suffix):
+    # like util.make_uri(base, path) with the path already encoded
+    if not suffix:
+        return base
+    if base.endswith("/") and suffix.startswith("/"):
+        base = base[:-1]
+    return base + suffix
@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+"""
+restkit.streaming
+~~~~~~~~~~~~~~~~~
+
+Incremental decoding of response bodies. Data is read by blocks and
+decoded as it arrives, so memory used depends on the size of the items
+decoded and not on the size of the body.
+"""
+
+from array import array
+import csv
+from operator import itemgetter
+import re
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from restkit.conn import CHUNK_SIZE
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+ERROR_POS = re.compile(r'\(char (\d+)')
+
+# formats of iter_batches
+BATCH_FORMATS = ("ndjson", "csv")
+
+# a decoding error at less than this number of characters from the end
+# of the buffer may come from a value cut at the end of a block, like a
+# literal or an escape sequence.
+MAX_TOKEN_SIZE = 16
+
+
+class JSONStream(object):
+    """ JSON values decoded one by one from the file-like object `f` """
+
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size=0):
+        """ append at least `size` bytes to the buffer. Return False at
+        EOF. """
+        if self.eof:
+            return False
+        data = self.f.read(max(size, self.chunk_size))
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """ return the next character which isn't a whitespace, an empty
+        string at EOF """
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, chars):
+        """ consume the next character, one of `chars` """
+        c = self.peek()
+        if not c or c not in chars:
+            raise ValueError("Expecting one of %r, got %r" % (chars, c))
+        self.pos += 1
+        return c
+
+    def decode(self):
+        """ decode the next value """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except ValueError, e:
+                # the value isn't complete, read at least as much as
+                # what is buffered to not decode it again each block.
+                if not self.truncated(e) or \
+                        not self.fill(len(self.buf) - self.pos):
+                    raise
+                continue
+
+            if end == len(self.buf) and self.fill():
+                # a number may continue in the next block
+                continue
+            self.pos = end
+            return value
+
+    def truncated(self, error):
+        """ return True if the decoding `error` may be caused by the end
+        of the buffer, False if the document is invalid """
+        msg = str(error)
+        if msg.startswith(("Unterminated string", "end is out of bounds")):
+            return True
+        pos = getattr(error, 'pos', None)
+        if pos is None:
+            match = ERROR_POS.search(msg)
+            if match is not None:
+                pos = int(match.group(1))
+            else:
+                pos = self.error_pos()
+        return pos >= len(self.buf) - MAX_TOKEN_SIZE
+
+    def error_pos(self):
+        """ return the position of the decoding error of the current
+        value. The C scanner doesn't give it for errors in the values of
+        objects, so the value is decoded again with the Python one. """
+        decoder = json.JSONDecoder()
+        decoder.scan_once = json.scanner.py_make_scanner(decoder)
+        try:
+            decoder.raw_decode(self.buf, self.pos)
+        except ValueError, e:
+            match = ERROR_POS.search(str(e))
+            if match is not None:
+                return int(match.group(1))
+        # the value can't start at the current position
+        return self.pos
+
+    def find_key(self, key):
+        """ move to the value of `key` in the current object. Return False
+        if the object has no such key. """
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return False
+
+        while True:
+            name = self.decode()
+            self.expect(":")
+            if name == key:
+                return True
+            # skip the value
+            self.decode()
+            if self.expect(",}") == "}":
+                return False
+
+    def iter_items(self):
+        """ iterate over the elements of the current array """
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+
+        while True:
+            yield self.decode()
+            if self.expect(",]") == "]":
+                return
+
+
+def iter_json(f, path="rows.item", chunk_size=CHUNK_SIZE):
+    """ iterate over the JSON values found at `path` in the JSON document
+    read from the file-like object `f`.
+
+    `path` is a list of object keys separated by dots. If it ends with
+    ``item``, the elements of the array at this path are yielded one by
+    one, as soon as they are read, else the value at `path` is yielded.
+    Nothing is yielded when the path isn't found::
+
+        # {"total_rows": 2, "rows": [{"id": "a"}, {"id": "b"}]}
+        for row in iter_json(f, "rows.item"):
+            print row["id"]
+    """
+    keys = path and path.split(".") or []
+    items = bool(keys) and keys[-1] == "item"
+    if items:
+        keys = keys[:-1]
+
+    stream = JSONStream(f, chunk_size)
+    for key in keys:
+        if not stream.find_key(key):
+            return
+
+    if items:
+        for value in stream.iter_items():
+            yield value
+    else:
+        yield stream.decode()
+
+
+def iter_line_batches(f, batch_size=1000, block_size=CHUNK_SIZE * 16,
+        header=False):
+    """ iterate over lists of at most `batch_size` lines read from the
+    file-like object `f` by blocks of `block_size` bytes. Lines are split
+    across blocks boundaries, empty lines are skipped. If `header` is
+    True, the first line is yielded alone, before the batches. """
+    pending = ""
+    batch = []
+    while True:
+        data = f.read(block_size)
+        if not data:
+            break
+
+        if pending:
+            data = pending + data
+        cut = data.rfind("\n") + 1
+        if not cut:
+            pending = data
+            continue
+        pending = data[cut:]
+        batch.extend(filter(None, data[:cut].splitlines()))
+
+        if header and batch:
+            header = False
+            yield batch[:1]
+            del batch[:1]
+
+        while len(batch) >= batch_size:
+            yield batch[:batch_size]
+            del batch[:batch_size]
+
+    if pending:
+        batch.append(pending)
+    if header and batch:
+        yield batch[:1]
+        del batch[:1]
+    while batch:
+        yield batch[:batch_size]
+        del batch[:batch_size]
+
+
+def _to_column(values, typecode, use_numpy):
+    if typecode is None:
+        return list(values)
+    if use_numpy:
+        return numpy.array(values, dtype=typecode)
+    if isinstance(values[0], basestring):
+        # values read from a csv file
+        convert = typecode in "fd" and float or int
+        values = map(convert, values)
+    return array(typecode, values)
+
+
+def iter_batches(f, format="ndjson", batch_size=1000, columns=None,
+        use_numpy=False, header=True, block_size=CHUNK_SIZE * 16,
+        **csv_args):
+    """ iterate over the records of the NDJSON or CSV document read from
+    the file-like object `f`, by batches of `batch_size` records. Each
+    batch is decoded at once.
+
+    Without `columns`, a batch is a list of records: decoded JSON values
+    for ndjson, lists of strings for csv. The first line of a csv
+    document is skipped when `header` is True. Extra named arguments are
+    passed to `csv.reader`. Quoted csv fields can't contain new lines.
+
+    `columns` is a list of ``(name, typecode)`` tuples or a dict. Batches
+    are then dicts of columns: `array.array` of `typecode` (NumPy arrays
+    with `use_numpy`), or lists when the typecode is None. For csv,
+    names are looked up in the header, or are column indexes::
+
+        for batch in iter_batches(f, "csv", columns={"price": "d"}):
+            total += sum(batch["price"])
+    """
+    if format not in BATCH_FORMATS:
+        raise ValueError("unknown format: %r" % format)
+    if use_numpy and numpy is None:
+        raise ImportError("numpy isn't installed")
+
+    if columns is not None and hasattr(columns, "items"):
+        columns = columns.items()
+
+    header = header and format == "csv"
+    fields = None
+    for lines in iter_line_batches(f, batch_size, block_size, header):
+        if format == "ndjson":
+            records = json.loads("[%s]" % ",".join(lines))
+        else:
+            records = list(csv.reader(lines, **csv_args))
+            if header and fields is None:
+                fields = records[0]
+                continue
+
+        if columns is None:
+            yield records
+            continue
+
+        batch = {}
+        if format == "ndjson":
+            for name, typecode in columns:
+                batch[name] = _to_column(map(itemgetter(name), records),
+                        typecode, use_numpy)
+        else:
+            transposed = zip(*records)
+            for name, typecode in columns:
+                if isinstance(name, int):
+                    idx = name
+                elif fields is not None:
+                    idx = fields.index(name)
+                else:
+                    raise ValueError("columns of a csv document without"
+                            " header are indexes")
+                batch[name] = _to_column(transposed[idx], typecode,
+                        use_numpy)
+        yield batch
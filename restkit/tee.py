@@ -19,6 +19,7 @@ except ImportError:
 import tempfile
 
 from restkit import conn
+from restkit.buffers import iter_into
 
 class TeeInput(object):
 
@@ -117,6 +118,41 @@ class TeeInput(object):
                 break
         return buf.getvalue()
 
+    def readinto(self, b):
+        """ read data into the writable buffer `b` and return the number
+        of bytes read. Data is read from the stream directly in `b`, then
+        written to the temporary file. """
+        if not len(b):
+            return 0
+
+        tmp = self.tmp
+        pos = tmp.tell()
+        tmp.seek(0, 2)
+        if pos < tmp.tell() or self.eof:
+            # data already teed
+            tmp.seek(pos)
+            if hasattr(tmp, 'readinto'):
+                return tmp.readinto(b)
+            data = tmp.read(len(b))
+        elif not hasattr(self.stream, 'readinto'):
+            data = self._tee(len(b))
+        else:
+            n = self.stream.readinto(b)
+            if not n:
+                self._finalize()
+                return 0
+            tmp.write(memoryview(b)[:n])
+            tmp.flush()
+            return n
+
+        n = len(data)
+        b[:n] = data
+        return n
+
+    def iter_into(self, buf=None):
+        """ like `restkit.wrappers.BodyWrapper.iter_into` """
+        return iter_into(self.readinto, buf)
+
     def readlines(self, sizehint=0):
         total = 0
         lines = []
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+"""
+restkit.timings
+~~~~~~~~~~~~~~~
+
+Per-request phase timings. When timings are enabled on a client
+(``Client(record_timings=True)``), each request carries a
+`RequestTimings` instance, available on the response as
+``response.timings``.
+"""
+
+import sys
+import time
+
+
+def _linux_monotonic():
+    """ return a function reading CLOCK_MONOTONIC with clock_gettime, or
+    None if it isn't available """
+    try:
+        import ctypes
+        import ctypes.util
+    except ImportError:
+        return None
+
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    for name in ('c', 'rt'):
+        path = ctypes.util.find_library(name)
+        if path is None:
+            continue
+        try:
+            clock_gettime = ctypes.CDLL(path, use_errno=True).clock_gettime
+        except (OSError, AttributeError):
+            continue
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+        break
+    else:
+        return None
+
+    CLOCK_MONOTONIC = 1
+    byref = ctypes.byref
+
+    def monotonic():
+        # the GIL is released during the call, a struct by call
+        ts = timespec()
+        if clock_gettime(CLOCK_MONOTONIC, byref(ts)) != 0:
+            raise OSError(ctypes.get_errno(), "clock_gettime failed")
+        return ts.tv_sec + ts.tv_nsec * 1e-9
+    return monotonic
+
+# Phase durations are differences of timestamps, so the clock must not
+# step. Python 2 has no time.monotonic: CLOCK_MONOTONIC is read with
+# ctypes on Linux. Elsewhere the wall clock is used and durations can be
+# wrong, even negative, if the system time changes during a request.
+now = getattr(time, 'monotonic', None)
+if now is None and sys.platform.startswith('linux'):
+    now = _linux_monotonic()
+if now is None:
+    now = time.time
+
+
+class RequestTimings(object):
+    """ timestamps of each phase of a request.
+
+    All timestamps are taken with `restkit.timings.now` and are None
+    until the phase has been reached:
+
+    - start: the request has been created
+    - checkout_start, checkout_end: waiting for a connection from the
+      pool (including DNS, TCP connect and TLS handshake for a new
+      connection)
+    - dns_start, dns_end, connect_end, tls_end: connection
+      establishment, only set when a new connection has been created
+    - headers_sent, body_sent: request sent
+    - first_byte: first byte of the response received
+    - body_done: response body fully read and connection released
+
+    It also keeps if the connection has been reused, the number of
+    retries and redirections, and the number of bytes of the body sent
+    (`bytes_sent`, chunks framing included) and received (`bytes_received`,
+    before decompression).
+    """
+
+    __slots__ = ('start', 'checkout_start', 'checkout_end', 'dns_start',
+            'dns_end', 'connect_end', 'tls_end', 'headers_sent',
+            'body_sent', 'first_byte', 'body_done', 'reused', 'retries',
+            'redirects', 'bytes_sent', 'bytes_received')
+
+    def __init__(self):
+        self.start = now()
+        self.checkout_start = None
+        self.checkout_end = None
+        self.dns_start = None
+        self.dns_end = None
+        self.connect_end = None
+        self.tls_end = None
+        self.headers_sent = None
+        self.body_sent = None
+        self.first_byte = None
+        self.body_done = None
+        self.reused = False
+        self.retries = 0
+        self.redirects = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def __repr__(self):
+        return "<%s %r>" % (self.__class__.__name__, self.durations())
+
+    def set_connection(self, conn):
+        """ the connection has been acquired """
+        self.checkout_end = now()
+        self.reused = conn.nb_requests > 0
+        if self.reused:
+            self.dns_start = self.dns_end = None
+            self.connect_end = self.tls_end = None
+        else:
+            (self.dns_start, self.dns_end, self.connect_end,
+                    self.tls_end) = conn.connect_timings
+
+    def mark_first_byte(self):
+        if self.first_byte is None:
+            self.first_byte = now()
+
+    def durations(self):
+        """ return a dict of phase durations in seconds. Phases not
+        reached are omitted. """
+        d = {}
+        _delta(d, 'checkout', self.checkout_start, self.checkout_end)
+        _delta(d, 'dns', self.dns_start, self.dns_end)
+        _delta(d, 'connect', self.dns_end, self.connect_end)
+        _delta(d, 'tls', self.connect_end, self.tls_end)
+        _delta(d, 'send', self.checkout_end, self.body_sent)
+        _delta(d, 'wait', self.body_sent, self.first_byte)
+        _delta(d, 'receive', self.first_byte, self.body_done)
+        _delta(d, 'total', self.start, self.body_done or self.first_byte)
+        return d
+
+    def as_dict(self):
+        return dict((k, getattr(self, k)) for k in self.__slots__)
+
+
+def _delta(d, name, t0, t1):
+    if t0 is not None and t1 is not None:
+        d[name] = t1 - t0
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+"""
+restkit.uritemplate
+~~~~~~~~~~~~~~~~~~~
+
+URI templates (RFC 6570, up to level 3: simple, reserved and fragment
+expansions, labels, path segments, path parameters and queries, with
+several variables per expression)::
+
+    >>> t = URITemplate("/{db}/{docid}{?rev}")
+    >>> t.expand({"db": "test", "docid": "a b", "rev": "1-abc"})
+    '/test/a%20b?rev=1-abc'
+
+A template is compiled once in a list of literal parts and expressions,
+expanding it only quotes the values. The template string itself is a low
+cardinality label of the urls it builds, see `restkit.resource.Resource`.
+"""
+
+import re
+
+from restkit.util import quote
+
+EXPRESSION_RE = re.compile(r"\{([^{}]*)\}")
+VARNAME_RE = re.compile(r"^(?:[A-Za-z0-9_]|%[0-9A-Fa-f]{2})"
+        r"(?:\.?(?:[A-Za-z0-9_]|%[0-9A-Fa-f]{2}))*$")
+
+# characters allowed unquoted, besides ALWAYS_SAFE
+UNRESERVED = "~"
+RESERVED = UNRESERVED + ":/?#[]@!$&'()*+,;="
+
+# operator: (first, separator, named, if empty, safe characters)
+OPERATORS = {
+    "": ("", ",", False, "", UNRESERVED),
+    "+": ("", ",", False, "", RESERVED),
+    "#": ("#", ",", False, "", RESERVED),
+    ".": (".", ".", False, "", UNRESERVED),
+    "/": ("/", "/", False, "", UNRESERVED),
+    ";": (";", ";", True, "", UNRESERVED),
+    "?": ("?", "&", True, "=", UNRESERVED),
+    "&": ("&", "&", True, "=", UNRESERVED)
+}
+
+
+class URITemplate(object):
+    """ compiled URI template. `variables` is the list of the names of
+    its variables, `route` the label of the urls built, by default the
+    template. """
+
+    def __init__(self, template, charset="utf-8"):
+        self.template = template
+        self.route = template
+        self.charset = charset
+        self.variables = []
+        self.parts = []
+
+        pos = 0
+        for m in EXPRESSION_RE.finditer(template):
+            if m.start() > pos:
+                self.parts.append(template[pos:m.start()])
+            self.parts.append(self._compile(m.group(1)))
+            pos = m.end()
+        if pos < len(template):
+            self.parts.append(template[pos:])
+
+        for part in self.parts:
+            if isinstance(part, basestring) and ("{" in part or "}" in part):
+                raise ValueError("invalid URI template: %r" % template)
+
+    def _compile(self, expression):
+        op = expression[:1]
+        if op in OPERATORS and op:
+            names = expression[1:]
+        elif op in "=,!@|":
+            raise ValueError("unsupported operator in URI template: %r"
+                    % expression)
+        else:
+            op = ""
+            names = expression
+
+        names = names.split(",")
+        for name in names:
+            if not VARNAME_RE.match(name):
+                raise ValueError("invalid variable in URI template: %r"
+                        % expression)
+        self.variables.extend([n for n in names if n not in self.variables])
+        return (names,) + OPERATORS[op]
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, self.template)
+
+    def _quote(self, value, safe):
+        if isinstance(value, unicode):
+            value = value.encode(self.charset)
+        elif not isinstance(value, str):
+            value = str(value)
+        return quote(value, safe)
+
+    def expand(self, values):
+        """ return the uri built with the dict `values`. Undefined
+        variables, None or missing from `values`, are skipped. Lists are
+        joined with commas. """
+        result = []
+        for part in self.parts:
+            if isinstance(part, basestring):
+                result.append(part)
+                continue
+
+            names, first, sep, named, ifemp, safe = part
+            expanded = []
+            for name in names:
+                value = values.get(name)
+                if value is None:
+                    continue
+                if isinstance(value, (list, tuple)):
+                    if not value:
+                        continue
+                    value = ",".join([self._quote(v, safe) for v in value])
+                else:
+                    value = self._quote(value, safe)
+
+                if named:
+                    if value:
+                        value = "%s=%s" % (name, value)
+                    else:
+                        value = name + ifemp
+                expanded.append(value)
+
+            if expanded:
+                result.append(first + sep.join(expanded))
+        return "".join(result)
@@ -3,6 +3,7 @@
 # This file is part of restkit released under the MIT license. 
 # See the NOTICE for more information.
 
+import mmap
 import os
 import re
 import time
@@ -11,9 +12,23 @@ import urlparse
 import warnings
 import Cookie
 
+from restkit.datastructures import LRUCache
 from restkit.errors import InvalidUrl
 
-absolute_http_url_re = re.compile(r"^https?://", re.I)
+absolute_http_url_re = re.compile(r"^(https?|http\+unix)://", re.I)
+
+# end of the netloc of an url
+netloc_end_re = re.compile(r"[/?#]")
+
+# scheme of urls to an HTTP server listening on a unix socket. The netloc
+# is the percent-encoded path of the socket:
+# http+unix://%2Fvar%2Frun%2Fcouchdb.sock/db
+UNIX_SCHEME = "http+unix"
+
+# let urlparse join and split these urls like http ones
+for _l in (urlparse.uses_relative, urlparse.uses_netloc):
+    if UNIX_SCHEME not in _l:
+        _l.append(UNIX_SCHEME)
 
 try:#python 2.6, use subprocess
     import subprocess
@@ -62,6 +77,11 @@ def http_date(timestamp=None):
     return s
 
 def parse_netloc(uri):
+    """ return the (host, port) tuple of a parsed url. For unix socket
+    urls, the tuple is (path of the socket, None) """
+    if uri.scheme == UNIX_SCHEME:
+        return (urllib.unquote(uri.netloc), None)
+
     host = uri.netloc
     port = None
     i = host.rfind(':')
@@ -83,6 +103,93 @@ def parse_netloc(uri):
         host = host[1:-1]
     return (host, port)
 
+class URL(urlparse.ParseResult):
+    """ a parsed url. It's a `urlparse.ParseResult`, as returned by
+    `urlparse.urlparse`, with the attributes:
+
+    - `address`: the (host, port) tuple returned by `parse_netloc`
+    - `target`: the request target, the path with the query string
+
+    URL instances are shared, they must not be modified. `_replace`
+    returns a new `urlparse.ParseResult`. """
+
+    def __new__(cls, url):
+        return cls._from_parts(urlparse.urlparse(url))
+
+    @classmethod
+    def _from_parts(cls, parts, base=None):
+        """ return the URL of the parsed url `parts`. The address is
+        taken from the `base` URL with the same scheme and netloc. """
+        self = super(URL, cls).__new__(cls, *parts)
+        self.target = urlparse.urlunparse(('', '', self.path or '/',
+            self.params, self.query, self.fragment))
+        self._address = None
+        self._base = base
+        return self
+
+    @classmethod
+    def _make(cls, iterable):
+        return urlparse.ParseResult._make(iterable)
+
+    def __reduce__(self):
+        return (URL, (self.geturl(),))
+
+    def _address__get(self):
+        # computed on use since an invalid port raises an error
+        if self._address is None:
+            if self._base is not None:
+                self._address = self._base.address
+            else:
+                self._address = parse_netloc(self)
+        return self._address
+    address = property(_address__get)
+
+_bases = LRUCache(256)
+
+def parse_url(url):
+    """ return the `URL` of `url`. The scheme and the netloc of the
+    urls are kept in a LRU cache shared by the process, so only the path
+    of an url to a known server is parsed. """
+    i = url.find('://')
+    if i <= 0:
+        return URL(url)
+    m = netloc_end_re.search(url, i + 3)
+    end = m and m.start() or len(url)
+    path = url[end:]
+    if path[:2] == '//':
+        # it would be parsed as a netloc
+        return URL(url)
+
+    key = (type(url), url[:end])
+    base = _bases.get(key)
+    if base is None:
+        base = URL(url[:end])
+        _bases.set(key, base)
+    parts = urlparse.urlparse(path, base.scheme)
+    return URL._from_parts((base.scheme, base.netloc) + parts[2:], base)
+
+# objects supporting the buffer protocol accepted as request bodies. They
+# are sent without being copied.
+BUFFER_TYPES = (bytearray, memoryview, buffer, mmap.mmap)
+
+def buffer_length(b):
+    """ return the size in bytes of the buffer `b` """
+    if isinstance(b, memoryview):
+        return len(b) * b.itemsize
+    return len(b)
+
+def iter_buffer(b, size):
+    """ iterate over the buffer `b` by slices of about `size` bytes. The
+    slices are read-only buffers sharing the memory of `b`, except for
+    memoryviews which can't be wrapped by a buffer on Python 2. """
+    if isinstance(b, memoryview):
+        step = max(1, size // b.itemsize)
+        for i in xrange(0, len(b), step):
+            yield b[i:i + step].tobytes()
+    else:
+        for i in xrange(0, len(b), size):
+            yield buffer(b, i, size)
+
 def to_bytestring(s):
     if not isinstance(s, basestring):
         raise TypeError("value should be a str or unicode")
@@ -91,39 +198,105 @@ def to_bytestring(s):
         return s.encode('utf-8')
     return s
     
+# characters never quoted by urllib.quote
+ALWAYS_SAFE = ('ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+               'abcdefghijklmnopqrstuvwxyz'
+               '0123456789' '_.-')
+
+_quote_tables = {}
+
+def _quote_table(safe, plus=False):
+    """ return the table giving the quoted value of each byte """
+    table = _quote_tables.get((safe, plus))
+    if table is None:
+        safe_chars = ALWAYS_SAFE + safe
+        table = {}
+        for i in range(256):
+            c = chr(i)
+            if c in safe_chars:
+                table[c] = c
+            else:
+                table[c] = '%%%02X' % i
+        if plus:
+            table[' '] = '+'
+        _quote_tables[(safe, plus)] = table
+    return table
+
+def quote(s, safe='/', plus=False):
+    """ like urllib.quote, or urllib.quote_plus if `plus` is True, for a
+    bytestring """
+    if not s.rstrip(ALWAYS_SAFE + safe):
+        return s
+    return ''.join(map(_quote_table(safe, plus).__getitem__, s))
+
+def quoted_length(s, safe='/', plus=False):
+    """ return the length of ``quote(s, safe, plus)`` without quoting
+    `s` """
+    if plus:
+        safe += ' '
+    # each byte deleted is quoted on 3 bytes
+    return len(s) + 2 * len(s.translate(None, ALWAYS_SAFE + safe))
+
+# quoted path segments and query keys. Only the QUOTE_CACHE_SIZE most
+# recently used values are kept: when the cache is full it becomes the
+# old generation, values still used are moved back from it.
+QUOTE_CACHE_SIZE = 2048
+_quoted = {}
+_quoted_old = {}
+
+def cached_quote(s, safe='/'):
+    """ `quote` memoized for values used repeatedly (path segments,
+    parameter names) """
+    global _quoted, _quoted_old
+    key = (s, safe)
+    quoted = _quoted.get(key)
+    if quoted is None:
+        quoted = _quoted_old.get(key)
+        if quoted is None:
+            quoted = quote(s, safe)
+        if len(_quoted) >= QUOTE_CACHE_SIZE:
+            _quoted_old, _quoted = _quoted, {}
+        _quoted[key] = quoted
+    return quoted
+
 def url_quote(s, charset='utf-8', safe='/:'):
     """URL encode a single string with a given encoding."""
     if isinstance(s, unicode):
         s = s.encode(charset)
     elif not isinstance(s, str):
         s = str(s)
-    return urllib.quote(s, safe=safe)
+    return cached_quote(s, safe)
 
 
 def url_encode(obj, charset="utf8", encode_keys=False):
-    items = []
+    """ encode the dict or the list of (key, value) tuples `obj` in a
+    query string. Values can be lists or callables. """
     if isinstance(obj, dict):
-        for k, v in list(obj.items()):
-            items.append((k, v))
+        items = obj.items()
     else:
-        items = list(items)
-        
+        items = obj
+
+    table = _quote_table('', True)
+    safe = ALWAYS_SAFE
     tmp = []
     for k, v in items:
         if encode_keys: 
             k = encode(k, charset)
-        
+        k = cached_quote(k)
+
         if not isinstance(v, (tuple, list)):
             v = [v]
-            
+
         for v1 in v:
             if v1 is None:
                 v1 = ''
             elif callable(v1):
                 v1 = encode(v1(), charset)
-            else:
+            elif v1.__class__ is not str:
                 v1 = encode(v1, charset)
-            tmp.append('%s=%s' % (urllib.quote(k), urllib.quote_plus(v1)))
+            if v1.rstrip(safe):
+                v1 = ''.join(map(table.__getitem__, v1))
+            tmp.append(k + '=' + v1)
     return '&'.join(tmp)
                 
 def encode(v, charset="utf8"):
@@ -175,11 +348,46 @@ def make_uri(base, *args, **kwargs):
 
     params_str = url_encode(kwargs, charset, encode_keys)
     if params_str:
-        retval.extend(['?', params_str])
+        # the base may already have a query string (uri templates)
+        retval.extend(['?' not in base and '?' or '&', params_str])
 
     return ''.join(retval)
 
 
+def make_uris(base, paths, **kwargs):
+    """ return the list of the uris ``make_uri(base, path, **kwargs)`` of
+    each path of `paths`. The query string is only encoded once and the
+    paths, usually all different, aren't kept in the quoting cache. """
+    charset = kwargs.pop("charset", "utf-8")
+    safe = kwargs.pop("safe", "/:")
+    encode_keys = kwargs.pop("encode_keys", True)
+
+    params_str = url_encode(kwargs, charset, encode_keys)
+    if params_str:
+        params_str = '?' + params_str
+
+    base = base or ''
+    if base.endswith("/"):
+        prefix = base
+    else:
+        prefix = base + '/'
+
+    uris = []
+    for s in paths:
+        if s is None or not isinstance(s, basestring):
+            uris.append(base + params_str)
+            continue
+        trailing_slash = len(s) > 1 and s.endswith('/')
+        s = s.strip('/')
+        if isinstance(s, unicode):
+            s = s.encode(charset)
+        uri = prefix + quote(s, safe)
+        if trailing_slash:
+            uri += '/'
+        uris.append(uri + params_str)
+    return uris
+
+
 def rewrite_location(host_uri, location, prefix_path=None):
     prefix_path = prefix_path or ''
     url = urlparse.urlparse(location)
@@ -4,30 +4,51 @@
 # See the NOTICE for more information.
 
 import cgi
-import copy
+import io
 import logging
 import mimetypes
-import os
-from StringIO import StringIO
+import re
+import socket
 import types
-import urlparse
 import uuid
 
-from restkit.datastructures import MultiDict
-from restkit.errors import AlreadyRead, RequestError
-from restkit.forms import multipart_form_encode, form_encode
+from http_parser.http import BadStatusLine, NoMoreData, ParserError
+
+from restkit.buffers import iter_into, readall
+from restkit.compression import GzipBody, decode_body
+from restkit.conn import CHUNK_SIZE
+from restkit.datastructures import HeaderDict
+from restkit.errors import AlreadyRead, RequestError, RequestTimeout, \
+ResponseError
+from restkit.forms import FormBody, file_range, multipart_form_encode, \
+form_encode
+from restkit import streaming
 from restkit.tee import ResponseTeeInput
-from restkit.util import to_bytestring
+from restkit.timings import now
+from restkit.util import BUFFER_TYPES, buffer_length, parse_url, \
+to_bytestring, UNIX_SCHEME
 from restkit.util import parse_cookie
 
 log = logging.getLogger(__name__)
 
+# errors after which a body can be resumed
+RESUME_ERRORS = (socket.error, RequestError, RequestTimeout, NoMoreData,
+        BadStatusLine, ParserError)
+
+CONTENT_RANGE_RE = re.compile(r"^bytes (\d+)-\d+/(?:\d+|\*)$")
+
 class Request(object):
 
+    __slots__ = ('_url', '_parsed_url', 'initial_url', 'original_url',
+            'method', '_headers', '_body', 'is_proxied', 'timings', 'route',
+            'redirects_left')
+
     def __init__(self, url, method='GET', body=None, headers=None):
         headers = headers or []
         self.url = url
         self.initial_url = url
+        # url before it was rewritten by a filter (OAuthFilter)
+        self.original_url = None
         self.method = method
 
         self._headers = None
@@ -35,35 +56,55 @@ class Request(object):
 
         self.is_proxied = False
 
+        # number of redirections the client can still follow, set on the
+        # first redirection.
+        self.redirects_left = None
+
+        # restkit.timings.RequestTimings instance when timings are recorded
+        self.timings = None
+
+        # low cardinality label of the request (route template), used to
+        # aggregate metrics.
+        self.route = None
+
         # set parsed uri
         self.headers = headers
         if body is not None:
             self.body = body
 
     def _headers__get(self):
-        if not isinstance(self._headers, MultiDict):
-            self._headers = MultiDict(self._headers or [])
+        if not isinstance(self._headers, HeaderDict):
+            self._headers = HeaderDict(self._headers or [])
         return self._headers
     def _headers__set(self, value):
-        self._headers = MultiDict(copy.copy(value))
+        self._headers = HeaderDict(value)
     headers = property(_headers__get, _headers__set, doc=_headers__get.__doc__)
 
-    def _parsed_url(self):
-        if self.url is None:
-            raise ValueError("url isn't set")
-        return urlparse.urlparse(self.url)
-    parsed_url = property(_parsed_url, doc="parsed url")
+    def _url__get(self):
+        return self._url
+    def _url__set(self, value):
+        self._url = value
+        self._parsed_url = None
+    url = property(_url__get, _url__set, doc="url of the request")
+
+    def _parsed_url__get(self):
+        if self._parsed_url is None:
+            if self._url is None:
+                raise ValueError("url isn't set")
+            self._parsed_url = parse_url(self._url)
+        return self._parsed_url
+    parsed_url = property(_parsed_url__get, doc="parsed url, a "
+            "`restkit.util.URL`, subclass of `urlparse.ParseResult`")
 
     def _path__get(self):
-        parsed_url = self.parsed_url
-        path = parsed_url.path or '/'
-
-        return urlparse.urlunparse(('','', path, parsed_url.params,
-            parsed_url.query, parsed_url.fragment))
+        return self.parsed_url.target
     path = property(_path__get)
 
     def _host__get(self):
-        h = to_bytestring(self.parsed_url.netloc)
+        if self.is_unix():
+            h = "localhost"
+        else:
+            h = to_bytestring(self.parsed_url.netloc)
         hdr_host = self.headers.iget("host")
         if not hdr_host:
             return h
@@ -77,6 +118,11 @@ class Request(object):
     def is_ssl(self):
         return self.parsed_url.scheme == "https"
 
+    def is_unix(self):
+        """ return True if the url is a unix socket url
+        (http+unix://) """
+        return self.parsed_url.scheme == UNIX_SCHEME
+
     def _set_body(self, body):
         ctype = self.headers.ipop('content-type', None)
         clen = self.headers.ipop('content-length', None)
@@ -96,6 +142,10 @@ class Request(object):
             else:
                 ctype = "application/x-www-form-urlencoded; charset=utf-8"
                 self._body = form_encode(body)
+        elif isinstance(body, FormBody):
+            ctype = body.content_type
+            clen = body.get_size()
+            self._body = body
         elif hasattr(body, "boundary") and hasattr(body, "get_size"):
             ctype = "multipart/form-data; boundary=%s" % body.boundary
             clen = body.get_size()
@@ -109,20 +159,14 @@ class Request(object):
                 ctype =  mimetypes.guess_type(body.name)[0]
 
         if not clen:
-            if hasattr(self._body, 'fileno'):
-                try:
-                    self._body.flush()
-                except IOError:
-                    pass
-                try:
-                    fno = self._body.fileno()
-                    clen = str(os.fstat(fno)[6])
-                except  IOError:
-                    if not self.is_chunked():
-                        clen = len(self._body.read())
-            elif hasattr(self._body, 'getvalue') and not \
-                    self.is_chunked():
-                clen = len(self._body.getvalue())
+            if isinstance(self._body, BUFFER_TYPES):
+                clen = buffer_length(self._body)
+            elif hasattr(self._body, 'read'):
+                if not self.is_chunked():
+                    clen = _stream_length(self._body)
+                    if clen is None:
+                        # don't read the body to know its length
+                        self.headers['Transfer-Encoding'] = 'chunked'
             elif isinstance(self._body, types.StringTypes):
                 self._body = to_bytestring(self._body)
                 clen = len(self._body)
@@ -140,21 +184,72 @@ class Request(object):
         return self._body
     body = property(_get_body, _set_body, doc="request body")
 
+    def release_body(self):
+        """ drop the reference to the body once it has been sent, the
+        headers are kept. The request can't be sent again after. """
+        self._body = None
+
+    def compress_body(self, level=6, min_size=0):
+        """ compress the body with gzip while it's sent. The body is sent
+        chunked with the `Content-Encoding: gzip` header. Bodies smaller
+        than `min_size` bytes or already encoded aren't compressed. Return
+        True if the body will be compressed. """
+        if self._body is None or isinstance(self._body, GzipBody) or \
+                self.headers.iget('content-encoding') is not None:
+            return False
+
+        clen = self.headers.iget('content-length')
+        if clen is not None and int(clen) < min_size:
+            return False
+
+        self._body = GzipBody(self._body, level)
+        self.headers.ipop('content-length', None)
+        self.headers.ipop('transfer-encoding', None)
+        self.headers['Content-Encoding'] = 'gzip'
+        self.headers['Transfer-Encoding'] = 'chunked'
+        return True
+
     def maybe_rewind(self, msg=""):
-        if self.body is not None:
-            if not hasattr(self.body, 'seek') and \
-                    not isinstance(self.body, types.StringTypes):
+        body = self.body
+        if body is not None:
+            if hasattr(body, 'can_rewind'):
+                # a compressed body has a seek method whatever its source
+                rewindable = body.can_rewind()
+            else:
+                rewindable = hasattr(body, 'seek') or \
+                        isinstance(body, types.StringTypes) or \
+                        isinstance(body, BUFFER_TYPES)
+            if not rewindable:
                 raise RequestError("error: '%s', body can't be rewind."
                         % msg)
         if log.isEnabledFor(logging.DEBUG):
             log.debug("restart request: %s" % msg)
 
 
+def _stream_length(body):
+    """ return the length of the file-like `body` from its start, found
+    without reading it. The body is rewound. None is returned if the
+    length can't be known (pipes, sockets...). """
+    if hasattr(body, 'seek'):
+        try:
+            body.seek(0)
+        except (IOError, ValueError):
+            pass
+    offset, size = file_range(body)
+    if offset:
+        # the stream can't be rewound
+        return None
+    return size
+
+
 class BodyWrapper(object):
 
     def __init__(self, resp, connection):
         self.resp = resp
         self.body = resp._body
+        # readinto reads the raw stream until the buffered methods are
+        # used, so the bytes received before an error aren't lost
+        self._raw = _unbuffered(self.body)
         self.connection = connection
         self._closed = False
         self.eof = False
@@ -173,13 +268,22 @@ class BodyWrapper(object):
         if not self.eof:
             self.body.read()
 
-        self.connection.release(self.resp.should_close)
+        self.resp._release(self.resp.should_close)
+        self._closed = True
+
+    def abort(self):
+        """ release the connection without reading the rest of the body.
+        The connection is closed. """
+        if self._closed:
+            return
+        self.resp._release(True)
         self._closed = True
 
     def __iter__(self):
         return self
 
     def next(self):
+        self._raw = self.body
         try:
             return self.body.next()
         except StopIteration:
@@ -188,6 +292,7 @@ class BodyWrapper(object):
             raise
 
     def read(self, n=-1):
+        self._raw = self.body
         data = self.body.read(n)
         if not data:
             self.eof = True
@@ -195,6 +300,7 @@ class BodyWrapper(object):
         return data
 
     def readline(self, limit=-1):
+        self._raw = self.body
         line = self.body.readline(limit)
         if not line:
             self.eof = True
@@ -202,15 +308,46 @@ class BodyWrapper(object):
         return line
 
     def readlines(self, hint=None):
+        self._raw = self.body
         lines = self.body.readlines(hint)
         if self.body.close:
             self.eof = True
             self.close()
         return lines
 
+    def readinto(self, b):
+        """ read data into the writable buffer `b` (bytearray, memoryview,
+        ...) and return the number of bytes read, 0 at the end of the
+        body. """
+        if not len(b):
+            return 0
+        n = self._raw.readinto(b)
+        if not n:
+            self.eof = True
+            self.close()
+        return n
+
+    def iter_into(self, buf=None):
+        """ iterate over the body by filling `buf`, a bytearray or a
+        writable memoryview, and yielding memoryviews of the data read. A
+        view is only valid until the next iteration. If `buf` is None, a
+        buffer is borrowed from `restkit.buffers.buffer_pool` so no memory
+        is allocated per chunk::
+
+            with resp.body_stream() as body:
+                for chunk in body.iter_into():
+                    f.write(chunk)
+        """
+        return iter_into(self.readinto, buf)
+
 
 class Response(object):
 
+    __slots__ = ('request', 'connection', 'client', '_resp', 'headers',
+            'status', 'status_int', 'version', 'final_url', 'should_close',
+            'timings', '_headerslist', '_cookies', '_body', '_raw_body',
+            '_closed', '_already_read')
+
     charset = "utf8"
     unicode_errors = 'strict'
 
@@ -218,6 +355,9 @@ class Response(object):
         self.request = request
         self.connection = connection
 
+        # the client which performed the request, set by the client.
+        self.client = None
+
         self._resp = resp
 
         # response infos
@@ -225,27 +365,49 @@ class Response(object):
         self.status = resp.status()
         self.status_int = resp.status_code()
         self.version = resp.version()
-        self.headerslist = self.headers.items()
-        self.location = self.headers.get('location')
         self.final_url = request.url
         self.should_close = not resp.should_keep_alive()
+        self.timings = request.timings
 
-        # cookies
-        if 'set-cookie' in self.headers:
-            cookie_header = self.headers.get('set-cookie')
-            self.cookies = parse_cookie(cookie_header, self.final_url)
+        # built on first use
+        self._headerslist = None
+        self._cookies = None
 
+        # body before decoding, set by the client when the body is
+        # decoded.
+        self._raw_body = None
 
         self._closed = False
         self._already_read = False
 
         if request.method == "HEAD":
             """ no body on HEAD, release the connection now """
-            self.connection.release(True)
-            self._body = StringIO("")
+            self._release(True)
+            self._body = io.BytesIO("")
         else:
             self._body = resp.body_file()
 
+    def _headerslist__get(self):
+        if self._headerslist is None:
+            self._headerslist = self.headers.items()
+        return self._headerslist
+    headerslist = property(_headerslist__get, doc="list of the headers")
+
+    def _location__get(self):
+        return self.headers.get('location')
+    location = property(_location__get)
+
+    def _cookies__get(self):
+        if self._cookies is None:
+            cookie_header = self.headers.get('set-cookie')
+            if cookie_header is None:
+                self._cookies = {}
+            else:
+                self._cookies = parse_cookie(cookie_header, self.final_url)
+        return self._cookies
+    cookies = property(_cookies__get, doc="dict of the cookies set by "
+            "the response")
+
     def __getitem__(self, key):
         try:
             return getattr(self, key)
@@ -270,7 +432,7 @@ class Response(object):
         if not self._already_read:
             self._body.read()
             self._already_read = True
-            self.connection.release(self.should_close)
+            self._release(self.should_close)
 
     def body_string(self, charset=None, unicode_errors="strict"):
         """ return body string, by default in bytestring """
@@ -279,28 +441,107 @@ class Response(object):
             raise AlreadyRead()
 
 
-        body = self._body.read()
+        length = size_hint = None
+        clen = self.headers.get('content-length')
+        if clen is not None and clen.isdigit():
+            # when the body is decompressed the content length is only a
+            # hint of its size
+            ce = self.headers.get('content-encoding', 'identity')
+            if ce.lower() == 'identity':
+                length = int(clen)
+            else:
+                size_hint = int(clen)
+
+        body = readall(self._body, length, size_hint)
         self._already_read = True
 
-        self.connection.release(self.should_close)
+        self._release(self.should_close)
 
         if charset is not None:
             try:
-                body = body.decode(charset, unicode_errors)
+                return body.decode(charset, unicode_errors)
             except UnicodeDecodeError:
                 pass
-        return body
-
-    def body_stream(self):
-        """ stream body """
+        return str(body)
+
+    def body_stream(self, resume=0):
+        """ stream body.
+
+        If `resume` is more than 0, the body of a GET request is resumed
+        after a connection error or if it's shorter than announced: the
+        request is sent again with a `Range` header starting at the
+        first byte not received and an `If-Range` header with the ETag
+        or the Last-Modified date of the response, and reading continues
+        on the new response, up to `resume` times. `ResponseError` is
+        raised if the resource changed. """
         if not self.can_read():
             raise AlreadyRead()
 
         self._already_read = True
 
+        if resume > 0 and self.request.method == "GET":
+            body = io.BufferedReader(ResumableReader(self,
+                _unbuffered(self._raw_body or self._body), resume),
+                    CHUNK_SIZE)
+            if self._raw_body is not None:
+                body = decode_body(body,
+                        self.headers.get('content-encoding'))
+            self._body = body
+
         return BodyWrapper(self, self.connection)
 
 
+    def iter_json(self, path="rows.item", chunk_size=CHUNK_SIZE * 4):
+        """ iterate over the JSON values at `path` in the body, decoded
+        while the body is read. By default the rows of a CouchDB view are
+        yielded one by one::
+
+            for row in resp.iter_json("rows.item"):
+                print row["id"]
+
+        See `restkit.streaming.iter_json` for the path syntax. The
+        connection is released at the end of the body. If the iteration
+        is stopped before, the connection is closed. """
+        return self._iter_stream(streaming.iter_json, path,
+                chunk_size=chunk_size)
+
+    def iter_batches(self, format="ndjson", batch_size=1000, columns=None,
+            **kwargs):
+        """ iterate over the records of a NDJSON or CSV body by batches of
+        `batch_size` records, decoded at once. If `columns` is given,
+        batches are dicts of columns, `array.array` or NumPy arrays for
+        numeric fields. See `restkit.streaming.iter_batches`. """
+        # fail before the body is claimed
+        if format not in streaming.BATCH_FORMATS:
+            raise ValueError("unknown format: %r" % format)
+        return self._iter_stream(streaming.iter_batches, format,
+                batch_size, columns, **kwargs)
+
+    def _iter_stream(self, decode, *args, **kwargs):
+        # the body is claimed on the first iteration, so the connection
+        # isn't kept by an iterator which is never used
+        body = None
+        try:
+            body = self.body_stream()
+            for value in decode(body, *args, **kwargs):
+                yield value
+            # read what remains after the values
+            body.close()
+        finally:
+            if body is not None:
+                body.abort()
+
+    def _release(self, should_close):
+        """ release the connection once the body has been consumed """
+        self.connection.release(should_close)
+        if self.timings is not None:
+            self.timings.body_done = now()
+            self.timings.bytes_received = getattr(self._resp, 'received', 0)
+        client = self.client
+        if client is not None and client._listeners:
+            client._emit('released', self.request, response=self,
+                    redirected=False)
+
     def tee(self):
         """ copy response input to standard output or a file if length >
         sock.MAX_BODY. This make possible to reuse it in your
@@ -309,3 +550,88 @@ class Response(object):
         return ResponseTeeInput(self, self.connection,
                 should_close=self.should_close)
 ClientResponse = Response
+
+
+class ResumableReader(io.RawIOBase):
+    """ raw reader over the body `body` of the response `resp`, sending
+    range requests to continue reading it after an error, at most
+    `tries` times. """
+
+    def __init__(self, resp, body, tries):
+        self.resp = resp
+        self.body = body
+        self.tries = tries
+        self.offset = 0
+        self.current = resp
+
+        clen = resp.headers.get('content-length', '')
+        self.length = clen.isdigit() and int(clen) or None
+        self.validator = resp.headers.get('etag') or \
+                resp.headers.get('last-modified')
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while True:
+            try:
+                n = self.body.readinto(b)
+                if not n and not self._complete():
+                    raise NoMoreData("body truncated at byte %s" %
+                            self.offset)
+            except RESUME_ERRORS, e:
+                self._resume(e)
+                continue
+            self.offset += n
+            return n
+
+    def _complete(self):
+        if self.length is not None:
+            return self.offset >= self.length
+        parser = getattr(self.current._resp, 'parser', None)
+        return parser is None or parser.is_message_complete()
+
+    def _resume(self, error):
+        client = self.resp.client
+        if self.tries <= 0 or client is None or self.validator is None:
+            raise error
+        self.tries -= 1
+
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("resume body at byte %s: %s" % (self.offset,
+                str(error)))
+
+        # the connection can't be reused
+        self.current.connection.release(True)
+
+        request = self.resp.request
+        headers = request.headers.copy()
+        headers['Range'] = "bytes=%s-" % self.offset
+        headers['If-Range'] = self.validator
+        resp = client.request(self.resp.final_url, 'GET', headers=headers)
+
+        match = CONTENT_RANGE_RE.match(resp.headers.get('content-range',
+            ''))
+        etag = resp.headers.get('etag')
+        if resp.status_int != 206 or match is None or \
+                int(match.group(1)) != self.offset or \
+                (etag is not None and self.validator.startswith('"') and \
+                    etag != self.validator):
+            resp.close()
+            raise ResponseError("can't resume body at byte %s: the "
+                    "resource changed (%s)" % (self.offset, resp.status))
+
+        self.current = resp
+        self.body = _unbuffered(resp._raw_body or resp._body)
+        # the response releases the new connection once read
+        self.resp.connection = resp.connection
+        self.resp.should_close = resp.should_close
+
+
+def _unbuffered(body):
+    # read the raw stream of a buffered reader which hasn't been read
+    # yet, so the bytes received before an error aren't lost in the
+    # buffer.
+    if isinstance(body, io.BufferedReader):
+        return body.raw
+    return body
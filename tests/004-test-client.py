@@ -16,8 +16,16 @@ import sys
 import tempfile
 import time
 
+from http_parser.http import NoMoreData
+
 import t
+import restkit
+from restkit.timings import now
+from restkit.client import Client
 from restkit.filters import BasicAuth
+from restkit.wrappers import Request
+
+from _server_test import HOST, PORT
 
 
 LONG_BODY_PART = """This is a relatively long body, that we send to the client...
@@ -268,3 +276,222 @@ def test_024(u, c):
     t.eq(r.status_int, 200)
     
 
+
+def test_025():
+    u = "http://%s:%s/" % (HOST, PORT)
+    c = Client(record_timings=True)
+    r = c.request(u)
+    timings = r.timings
+    t.isnotin('receive', timings.durations())
+    t.eq(r.body_string(), "welcome")
+    for k in ('checkout', 'send', 'wait', 'receive', 'total'):
+        t.isin(k, timings.durations())
+    t.eq(timings.retries, 0)
+    t.eq(timings.redirects, 0)
+    t.ne(timings.first_byte, None)
+    t.gt(timings.body_done, timings.first_byte - 1e-6)
+
+    c.follow_redirect = True
+    r = c.request(u + "redirect")
+    r.body_string()
+    t.eq(r.timings.redirects, 1)
+
+def test_026():
+    resolved = []
+    getaddrinfo = socket.getaddrinfo
+    def counting_getaddrinfo(*args, **kwargs):
+        resolved.append(args[0])
+        return getaddrinfo(*args, **kwargs)
+
+    socket.getaddrinfo = counting_getaddrinfo
+    try:
+        c = Client()
+        r = c.request("http://%s:%s/" % (HOST, PORT))
+        t.eq(r.timings, None)
+        t.eq(r.body_string(), "welcome")
+        # the address is only resolved by connect
+        t.eq(resolved, [])
+
+        del resolved[:]
+        c = Client(record_timings=True)
+        r = c.request("http://%s:%s/" % (HOST, PORT))
+        t.eq(r.body_string(), "welcome")
+        t.eq(resolved, [HOST])
+        t.isin('dns', r.timings.durations())
+    finally:
+        socket.getaddrinfo = getaddrinfo
+
+    if sys.platform.startswith('linux'):
+        # a monotonic clock on python 2 too
+        assert now is not time.time
+
+def test_027():
+    events = []
+    def listener(event, request, **extra):
+        events.append(event)
+        if event == 'released':
+            redirected.append(extra['redirected'])
+
+    redirected = []
+    c = Client()
+    t.raises(ValueError, c.add_listener, "unknown", listener)
+    for event in ('connection', 'headers_sent', 'body_sent', 'first_byte',
+            'released', 'redirect'):
+        c.add_listener(event, listener)
+    c.follow_redirect = True
+    r = c.request("http://%s:%s/redirect" % (HOST, PORT))
+    t.eq(r.body_string(), "ok")
+    t.eq(events, ['connection', 'headers_sent', 'body_sent', 'first_byte',
+        'released', 'redirect', 'connection', 'headers_sent', 'body_sent',
+        'first_byte', 'released'])
+    t.eq(redirected, [True, False])
+
+    events[:] = []
+    r = c.request("http://%s:%s/ok" % (HOST, PORT), 'HEAD')
+    t.eq(r.status_int, 200)
+    t.eq(events, ['connection', 'headers_sent', 'body_sent', 'first_byte',
+        'released'])
+
+    for event in ('connection', 'headers_sent', 'body_sent', 'first_byte',
+            'released', 'redirect'):
+        c.remove_listener(event, listener)
+    t.eq(c._listeners, {})
+    events[:] = []
+    r = c.request("http://%s:%s/" % (HOST, PORT))
+    t.eq(r.body_string(), "welcome")
+    t.eq(events, [])
+
+    # only the phase events need the request to be traced
+    request = Request("http://%s:%s/" % (HOST, PORT))
+    c.add_listener('released', listener)
+    t.eq(c._traced(request), False)
+    c.add_listener('first_byte', listener)
+    t.eq(c._traced(request), True)
+
+@t.client_request('/large')
+def test_028(u, c):
+    r = c.request(u, 'POST', body=LONG_BODY_PART)
+    buf = bytearray(1000)
+    chunks = []
+    with r.body_stream() as body:
+        while True:
+            n = body.readinto(buf)
+            if not n:
+                break
+            chunks.append(str(buf[:n]))
+    t.eq("".join(chunks), LONG_BODY_PART)
+
+@t.client_request('/large')
+def test_029(u, c):
+    r = c.request(u, 'POST', body=LONG_BODY_PART)
+    with r.body_stream() as body:
+        data = "".join([chunk.tobytes() for chunk in body.iter_into()])
+    t.eq(data, LONG_BODY_PART)
+
+    r = c.request(u, 'POST', body=LONG_BODY_PART)
+    body = r.tee()
+    t.eq("".join([chunk.tobytes() for chunk in body.iter_into()]),
+            LONG_BODY_PART)
+    body.seek(0)
+    buf = bytearray(len(LONG_BODY_PART) + 10)
+    t.eq(body.readinto(buf), len(LONG_BODY_PART))
+    t.eq(str(buf[:len(LONG_BODY_PART)]), LONG_BODY_PART)
+
+    # rewind in the middle of the body, then read the rest from the
+    # connection
+    r = c.request(u, 'POST', body=LONG_BODY_PART)
+    body = r.tee()
+    buf = bytearray(1000)
+    t.eq(body.readinto(buf), 1000)
+    body.seek(0)
+    chunks = []
+    while True:
+        n = body.readinto(buf)
+        if not n:
+            break
+        chunks.append(str(buf[:n]))
+    t.eq("".join(chunks), LONG_BODY_PART)
+    assert body.eof
+
+    # an empty buffer isn't the end of the body
+    r = c.request(u, 'POST', body=LONG_BODY_PART)
+    with r.body_stream() as body:
+        t.eq(body.readinto(bytearray()), 0)
+        assert not body.eof
+        t.eq(body.read(), LONG_BODY_PART)
+
+@t.client_request('/large')
+def test_030(u, c):
+    r = c.request(u, 'POST', body=LONG_BODY_PART)
+    t.eq(r['content-length'], str(len(LONG_BODY_PART)))
+    body = r.body_string()
+    t.eq(type(body), str)
+    t.eq(body, LONG_BODY_PART)
+
+    r = c.request(u, 'POST', body=LONG_BODY_PART)
+    t.eq(r.body_string(charset="utf-8"), LONG_BODY_PART.decode("utf-8"))
+
+def test_031():
+    # the redirections are counted by request
+    c = Client(follow_redirect=True, max_follow_redirect=1)
+    for i in range(3):
+        r = c.request("http://%s:%s/redirect" % (HOST, PORT))
+        t.eq(r.body_string(), "ok")
+
+def test_032():
+    sent = []
+    def listener(event, request, **extra):
+        sent.append((event, request.timings.headers_sent))
+
+    c = Client(record_timings=True)
+    c.add_listener('headers_sent', listener)
+    r = c.request("http://%s:%s/" % (HOST, PORT), 'POST', body="test")
+    t.eq(r.body_string(), "test")
+    t.eq(sent[0][0], 'headers_sent')
+    t.ne(sent[0][1], None)
+    t.gt(r.timings.body_sent, r.timings.headers_sent - 1e-6)
+
+    # headers of a chunked string body aren't sent in the chunk
+    r = c.request("http://%s:%s/chunked" % (HOST, PORT), 'POST',
+            body="test" * 10, headers={'Transfer-Encoding': 'chunked'})
+    t.eq(r.body_string(), "28\r\n" + "test" * 6 + "t")
+
+def test_033():
+    u = "http://%s:%s/auth" % (HOST, PORT)
+    r = restkit.request("http://test:test@%s:%s/auth" % (HOST, PORT))
+    t.eq(r.body_string(), "ok")
+    client = r.client
+    r = restkit.request("http://test:test@%s:%s/auth" % (HOST, PORT))
+    assert r.client is client
+    r.body_string()
+    # credentials are part of the key of the clients cache
+    r = restkit.request(u)
+    assert r.client is not client
+    t.eq(r.status_int, 401)
+    r.body_string()
+    r = restkit.request("http://test:test2@%s:%s/auth" % (HOST, PORT))
+    t.eq(r.status_int, 403)
+    r.body_string()
+
+def test_034():
+    responses = ["HTTP/1.1 200 OK\r\nContent-Length: 5000\r\n\r\n",
+        "HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n3e8\r\n"]
+    for response in responses:
+        s = socket.socket()
+        s.bind((HOST, 0))
+        s.listen(1)
+
+        def serve():
+            conn, addr = s.accept()
+            conn.recv(65536)
+            # the connection is closed in the middle of the body
+            conn.sendall(response + "a" * 1000)
+            conn.close()
+            s.close()
+
+        thread = threading.Thread(target=serve)
+        thread.start()
+        c = Client()
+        r = c.request("http://%s:%s/" % s.getsockname())
+        t.raises(NoMoreData, r.body_string)
+        thread.join()
@@ -192,4 +192,35 @@ def test_025(res):
     h = {'content-type':"multipart/form-data"}
     r = res.post('/multipart4', payload=b, headers=h)
     t.eq(r.status_int, 200)
-    t.eq(r.body_string(), content)
\ No newline at end of file
+    t.eq(r.body_string(), content)
+
+def test_026():
+    res = Resource("http://test:test@%s:%s/" % (HOST, PORT))
+    child = res("auth")
+    assert child.client is res.client
+    t.eq(child.uri, "http://%s:%s/auth" % (HOST, PORT))
+    t.eq(child.initial['uri'], "http://test:test@%s:%s/auth" % (HOST, PORT))
+    t.eq(child.get().body_string(), "ok")
+    t.eq(res(u"a b/é/").uri, "http://%s:%s/a%%20b/%%C3%%A9/" % (HOST, PORT))
+    t.eq(res("/").uri, "http://%s:%s/" % (HOST, PORT))
+
+    clone = child.clone()
+    assert clone.client is res.client
+    clone.update_uri("x")
+    t.eq(clone.uri, "http://%s:%s/auth/x" % (HOST, PORT))
+    t.eq(child.uri, "http://%s:%s/auth" % (HOST, PORT))
+
+def test_027():
+    res = Resource("http://%s:%s/" % (HOST, PORT))
+    query = res.template("/{name}{?test}")
+    assert res.template("/{name}{?test}") is query
+    t.eq(query.route, "/{name}{?test}")
+    r = res.get(query, name="query", test="testing", d=1)
+    t.eq(r.request.url, "http://%s:%s/query?test=testing&d=1" % (HOST,
+        PORT))
+    t.eq(r.request.route, "/{name}{?test}")
+    t.eq(r.body_string(), "ok")
+
+    child = res("db")
+    t.eq(child.template("{docid}").route, "/db/{docid}")
+    t.eq(child.template("{docid}").expand({"docid": "a/b"}), "a%2Fb")
@@ -4,8 +4,16 @@
 # See the NOTICE for more information.
 
 
+import pickle
+import urllib
+import urlparse
+
 import t
 from restkit import util
+from restkit.datastructures import LRUCache
+from restkit.errors import InvalidUrl
+from restkit.resource import Resource
+from restkit.wrappers import Request
 
 def test_001():
     qs = {'a': "a"}
@@ -35,4 +43,73 @@ def test_002():
     t.eq(util.make_uri("http://localhost", "test/echo/"),
         "http://localhost/test/echo/")
     
-    
\ No newline at end of file
+    
+def test_003():
+    u = util.parse_url("https://user@[::1]:8443/a;p?b=1#f")
+    t.eq(u.scheme, "https")
+    t.eq(u.netloc, "user@[::1]:8443")
+    t.eq(u.address, ("user@[::1]", 8443))
+    t.eq(u.target, "/a;p?b=1#f")
+    t.eq(u.geturl(), "https://user@[::1]:8443/a;p?b=1#f")
+    # the scheme and netloc are parsed once by server
+    other = util.parse_url("https://user@[::1]:8443/c?d")
+    assert other._base is u._base
+    t.eq(other.address, ("user@[::1]", 8443))
+    for url in ("http://h", "http://h?x#y", "http://h//a", "http://h/a:b",
+            "http+unix://%2Ftmp%2Fs/db;p?x", "/relative"):
+        t.eq(util.parse_url(url), urlparse.urlparse(url))
+    t.eq(util.parse_url("http://localhost").address, ("localhost", 80))
+    t.eq(util.parse_url("http://localhost").target, "/")
+    t.raises(InvalidUrl, getattr, util.parse_url("http://h:x/"), "address")
+
+    # compatible with the result of urlparse
+    assert isinstance(u, urlparse.ParseResult)
+    t.eq(u, urlparse.urlparse("https://user@[::1]:8443/a;p?b=1#f"))
+    t.eq(u[1], "user@[::1]:8443")
+    t.eq(u.port, 8443)
+    t.eq(u._replace(fragment="").geturl(), "https://user@[::1]:8443/a;p?b=1")
+    t.eq(type(u._replace(path="/")), urlparse.ParseResult)
+    t.eq(pickle.loads(pickle.dumps(u)).target, u.target)
+
+def test_004():
+    cache = LRUCache(2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    t.eq(cache.get("a"), 1)
+    cache.set("c", 3)
+    # b is the least recently used
+    assert "b" not in cache
+    t.eq(cache.get("a"), 1)
+    t.eq(cache.get("c"), 3)
+    t.eq(len(cache), 2)
+    cache.set("c", 4)
+    t.eq(cache.get("c"), 4)
+
+def test_005():
+    req = Request("http://localhost/a?b=c")
+    parsed = req.parsed_url
+    t.eq(req.path, "/a?b=c")
+    assert req.parsed_url is parsed
+    req.url = "http://localhost:5000/d"
+    t.eq(req.path, "/d")
+    t.eq(req.parsed_url.address, ("localhost", 5000))
+
+def test_006():
+    for s in ("abc", "a b/c:d", "\xe9\x00+&=", ""):
+        for safe in ("/", "/:", ""):
+            t.eq(util.quote(s, safe), urllib.quote(s, safe))
+            t.eq(util.cached_quote(s, safe), urllib.quote(s, safe))
+        t.eq(util.quote(s, "", True), urllib.quote_plus(s, ""))
+    t.eq(util.url_quote(u"é t", "utf-8", "/:"), "%C3%A9%20t")
+    t.eq(util.url_encode([("a b", u"é"), ("c", ["1 2", None])]),
+            "a%20b=%C3%A9&c=1+2&c=")
+
+def test_007():
+    for base in ("http://localhost", "http://localhost/"):
+        for path in ("a", "/a b/", u"é", "/", None):
+            params = {'q': 'x y'}
+            t.eq(util.make_uris(base, [path], **params),
+                    [util.make_uri(base, path, **params)])
+    res = Resource("http://localhost/db/")
+    t.eq(res.make_uris(["a", "b c"], rev="1"), [
+        "http://localhost/db/a?rev=1", "http://localhost/db/b%20c?rev=1"])
@@ -3,11 +3,16 @@
 # This file is part of restkit released under the MIT license. 
 # See the NOTICE for more information.
 
+import io
+import mmap
 import os
+import tempfile
 import uuid
 import t
-from restkit import request
-from restkit.forms import multipart_form_encode
+from restkit import conn, request
+from restkit.forms import BoundaryItem, FormBody, file_range, form_encode, \
+        multipart_form_encode
+from restkit.wrappers import Request
 
 from _server_test import HOST, PORT
 
@@ -137,4 +142,117 @@ def test_007():
     body, headers = multipart_form_encode(b, h, uuid.uuid4().hex)
     r = request(u, method='POST', body=body, headers=headers)
     t.eq(r.status_int, 200)
-    t.eq(r.body_string(), content)
\ No newline at end of file
+    t.eq(r.body_string(), content)
+
+def _sendfile(out_fd, in_fd, offset, count):
+    # sendfile(2) emulation, sending at most 64KB at a time
+    os.lseek(in_fd, offset, 0)
+    return os.write(out_fd, os.read(in_fd, min(count, 65536)))
+
+def test_008():
+    u = "http://%s:%s/multipart4" % (HOST, PORT)
+    fn = os.path.join(os.path.dirname(__file__), "1M")
+    f = open(fn, 'rb')
+    content = f.read()
+    f.seek(0)
+    b = [('a', 'aa'), ('b', 'éàù@'), ('f', f)]
+    h = {'content-type':"multipart/form-data"}
+    body, headers = multipart_form_encode(b, h, uuid.uuid4().hex)
+    old_sendfile, conn.sendfile = conn.sendfile, _sendfile
+    try:
+        r = request(u, method='POST', body=body, headers=headers)
+    finally:
+        conn.sendfile = old_sendfile
+    t.eq(r.status_int, 200)
+    t.eq(r.body_string(), content)
+
+def test_009():
+    f = io.BytesIO("skipped" + "x" * 20000)
+    f.seek(7)
+    t.eq(file_range(f), (7, 20000))
+    t.eq(f.tell(), 7)
+    item = BoundaryItem("f", f)
+    t.eq(item.size, 20000)
+    # the value can be iterated again
+    t.eq("".join(item.iter_value(1000)), "x" * 20000)
+    t.eq("".join(item.iter_value(1000)), "x" * 20000)
+
+    boundary = "b" * 32
+    t.eq(BoundaryItem("a", u"é").size, 2)
+    for value in ("--" + boundary, "a\r\n--" + boundary + "--"):
+        t.raises(ValueError, BoundaryItem("a", value).encode, boundary)
+    # found across blocks
+    f = io.BytesIO("x" * 16383 + "\n--" + boundary)
+    t.raises(ValueError, list, BoundaryItem("f", f).iter_encode(boundary))
+    t.eq(BoundaryItem("a", "a--" + boundary).encode(boundary).count("a--"), 1)
+
+def test_010():
+    u = "http://%s:%s/" % (HOST, PORT)
+    data = LONG_BODY_PART
+    f = tempfile.TemporaryFile()
+    f.write(data)
+    f.flush()
+    mm = mmap.mmap(f.fileno(), 0)
+    for body in (bytearray(data), memoryview(data), buffer(data), mm):
+        r = request(u, method='POST', body=body)
+        t.eq(r.status_int, 200)
+        t.eq(r.request.headers.iget('content-length'), len(data))
+        t.eq(r.body_string(), data)
+    mm.close()
+
+    r = request("http://%s:%s/chunked" % (HOST, PORT), method='POST',
+            body=bytearray("test" * 10), headers={'Transfer-Encoding': 'chunked'})
+    t.eq(r.body_string(), "28\r\ntesttesttesttesttesttestt")
+
+def test_011():
+    f = io.BytesIO("abcdef")
+    f.read()
+    req = Request("http://localhost", "POST", body=f)
+    t.eq(req.headers.iget('content-length'), 6)
+    t.eq(f.tell(), 0)
+
+    class Stream(object):
+        def read(self, size=-1):
+            return ""
+
+    req = Request("http://localhost", "POST", body=Stream())
+    t.eq(req.headers.iget('content-length'), None)
+    assert req.is_chunked()
+
+def test_012():
+    r = request("http://%s:%s/cookies" % (HOST, PORT))
+    assert not hasattr(r, '__dict__')
+    assert not hasattr(r.request, '__dict__')
+    t.eq(r.cookies.get('sugar'), 'wafer')
+    t.eq(r.headerslist, r.headers.items())
+    r.skip_body()
+
+    r = request("http://%s:%s/" % (HOST, PORT), method='POST', body="test")
+    t.eq(r.cookies, {})
+    # the body has been sent
+    t.eq(r.request.body, None)
+    t.eq(r.request.headers.iget('content-length'), 4)
+    t.eq(r.body_string(), "test")
+
+@t.client_request("/")
+def test_013(u, c):
+    calls = []
+    def value():
+        calls.append(1)
+        return "b c"
+    fields = [("f%s" % i, u"välue %s&" % i) for i in range(5000)]
+    fields.append(("list", ["a", None, value]))
+    body = FormBody(fields, block_size=1000)
+    expected = form_encode(fields[:-1] + [("list", ["a", None, "b c"])])
+    t.eq(body.get_size(), len(expected))
+    blocks = list(body)
+    t.eq("".join(blocks), expected)
+    assert max(map(len, blocks)) < 1100
+
+    r = c.request(u, "POST", body=body)
+    t.eq(r.request.headers.iget('content-length'), len(expected))
+    t.eq(r['content-type'], FormBody.content_type)
+    t.eq(r.body_string(), expected)
+    t.eq(len(calls), 1)
+    t.eq(FormBody({}).get_size(), 0)
+    t.eq(list(FormBody({})), [])
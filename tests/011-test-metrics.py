@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+import t
+from restkit.client import Client
+from restkit.contrib.metrics import MetricsFilter, MetricsApp, \
+NO_ROUTE, OTHER_ROUTE, log_linear_buckets
+
+from _server_test import HOST, PORT
+
+def path_route(request):
+    return request.parsed_url.path
+
+def test_001():
+    bounds = log_linear_buckets(-1, 1, steps=(1, 5))
+    t.eq(bounds, (0.1, 0.5, 1.0, 5.0, 10.0))
+
+def test_002():
+    metrics = MetricsFilter(route_for=path_route)
+    c = Client(filters=[metrics])
+    u = "http://%s:%s" % (HOST, PORT)
+    for i in range(3):
+        r = c.request(u + "/")
+        t.eq(r.body_string(), "welcome")
+    r = c.request(u + "/unknown")
+    r.body_string()
+    r = c.request(u + "/", "POST", body="test")
+    r.body_string()
+
+    host = "%s:%s" % (HOST, PORT)
+    series = metrics.series[('GET', host, '/')]
+    t.eq(series.statuses, {'2xx': 3})
+    t.eq(series.count, 3)
+    t.eq(sum(series.buckets), 3)
+    t.eq(metrics.series[('GET', host, '/unknown')].statuses, {'4xx': 1})
+    t.eq(series.bytes_in, 3 * len("welcome"))
+    t.eq(metrics.series[('POST', host, '/')].bytes_out, 4)
+    t.eq(metrics.series[('POST', host, '/')].bytes_in, 4)
+
+    text = metrics.render()
+    t.isin('restkit_requests_total{method="GET",host="%s",route="/",'
+        'status="2xx"} 3' % host, text)
+    t.isin('restkit_request_duration_seconds_bucket{method="GET",'
+        'host="%s",route="/",le="+Inf"} 3' % host, text)
+    t.eq(text.rstrip().splitlines()[-1], "# EOF")
+    t.isin("# TYPE restkit_requests_total counter",
+            metrics.render(openmetrics=False))
+
+def test_003():
+    metrics = MetricsFilter(max_series=1, route_for=path_route)
+    c = Client(filters=[metrics])
+    u = "http://%s:%s" % (HOST, PORT)
+    c.request(u + "/").body_string()
+    c.request(u + "/test").body_string()
+    c.request(u + "/query?test=testing").body_string()
+    c.request(u + "/unknown").body_string()
+    routes = sorted(k[2] for k in metrics.series)
+    t.eq(routes, ['/', OTHER_ROUTE])
+    # a single series whatever the method, host and status
+    other = metrics.series[(OTHER_ROUTE, OTHER_ROUTE, OTHER_ROUTE)]
+    t.eq(other.count, 3)
+    t.eq(other.statuses, {OTHER_ROUTE: 3})
+
+def test_004():
+    metrics = MetricsFilter()
+    app = MetricsApp(metrics)
+    status = []
+    def start_response(s, headers):
+        status.append((s, dict(headers)))
+    body = "".join(app({'REQUEST_METHOD': 'GET',
+        'HTTP_ACCEPT': 'application/openmetrics-text'}, start_response))
+    t.eq(status[0][0], '200 OK')
+    t.eq(status[0][1]['Content-Type'].split(';')[0],
+            'application/openmetrics-text')
+    t.eq(body, metrics.render())
+
+def test_005():
+    import gzip
+    from StringIO import StringIO
+    from restkit.contrib.wsgi_transport import WSGITransport
+
+    buf = StringIO()
+    f = gzip.GzipFile(fileobj=buf, mode="wb")
+    f.write("x" * 10000)
+    f.close()
+    encoded = buf.getvalue()
+
+    def app(environ, start_response):
+        environ['wsgi.input'].read()
+        # chunked and compressed: no Content-Length
+        start_response('200 OK', [('Content-Encoding', 'gzip')])
+        return [encoded[:100], encoded[100:]]
+
+    metrics = MetricsFilter()
+    c = Client(filters=[metrics], transport=WSGITransport(app))
+    r = c.request("http://localhost/", "POST", body="test")
+    t.eq(r.body_string(), "x" * 10000)
+    series = metrics.series[('POST', 'localhost', NO_ROUTE)]
+    t.eq(series.bytes_in, len(encoded))
+    t.eq(series.bytes_out, 4)
+
+def test_006():
+    metrics = MetricsFilter()
+    c = Client(filters=[metrics])
+    u = "http://%s:%s" % (HOST, PORT)
+    c.request(u + "/").body_string()
+    c.request(u + "/query?test=testing").body_string()
+    host = "%s:%s" % (HOST, PORT)
+    # requests without a route share a series
+    series = metrics.series[('GET', host, NO_ROUTE)]
+    t.eq(series.count, 2)
+    t.eq(series.bytes_in, len("welcome") + len("ok"))
+
+    # response bytes aren't recorded once the filter is detached
+    metrics.detach(c)
+    t.eq(c._listeners, {})
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+import json
+import os
+import tempfile
+
+import t
+from restkit.client import Client
+from restkit.contrib.tracing import TraceRecorder
+
+from _server_test import HOST, PORT
+
+def test_001():
+    c = Client()
+    recorder = TraceRecorder(maxlen=2)
+    recorder.attach(c)
+    u = "http://%s:%s/" % (HOST, PORT)
+
+    c.request(u).body_string()
+    t.eq(len(recorder.spans), 0)
+    # nothing is listened to while the recorder is disabled
+    t.eq(c._listeners, {})
+
+    recorder.enable()
+    t.eq(c._listeners, {'released': [recorder.on_released]})
+    for i in range(3):
+        c.request(u).body_string()
+    c.request("http://%s:%s/ok" % (HOST, PORT), "HEAD")
+    t.eq(len(recorder.spans), 2)
+
+    fd, fname = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        t.eq(recorder.flush(fname), 2)
+        with open(fname) as f:
+            trace = json.load(f)
+    finally:
+        os.unlink(fname)
+    t.eq(len(recorder.spans), 0)
+
+    names = [e['name'] for e in trace['traceEvents']]
+    t.isin("HEAD http://%s:%s/ok" % (HOST, PORT), names)
+    for phase in ("pool wait", "send", "wait", "receive"):
+        t.isin(phase, names)
+    for e in trace['traceEvents']:
+        t.eq(e['ph'], 'X')
+        t.gt(e['dur'], -1)
+
+    recorder.detach(c)
+    c.request(u).body_string()
+    t.eq(len(recorder.spans), 0)
+
+def test_002():
+    c = Client(follow_redirect=True)
+    recorder = TraceRecorder(enabled=True)
+    recorder.attach(c)
+    r = c.request("http://%s:%s/redirect" % (HOST, PORT))
+    t.eq(r.body_string(), "ok")
+    # the redirection is part of the request span
+    t.eq(len(recorder.spans), 1)
+    t.eq(recorder.spans[0][2].redirects, 1)
+
+def test_003():
+    c = Client()
+    recorder = TraceRecorder(enabled=True)
+    recorder.attach(c)
+    recorder.disable()
+    t.eq(c._listeners, {})
+    c.request("http://%s:%s/" % (HOST, PORT)).body_string()
+    t.eq(len(recorder.spans), 0)
+    recorder.enable()
+    recorder.enable()
+    t.eq(c._listeners, {'released': [recorder.on_released]})
+    recorder.detach(c)
+    t.eq(c._listeners, {})
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+import os
+import SocketServer
+import tempfile
+import threading
+import urllib
+
+import t
+from restkit.client import Client
+from restkit.resource import Resource
+from restkit.util import make_uri, parse_netloc
+from restkit.wrappers import Request
+
+from _server_test import HTTPTestHandler
+
+SOCKET_PATH = os.path.join(tempfile.gettempdir(),
+        "restkit-test-%s.sock" % os.getpid())
+UNIX_URL = "http+unix://%s" % urllib.quote(SOCKET_PATH, safe="")
+
+
+class UnixHTTPTestHandler(HTTPTestHandler):
+
+    def address_string(self):
+        return SOCKET_PATH
+
+    def log_message(self, format, *args):
+        pass
+
+
+class UnixHTTPServer(SocketServer.ThreadingMixIn,
+        SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+
+server = None
+def setup():
+    global server
+    if os.path.exists(SOCKET_PATH):
+        os.unlink(SOCKET_PATH)
+    server = UnixHTTPServer(SOCKET_PATH, UnixHTTPTestHandler)
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.setDaemon(True)
+    server_thread.start()
+
+def teardown():
+    server.shutdown()
+    server.server_close()
+    os.unlink(SOCKET_PATH)
+
+def test_001():
+    req = Request(UNIX_URL + "/db?a=b")
+    t.eq(parse_netloc(req.parsed_url), (SOCKET_PATH, None))
+    t.eq(req.host, "localhost")
+    t.eq(req.path, "/db?a=b")
+    t.eq(req.is_ssl(), False)
+    t.eq(req.is_unix(), True)
+    t.eq(make_uri(UNIX_URL, "db", "doc"), UNIX_URL + "/db/doc")
+
+def test_002():
+    c = Client()
+    r = c.request(UNIX_URL + "/")
+    t.eq(r.status_int, 200)
+    t.eq(r.body_string(), "welcome")
+    r = c.request(UNIX_URL + "/", "POST", body="test")
+    t.eq(r.body_string(), "test")
+
+def test_003():
+    c = Client(unix_socket=SOCKET_PATH)
+    r = c.request("http://localhost/query?test=testing")
+    t.eq(r.body_string(), "ok")
+
+def test_004():
+    res = Resource(UNIX_URL)
+    r = res.get('/query', test='testing')
+    t.eq(r.body_string(), "ok")
+    r = res("query").get(test='testing')
+    t.eq(r.body_string(), "ok")
+
+def test_005():
+    c = Client(follow_redirect=True)
+    r = c.request(UNIX_URL + "/redirect")
+    t.eq(r.body_string(), "ok")
+    t.eq(r.final_url, UNIX_URL + "/complete_redirect")
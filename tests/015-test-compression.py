@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+import gzip
+import io
+import zlib
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+import t
+
+from restkit.client import Client
+from restkit.compression import ACCEPT_ENCODING, BufferedDecoder, \
+DecodingReader, GzipBody, GzipDecoder, decode_body, parse_encodings
+from restkit.contrib.wsgi_proxy import HostProxy
+from restkit.contrib.wsgi_transport import WSGITransport
+from restkit.errors import RequestError
+from restkit.forms import MultipartForm
+from restkit.resource import Resource
+from restkit.wrappers import Request
+
+DATA = "".join(["line %s\n" % i for i in range(20000)])
+
+def gzip_compress(data):
+    buf = StringIO()
+    f = gzip.GzipFile(fileobj=buf, mode="wb")
+    f.write(data)
+    f.close()
+    return buf.getvalue()
+
+def raw_deflate(data):
+    obj = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return obj.compress(data) + obj.flush()
+
+ENCODED = {
+    'gzip': gzip_compress(DATA),
+    'deflate': zlib.compress(DATA),
+    'raw-deflate': raw_deflate(DATA)
+}
+
+def app(environ, start_response):
+    encoding = environ['PATH_INFO'].strip('/')
+    accepted = environ.get('HTTP_ACCEPT_ENCODING', '')
+    headers = [('X-Accept-Encoding', accepted)]
+    if encoding and encoding.split('-')[-1] in accepted:
+        body = ENCODED[encoding]
+        headers.append(('Content-Encoding', encoding.split('-')[-1]))
+    else:
+        body = DATA
+    headers.append(('Content-Length', str(len(body))))
+    start_response('200 OK', headers)
+    # send the body by small chunks
+    return [body[i:i + 1000] for i in range(0, len(body), 1000)]
+
+def test_001():
+    t.eq(parse_encodings(None), [])
+    t.eq(parse_encodings("identity"), [])
+    t.eq(parse_encodings("deflate, GZIP"), ["deflate", "gzip"])
+    assert ACCEPT_ENCODING.startswith("gzip, deflate")
+
+def test_002():
+    c = Client(transport=WSGITransport(app))
+    for encoding in ('gzip', 'deflate', 'raw-deflate'):
+        r = c.request("http://localhost/%s" % encoding)
+        t.eq(r['x-accept-encoding'], ACCEPT_ENCODING)
+        t.eq(r['content-encoding'], encoding.split('-')[-1])
+        t.eq(r.body_string(), DATA)
+
+def test_003():
+    c = Client(transport=WSGITransport(app))
+    r = c.request("http://localhost/gzip")
+    with r.body_stream() as body:
+        chunks = []
+        buf = bytearray(100)
+        while True:
+            n = body.readinto(buf)
+            if not n:
+                break
+            assert n <= 100
+            chunks.append(str(buf[:n]))
+    t.eq("".join(chunks), DATA)
+
+    r = c.request("http://localhost/gzip", headers={
+        "Accept-Encoding": "identity"})
+    t.eq(r['x-accept-encoding'], "identity")
+    assert 'content-encoding' not in r
+    t.eq(r.body_string(), DATA)
+
+def test_004():
+    c = Client(transport=WSGITransport(app), decompress=False)
+    r = c.request("http://localhost/gzip")
+    t.eq(r['x-accept-encoding'], "identity")
+    t.eq(r.body_string(), DATA)
+
+    r = c.request("http://localhost/gzip", headers={
+        "Accept-Encoding": "gzip"})
+    t.eq(r.body_string(), ENCODED['gzip'])
+
+def test_005():
+    # window is bounded: reading 10 bytes doesn't decompress everything
+    raw = io.BytesIO(ENCODED['gzip'])
+    reader = DecodingReader(raw, GzipDecoder(), chunk_size=len(DATA))
+    buf = bytearray(10)
+    t.eq(reader.readinto(buf), 10)
+    t.eq(str(buf), DATA[:10])
+    assert reader.decoder.pending()
+
+    body = decode_body(io.BytesIO(zlib.compress(ENCODED['gzip'])),
+            "gzip, deflate")
+    t.eq(body.read(), DATA)
+    t.eq(decode_body(io.BytesIO("abc"), "unknown").read(), "abc")
+
+def test_006():
+    proxy = HostProxy("http://localhost", transport=WSGITransport(app))
+    proxied = Client(transport=WSGITransport(proxy))
+    r = proxied.request("http://localhost/gzip", headers={
+        "Accept-Encoding": "gzip"})
+    t.eq(r['content-encoding'], "gzip")
+    t.eq(r.body_string(), DATA)
+
+    proxied.decompress = False
+    r = proxied.request("http://localhost/gzip", headers={
+        "Accept-Encoding": "gzip"})
+    t.eq(r['x-accept-encoding'], "gzip")
+    t.eq(r.body_string(), ENCODED['gzip'])
+
+    r = proxied.request("http://localhost/gzip")
+    t.eq(r['x-accept-encoding'], "identity")
+    t.eq(r.body_string(), DATA)
+
+def echo_app(environ, start_response):
+    body = environ['wsgi.input'].read()
+    if environ.get('HTTP_CONTENT_ENCODING') == 'gzip':
+        body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        start_response('200 OK', [('X-Compressed', 'true')])
+    else:
+        start_response('200 OK', [])
+    return [body]
+
+def test_007():
+    body = GzipBody(DATA, chunk_size=1000)
+    chunks = list(body)
+    assert all(chunks[:-1])
+    t.eq(zlib.decompress("".join(chunks), 16 + zlib.MAX_WBITS), DATA)
+    # retried requests iterate the body again
+    t.eq("".join(body), "".join(chunks))
+
+    body = GzipBody(iter(["a", u"é", "b"]))
+    t.eq(zlib.decompress("".join(body), 16 + zlib.MAX_WBITS), "aéb")
+    t.raises(RequestError, list, body)
+    # an iterator can't be rewound
+    t.raises(IOError, body.seek, 0)
+    req = Request("http://localhost", "POST", body=iter(["a"]))
+    req.compress_body()
+    t.raises(RequestError, req.maybe_rewind)
+    req = Request("http://localhost", "POST", body="a" * 2000)
+    req.compress_body()
+    req.maybe_rewind()
+
+    f = StringIO(DATA)
+    t.eq(zlib.decompress("".join(GzipBody(f)), 16 + zlib.MAX_WBITS), DATA)
+
+def test_008():
+    c = Client(transport=WSGITransport(echo_app), compress=True)
+    r = c.request("http://localhost/", "POST", body=DATA)
+    t.eq(r['x-compressed'], "true")
+    t.eq(r.body_string(), DATA)
+
+    # small bodies aren't compressed
+    r = c.request("http://localhost/", "POST", body="small")
+    assert 'x-compressed' not in r
+    t.eq(r.body_string(), "small")
+
+    r = c.request("http://localhost/", "POST", body=StringIO(DATA),
+            compress=False)
+    assert 'x-compressed' not in r
+    t.eq(r.body_string(), DATA)
+
+def test_009():
+    res = Resource("http://localhost", transport=WSGITransport(echo_app))
+    r = res.put(payload=StringIO(DATA), compress=True)
+    t.eq(r['x-compressed'], "true")
+    t.eq(r.body_string(), DATA)
+
+    r = res.post(payload=(line for line in DATA.splitlines(True)),
+            headers={'Transfer-Encoding': 'chunked'}, compress=True)
+    t.eq(r['x-compressed'], "true")
+    t.eq(r.body_string(), DATA)
+
+    form = MultipartForm({'a': 'b'}, "boundary", {})
+    r = res.post(payload=form, compress=True)
+    assert 'x-compressed' not in r
+    assert "boundary" in r.body_string()
+
+    res.client.compress_min_size = 0
+    form = MultipartForm({'a': 'b'}, "boundary", {})
+    r = res.post(payload=form, compress=True)
+    t.eq(r['x-compressed'], "true")
+    assert "boundary" in r.body_string()
+
+def test_010():
+    req = Request("http://localhost/", "POST", body=DATA)
+    assert req.compress_body(level=9)
+    t.eq(req.headers.iget('content-encoding'), 'gzip')
+    t.eq(req.headers.iget('content-length'), None)
+    assert req.is_chunked()
+    assert not req.compress_body()
+
+class UnlimitedDecoder(BufferedDecoder):
+
+    def __init__(self):
+        super(UnlimitedDecoder, self).__init__()
+        obj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._process = obj.decompress
+
+def test_011():
+    # decoders without output limit are fed small slices of input
+    zeros = "\0" * (10 * 1024 * 1024)
+    encoded = gzip_compress(zeros)
+    decoder = UnlimitedDecoder()
+    t.eq(len(decoder.decompress(encoded, 1000)), 1000)
+    assert decoder.pending()
+    assert len(decoder._out) < 100 * 1024
+
+    reader = DecodingReader(io.BytesIO(encoded), UnlimitedDecoder())
+    t.eq(io.BufferedReader(reader).read(), zeros)
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+from array import array
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+import t
+
+from restkit.client import Client
+from restkit.contrib.wsgi_transport import WSGITransport
+from restkit.errors import AlreadyRead
+from restkit import streaming
+from restkit.streaming import iter_batches, iter_json, iter_line_batches
+
+ROWS = [{"id": "doc%s" % i, "key": i, "value": {"rev": u"1-é%s" % i}}
+        for i in range(500)]
+DOC = json.dumps({"total_rows": 500, "offset": 0, "rows": ROWS,
+    "update_seq": 12345})
+
+closed = []
+
+def app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'application/json')])
+    return Body([DOC[i:i + 100] for i in range(0, len(DOC), 100)])
+
+class Body(list):
+    def close(self):
+        closed.append(True)
+
+def test_001():
+    for chunk_size in (1, 7, 1000, 100000):
+        t.eq(list(iter_json(StringIO(DOC), chunk_size=chunk_size)), ROWS)
+    t.eq(list(iter_json(StringIO(DOC), "update_seq", chunk_size=3)),
+            [12345])
+    t.eq(list(iter_json(StringIO(DOC), "missing.item")), [])
+    t.eq(list(iter_json(StringIO(" [1, 22 ,333 ] "), "item", 1)),
+            [1, 22, 333])
+    t.eq(list(iter_json(StringIO('{"rows": []}'))), [])
+    t.eq(list(iter_json(StringIO('{"a": {"b": [[1], [2]]}}'), "a.b.item")),
+            [[1], [2]])
+    t.raises(ValueError, list, iter_json(StringIO('{"rows": [1, 2')))
+
+    # values cut at the end of a block are completed
+    doc = '{"rows": [true, "%s", -Infinity, "\\u00e9"]}' % ("a" * 100)
+    for size in range(1, 20):
+        t.eq(list(iter_json(StringIO(doc), chunk_size=size)),
+                [True, "a" * 100, float("-inf"), u"\xe9"])
+
+    # an invalid document fails without being read until the end
+    f = StringIO('{"rows": [1, 2, x, ' + '3, ' * 100000 + '4]}')
+    t.raises(ValueError, list, iter_json(f, chunk_size=1024))
+    t.lt(f.tell(), 4096)
+    f = StringIO('{"rows": [{"a": x}, ' + '{"a": 3}, ' * 100000 + '4]}')
+    t.raises(ValueError, list, iter_json(f, chunk_size=1024))
+    t.lt(f.tell(), 4096)
+
+def test_002():
+    c = Client(transport=WSGITransport(app))
+    r = c.request("http://localhost/db/_all_docs")
+    del closed[:]
+    t.eq(list(r.iter_json(chunk_size=10)), ROWS)
+    t.eq(closed, [True])
+
+    r = c.request("http://localhost/db/_all_docs")
+    del closed[:]
+    rows = r.iter_json()
+    t.eq(rows.next(), ROWS[0])
+    t.eq(rows.next(), ROWS[1])
+    rows.close()
+    t.eq(closed, [True])
+    t.raises(AlreadyRead, r.body_string)
+
+NDJSON = "".join(['{"id": %s, "price": %s.5, "name": "n%s"}\n' % (i, i, i)
+    for i in range(1000)])
+CSV = "id,price,name\r\n" + "".join(["%s,%s.5,n%s\r\n" % (i, i, i)
+    for i in range(1000)])
+
+def batches_app(environ, start_response):
+    start_response('200 OK', [])
+    if environ['PATH_INFO'] == '/csv':
+        data = CSV
+    else:
+        data = NDJSON
+    return [data[i:i + 333] for i in range(0, len(data), 333)]
+
+def test_003():
+    lines = NDJSON.splitlines()
+    batches = list(iter_line_batches(StringIO(NDJSON), 300, 17))
+    t.eq([len(b) for b in batches], [300, 300, 300, 100])
+    t.eq(sum(batches, []), lines)
+    t.eq(list(iter_line_batches(StringIO("a\n\nb"), 10)), [["a", "b"]])
+    t.eq(list(iter_line_batches(StringIO("\nh\na\nb\nc"), 2, 3, True)),
+            [["h"], ["a", "b"], ["c"]])
+
+    batches = list(iter_batches(StringIO(NDJSON), batch_size=400,
+        block_size=100))
+    t.eq([len(b) for b in batches], [400, 400, 200])
+    t.eq(batches[1][0], {"id": 400, "price": 400.5, "name": "n400"})
+
+    batches = list(iter_batches(StringIO(NDJSON), columns=[("id", "l"),
+        ("price", "d"), ("name", None)]))
+    t.eq(len(batches), 1)
+    t.eq(batches[0]["id"], array("l", range(1000)))
+    t.eq(batches[0]["price"][10], 10.5)
+    t.eq(batches[0]["name"][:2], ["n0", "n1"])
+    t.raises(ValueError, list, iter_batches(StringIO(NDJSON), "xml"))
+
+def test_004():
+    batches = list(iter_batches(StringIO(CSV), "csv", batch_size=500,
+        block_size=64))
+    t.eq([len(b) for b in batches], [500, 500])
+    t.eq(batches[0][0], ["0", "0.5", "n0"])
+
+    batches = list(iter_batches(StringIO(CSV), "csv", batch_size=2000,
+        columns={"price": "d", 0: "i"}))
+    t.eq(batches[0]["price"], array("d", [i + .5 for i in range(1000)]))
+    t.eq(batches[0][0], array("i", range(1000)))
+
+    if streaming.numpy is not None:
+        batches = list(iter_batches(StringIO(CSV), "csv",
+            columns={"price": "d"}, use_numpy=True))
+        t.eq(batches[0]["price"].sum(), sum([i + .5 for i in range(1000)]))
+    else:
+        t.raises(ImportError, list, iter_batches(StringIO(CSV), "csv",
+            use_numpy=True))
+
+    batches = list(iter_batches(StringIO(CSV), "csv", header=False,
+        columns={0: None}))
+    t.eq(batches[0][0][:2], ["id", "0"])
+
+def test_005():
+    c = Client(transport=WSGITransport(batches_app))
+    r = c.request("http://localhost/ndjson")
+    ids = []
+    for batch in r.iter_batches(batch_size=128, columns={"id": "l"}):
+        ids.extend(batch["id"])
+    t.eq(ids, range(1000))
+
+    r = c.request("http://localhost/csv")
+    batches = r.iter_batches("csv", batch_size=100)
+    t.eq(len(batches.next()), 100)
+    batches.close()
+
+    # the body isn't claimed until the iteration starts
+    r = c.request("http://localhost/csv")
+    t.raises(ValueError, r.iter_batches, "xml")
+    batches = r.iter_batches("csv")
+    t.eq(r.can_read(), True)
+    batches.close()
+    t.eq(len(r.body_string()), len(CSV))
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+import BaseHTTPServer
+import SocketServer
+import socket
+import threading
+import time
+import urlparse
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+import t
+from restkit.errors import RequestError, RequestFailed
+from restkit.feed import Event, Feed
+
+HOST = "127.0.0.1"
+
+
+class FeedHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        query = dict(urlparse.parse_qsl(url.query))
+        if url.path not in ("/_changes", "/stall", "/sse"):
+            self.send_response(404)
+            self.end_headers()
+            self.wfile.write("not found")
+            return
+
+        self.send_response(200)
+        self.end_headers()
+        if url.path == "/sse":
+            last_id = int(self.headers.get("Last-Event-ID", 0))
+            self.wfile.write(": heartbeat\n\n")
+            for i in range(last_id + 1, last_id + 3):
+                self.wfile.write("id: %s\nevent: change\ndata: %s\n"
+                        "data: line2\n\n" % (i, i))
+            return
+
+        since = int(query.get("since", 0))
+        t.eq(query.get("heartbeat"), "100")
+        for seq in range(since + 1, since + 3):
+            self.wfile.write(json.dumps({"seq": seq}) + "\n\n")
+            self.wfile.flush()
+            if url.path == "/stall":
+                # stop sending anything after the first change
+                time.sleep(2)
+                return
+
+
+class FeedServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+server = None
+PORT = None
+
+def setup():
+    global server, PORT
+    server = FeedServer((HOST, 0), FeedHandler)
+    PORT = server.server_address[1]
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.setDaemon(True)
+    server_thread.start()
+
+def teardown():
+    server.shutdown()
+    server.server_close()
+
+def url(path):
+    return "http://%s:%s%s" % (HOST, PORT, path)
+
+def take(feed, n):
+    events = []
+    for event in feed:
+        events.append(event)
+        if len(events) == n:
+            break
+    feed.close()
+    return events
+
+def test_001():
+    feed = Feed(url("/_changes?feed=continuous"), heartbeat=0.1,
+            backoff=0.01)
+    t.eq(feed.timeout, 0.2)
+    t.eq([c["seq"] for c in take(feed, 5)], [1, 2, 3, 4, 5])
+    t.eq(feed.since, 5)
+
+    feed = Feed(url("/_changes"), since=10, heartbeat=0.1)
+    t.eq(take(feed, 1), [{"seq": 11}])
+
+def test_002():
+    feed = Feed(url("/stall"), heartbeat=0.1, backoff=0.01)
+    start = time.time()
+    t.eq([c["seq"] for c in take(feed, 3)], [1, 2, 3])
+    assert time.time() - start < 2
+
+def test_003():
+    feed = Feed(url("/sse"), format="sse", backoff=0.01)
+    events = take(feed, 3)
+    t.eq(events[0], Event("1", "change", "1\nline2"))
+    t.eq([e.id for e in events], ["1", "2", "3"])
+
+def test_004():
+    feed = Feed(url("/missing"), heartbeat=0.1)
+    t.raises(RequestFailed, list, feed)
+
+    s = socket.socket()
+    s.bind((HOST, 0))
+    port = s.getsockname()[1]
+    s.close()
+    feed = Feed("http://%s:%s/" % (HOST, port), max_retries=2,
+            backoff=0.01, max_tries=1)
+    t.raises(RequestError, list, feed)
+    t.raises(ValueError, Feed, url("/"), format="xml")
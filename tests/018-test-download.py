@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+import BaseHTTPServer
+import os
+import re
+import socket
+import SocketServer
+import tempfile
+import threading
+
+import t
+
+from restkit.client import Client
+from restkit.contrib.wsgi_transport import WSGITransport
+from restkit.download import split_ranges
+from restkit.errors import RequestFailed
+
+DATA = os.urandom(300000)
+ETAG = '"v1"'
+
+RANGE_RE = re.compile(r"bytes=(\d+)-(\d+)")
+
+class App(object):
+
+    def __init__(self, ranges=True, failures=0, etag=ETAG):
+        self.ranges = ranges
+        self.failures = failures
+        self.etag = etag
+        self.requests = []
+
+    def __call__(self, environ, start_response):
+        http_range = environ.get('HTTP_RANGE')
+        self.requests.append((environ['REQUEST_METHOD'], http_range))
+        headers = [('ETag', self.etag)]
+        if self.ranges:
+            headers.append(('Accept-Ranges', 'bytes'))
+
+        if_range = environ.get('HTTP_IF_RANGE')
+        if not self.ranges or http_range is None or \
+                (if_range is not None and if_range != self.etag):
+            headers.append(('Content-Length', str(len(DATA))))
+            start_response('200 OK', headers)
+            if environ['REQUEST_METHOD'] == 'HEAD':
+                return []
+            return [DATA]
+
+        start, end = map(int, RANGE_RE.match(http_range).groups())
+        headers.extend([('Content-Length', str(end - start + 1)),
+            ('Content-Range', "bytes %s-%s/%s" % (start, end, len(DATA)))])
+        start_response('206 Partial Content', headers)
+        return self.iter_part(start, end)
+
+    def iter_part(self, start, end):
+        yield DATA[start:start + 1000]
+        if self.failures > 0:
+            self.failures -= 1
+            raise socket.error("connection reset")
+        yield DATA[start + 1000:end + 1]
+
+def tmp_path():
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    return path
+
+def check_download(app, parts=4, **kwargs):
+    c = Client(transport=WSGITransport(app))
+    path = tmp_path()
+    try:
+        t.eq(c.download("http://localhost/file", path, parts=parts,
+            **kwargs), len(DATA))
+        with open(path, 'rb') as f:
+            t.eq(f.read() == DATA, True)
+    finally:
+        if os.path.exists(path):
+            os.unlink(path)
+
+def test_001():
+    t.eq(split_ranges(10, 3), [(0, 3), (4, 6), (7, 9)])
+    t.eq(split_ranges(2, 4), [(0, 0), (1, 1)])
+    t.eq(split_ranges(5, 1), [(0, 4)])
+
+def test_002():
+    app = App()
+    check_download(app, parts=4)
+    t.eq(app.requests[0], ('HEAD', None))
+    t.eq(sorted([r for m, r in app.requests[1:]]), ["bytes=0-74999",
+        "bytes=150000-224999", "bytes=225000-299999", "bytes=75000-149999"])
+
+def test_003():
+    app = App(failures=3)
+    check_download(app, parts=3)
+    # each failure is followed by a new request of the part
+    t.eq(len([m for m, r in app.requests if m == 'GET']), 6)
+
+    app = App(failures=10)
+    c = Client(transport=WSGITransport(app))
+    path = tmp_path()
+    t.raises(socket.error, c.download, "http://localhost/file", path,
+            parts=2, max_part_retries=1)
+    # the partial file is removed
+    t.eq(os.path.exists(path), False)
+
+def test_004():
+    app = App(ranges=False)
+    check_download(app, parts=4)
+    t.eq(app.requests, [('HEAD', None), ('GET', None)])
+
+    check_download(App(), parts=1)
+
+class ChangedApp(App):
+
+    def __call__(self, environ, start_response):
+        if environ['REQUEST_METHOD'] == 'GET':
+            # the entity changed after the HEAD request
+            self.etag = '"v2"'
+        return App.__call__(self, environ, start_response)
+
+def test_005():
+    t.raises(RequestFailed, check_download, ChangedApp())
+
+class NoHeadApp(App):
+
+    def __call__(self, environ, start_response):
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            self.requests.append(('HEAD', None))
+            start_response('405 Method Not Allowed', [('Allow', 'GET')])
+            return []
+        return App.__call__(self, environ, start_response)
+
+def test_006():
+    app = NoHeadApp()
+    check_download(app, parts=4)
+    t.eq(app.requests, [('HEAD', None), ('GET', None)])
+
+class TruncatingHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ serve DATA with ranges, the connection of the first response of a
+    part is closed after 1000 bytes of the part """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(len(DATA)))
+        self.send_header('ETag', ETAG)
+        self.end_headers()
+
+    def do_GET(self):
+        self.server.requests.append(self.headers['Range'])
+        start, end = map(int, RANGE_RE.match(self.headers['Range']).groups())
+        self.send_response(206)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Content-Range', "bytes %s-%s/%s" % (start, end,
+            len(DATA)))
+        self.send_header('ETag', ETAG)
+        self.end_headers()
+        if end in self.server.truncated:
+            self.wfile.write(DATA[start:end + 1])
+        else:
+            self.server.truncated.add(end)
+            self.wfile.write(DATA[start:start + 1000])
+            self.close_connection = 1
+
+    def log_message(self, format, *args):
+        pass
+
+class TruncatingServer(SocketServer.ThreadingMixIn,
+        BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+def test_007():
+    server = TruncatingServer(("127.0.0.1", 0), TruncatingHandler)
+    server.requests = []
+    server.truncated = set()
+    th = threading.Thread(target=server.serve_forever)
+    th.setDaemon(True)
+    th.start()
+    path = tmp_path()
+    try:
+        c = Client()
+        t.eq(c.download("http://127.0.0.1:%s/file" % server.server_port,
+            path, parts=2), len(DATA))
+        with open(path, 'rb') as f:
+            t.eq(f.read() == DATA, True)
+        # each part is resumed from the last byte received
+        t.eq(sorted(server.requests), ["bytes=0-149999", "bytes=1000-149999",
+            "bytes=150000-299999", "bytes=151000-299999"])
+    finally:
+        server.shutdown()
+        server.server_close()
+        os.unlink(path)
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+import gzip
+import os
+import re
+import socket
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+import t
+
+from restkit.client import Client
+from restkit.contrib.wsgi_transport import WSGITransport
+from restkit.errors import ResponseError
+
+DATA = os.urandom(100000)
+
+RANGE_RE = re.compile(r"bytes=(\d+)-")
+
+class App(object):
+    """ send `cut` bytes of the body then fail, `failures` times """
+
+    def __init__(self, data=DATA, failures=1, cut=30000, error=True,
+            etag='"v1"', encoding=None):
+        self.data = data
+        self.failures = failures
+        self.cut = cut
+        self.error = error
+        self.etag = etag
+        self.encoding = encoding
+        self.ranges = []
+
+    def __call__(self, environ, start_response):
+        data = self.data
+        headers = [('Accept-Ranges', 'bytes')]
+        if self.etag is not None:
+            headers.append(('ETag', self.etag))
+        if self.encoding is not None:
+            headers.append(('Content-Encoding', self.encoding))
+
+        http_range = environ.get('HTTP_RANGE')
+        self.ranges.append(http_range)
+        if http_range is not None and \
+                environ.get('HTTP_IF_RANGE') == self.etag:
+            start = int(RANGE_RE.match(http_range).group(1))
+            headers.append(('Content-Range', "bytes %s-%s/%s" % (start,
+                len(data) - 1, len(data))))
+            status = '206 Partial Content'
+        else:
+            start = 0
+            status = '200 OK'
+        headers.append(('Content-Length', str(len(data) - start)))
+        start_response(status, headers)
+        return self.iter_body(data[start:])
+
+    def iter_body(self, data):
+        if self.failures > 0:
+            self.failures -= 1
+            yield data[:self.cut]
+            if self.error:
+                raise socket.error("connection reset")
+            return
+        yield data
+
+def client(app):
+    return Client(transport=WSGITransport(app))
+
+def test_001():
+    app = App(failures=2)
+    r = client(app).request("http://localhost/")
+    with r.body_stream(resume=3) as body:
+        t.eq(body.read() == DATA, True)
+    t.eq(app.ranges, [None, "bytes=30000-", "bytes=60000-"])
+
+def test_002():
+    # body shorter than its Content-Length, without error
+    app = App(error=False)
+    r = client(app).request("http://localhost/")
+    with r.body_stream(resume=1) as body:
+        chunks = [chunk.tobytes() for chunk in body.iter_into()]
+    t.eq("".join(chunks) == DATA, True)
+
+def test_003():
+    app = App(failures=3)
+    r = client(app).request("http://localhost/")
+    body = r.body_stream(resume=2)
+    t.raises(socket.error, body.read)
+
+    app = App()
+    r = client(app).request("http://localhost/")
+    t.raises(socket.error, r.body_stream().read)
+
+    app = App(etag=None)
+    r = client(app).request("http://localhost/")
+    t.raises(socket.error, r.body_stream(resume=3).read)
+
+def test_004():
+    app = App()
+    r = client(app).request("http://localhost/")
+    body = r.body_stream(resume=3)
+    app.etag = '"v2"'
+    t.raises(ResponseError, body.read)
+
+def test_005():
+    buf = StringIO()
+    f = gzip.GzipFile(fileobj=buf, mode="wb")
+    f.write(DATA)
+    f.close()
+    app = App(data=buf.getvalue(), encoding="gzip")
+    r = client(app).request("http://localhost/")
+    with r.body_stream(resume=1) as body:
+        t.eq(body.read() == DATA, True)
+    t.eq(app.ranges, [None, "bytes=30000-"])
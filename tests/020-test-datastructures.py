@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+import t
+
+from restkit.datastructures import HeaderDict, MultiDict
+from restkit.wrappers import Request
+
+def test_001():
+    h = HeaderDict([('Host', 'a'), ('Set-Cookie', 'x'), ('Set-Cookie', 'y')])
+    t.eq(len(h), 3)
+    t.eq(h['Host'], 'a')
+    t.raises(KeyError, h.__getitem__, 'host')
+    assert 'Host' in h
+    assert 'host' not in h
+    t.eq(h.iget('HOST'), 'a')
+    t.eq(h.iget('missing'), None)
+    t.eq(h.getall('Set-Cookie'), ['x', 'y'])
+    t.eq(h.igetall('set-cookie'), ['x', 'y'])
+    t.raises(KeyError, h.getone, 'Set-Cookie')
+    t.eq(h.getone('Host'), 'a')
+
+def test_002():
+    h = HeaderDict([('Host', 'a'), ('Accept', 'b')])
+    h['Host'] = 'c'
+    # replaced in place
+    t.eq(h.items(), [('Host', 'c'), ('Accept', 'b')])
+    h.add('x-a', '1')
+    h.add('X-A', '2')
+    t.eq(h.igetall('x-A'), ['1', '2'])
+    t.eq(h.ipop('X-a'), '1')
+    t.eq(h.igetall('x-a'), ['2'])
+    del h['Host']
+    t.eq(h.iget('host'), None)
+    t.eq(h.keys(), ['Accept', 'X-A'])
+    t.eq(h.ipop('missing', None), None)
+    t.raises(KeyError, h.pop, 'missing')
+    t.eq(h.setdefault('Accept', 'z'), 'b')
+    t.eq(h.setdefault('Range', 'bytes=0-'), 'bytes=0-')
+    t.eq(h.popitem(), ('Range', 'bytes=0-'))
+    t.eq(h.iget('range'), None)
+
+def test_003():
+    h = HeaderDict({'a': '1'}, b='2')
+    h.update({'a': '3'})
+    h.extend([('c', '4')])
+    t.eq(h, {'a': '3', 'b': '2', 'c': '4'})
+    c = h.copy()
+    c['a'] = '5'
+    t.eq(h['a'], '3')
+    t.eq(HeaderDict(MultiDict([('a', '1')])).items(), [('a', '1')])
+    t.eq(h.mixed(), {'a': '3', 'b': '2', 'c': '4'})
+    assert not hasattr(h, '__dict__')
+
+def test_004():
+    req = Request("http://localhost", headers={'Content-Type': 'text/plain'})
+    assert isinstance(req.headers, HeaderDict)
+    t.eq(req.headers.iget('content-type'), 'text/plain')
+    headers = [('Accept', '*/*')]
+    req.headers = headers
+    req.headers['Accept'] = 'text/html'
+    t.eq(headers, [('Accept', '*/*')])
+
+def test_005():
+    h = HeaderDict([('A', '1'), ('b', '2'), ('a', '3'), ('C', '4'),
+        ('B', '5'), ('d', '6')])
+    t.eq(h.iget('a'), '1')
+    index = h._index
+    t.eq(h.ipop('b'), '2')
+    del h['a']
+    t.eq(h.pop('C'), '4')
+    # the index is updated, not rebuilt
+    assert h._index is index
+    t.eq(h.items(), [('A', '1'), ('B', '5'), ('d', '6')])
+    t.eq(h._index, {'a': [0], 'b': [1], 'd': [2]})
+    t.eq(h.iget('d'), '6')
+    t.eq(h.igetall('B'), ['5'])
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+import t
+
+from restkit.uritemplate import URITemplate
+
+VALUES = {
+    "var": "value",
+    "hello": "Hello World!",
+    "path": "/foo/bar",
+    "empty": "",
+    "x": "1024",
+    "y": "768",
+    "list": ["red", "green", "blue"],
+    "unicode": u"é"
+}
+
+def test_001():
+    for template, expected in [
+            ("{var}", "value"),
+            ("{hello}", "Hello%20World%21"),
+            ("{unicode}", "%C3%A9"),
+            ("{+hello}", "Hello%20World!"),
+            ("{+path}/here", "/foo/bar/here"),
+            ("{#path,x}/here", "#/foo/bar,1024/here"),
+            ("X{.var}", "X.value"),
+            ("{/var,x}/here", "/value/1024/here"),
+            ("{;x,y,empty}", ";x=1024;y=768;empty"),
+            ("{?x,y,empty}", "?x=1024&y=768&empty="),
+            ("?fixed=yes{&x}", "?fixed=yes&x=1024"),
+            ("{x,hello,y}", "1024,Hello%20World%21,768"),
+            ("/a{?undef}", "/a"),
+            ("{list}", "red,green,blue")]:
+        t.eq(URITemplate(template).expand(VALUES), expected)
+
+def test_002():
+    tpl = URITemplate("/{db}/{docid}{?rev,x}")
+    t.eq(tpl.variables, ["db", "docid", "rev", "x"])
+    t.eq(tpl.parts[0], "/")
+    t.eq(tpl.route, "/{db}/{docid}{?rev,x}")
+    for invalid in ("{", "a}b", "{a b}", "{=x}", "{x*}"):
+        t.raises(ValueError, URITemplate, invalid)
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+import io
+from StringIO import StringIO
+
+import t
+
+from restkit.buffers import readall
+
+def test_001():
+    data = "x" * 100000
+    t.eq(readall(StringIO(data), len(data)), data)
+    # longer than announced
+    t.eq(readall(StringIO(data), 10), data)
+
+    body = io.BufferedReader(io.BytesIO(data))
+    buf = readall(body, size_hint=10)
+    t.eq(type(buf), str)
+    t.eq(buf, data)
+    t.eq(readall(io.BytesIO("")), "")